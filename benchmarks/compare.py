@@ -0,0 +1,37 @@
+import argparse
+import json
+
+
+def main():
+    """
+    Compare two benchmark result files
+    Usage: python -m benchmarks.compare old.json new.json
+    """
+    parser = argparse.ArgumentParser(description="Compare benchmark results")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old['commit']} -> {new['commit']}")
+    print(
+        f"{'benchmark':<16} {'p50 old':>10} {'p50 new':>10} {'change':>8} "
+        f"{'p99 old':>10} {'p99 new':>10} {'change':>8}"
+    )
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None or "p50_ms" not in result or "p50_ms" not in before:
+            continue
+        row = [f"{name:<16}"]
+        for key in ("p50_ms", "p99_ms"):
+            change = (result[key] / before[key] - 1) * 100 if before[key] else 0.0
+            row.append(f"{before[key]:>10.3f} {result[key]:>10.3f} {change:>+7.1f}%")
+        print(" ".join(row))
+
+
+if __name__ == "__main__":
+    main()
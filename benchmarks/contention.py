@@ -0,0 +1,192 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from .run import REPO_ROOT, git_commit, percentile
+
+AMOUNT = 0.0001
+
+
+def _init_worker(data_dir: str):
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_ROOT)
+
+
+def _trade_worker(args: tuple[int, int]) -> dict:
+    """
+    Buy currency many times for one user in separate process
+    :param args: (number of generated user, number of trades)
+    :return: latencies and errors
+    """
+    user, trades = args
+    import io
+    from contextlib import redirect_stdout
+
+    from valutrade_hub.cli.interface import HANDLED_ERRORS
+    from valutrade_hub.core import usecases
+
+    latencies, errors = [], []
+    with redirect_stdout(io.StringIO()):
+        usecases.set_session_user_id(None)
+        usecases.login(username=f"user{user}", password="benchmark")
+        for _ in range(trades):
+            start = time.perf_counter_ns()
+            try:
+                usecases.buy(currency="BTC", amount=AMOUNT)
+            except HANDLED_ERRORS as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            latencies.append(time.perf_counter_ns() - start)
+    return {"latencies": latencies, "errors": errors}
+
+
+def _rates_worker(args: tuple[int, int]) -> dict:
+    """
+    Save distinct pairs to rates.json many times in separate process
+    :param args: (worker number, number of saves)
+    :return: latencies and errors
+    """
+    worker, saves = args
+    from valutrade_hub.parser_service.storage import save_rates
+
+    latencies = []
+    for i in range(saves):
+        updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rates = {f"W{worker:03d}N{i:05d}_USD": {"rate": 1.0, "updated_at": updated_at, "source": "exchange_rates"}}
+        start = time.perf_counter_ns()
+        save_rates(rates, {})
+        latencies.append(time.perf_counter_ns() - start)
+    return {"latencies": latencies, "errors": []}
+
+
+def _btc_balances(data_dir: str, users: list[int]) -> dict[int, float]:
+    connection = sqlite3.connect(os.path.join(data_dir, "data", "valutrade.db"))
+    try:
+        return {
+            user: (connection.execute(
+                "SELECT balance FROM wallets WHERE user_id = ? AND currency_code = 'BTC'", (user,)
+            ).fetchone() or (0.0,))[0]
+            for user in users
+        }
+    finally:
+        connection.close()
+
+
+def _summary(name: str, results: list[dict], elapsed: float) -> dict:
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    errors = [error for result in results for error in result["errors"]]
+    return {
+        "name": name,
+        "operations": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_ops": len(latencies) / elapsed if elapsed else None,
+        "wall_s": elapsed,
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p95_ms": percentile(latencies, 95) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+        "max_ms": latencies[-1] / 1e6 if latencies else 0,
+    }
+
+
+def run_trades(pool, data_dir: str, processes: int, trades: int, same_user: bool) -> dict:
+    """
+    Concurrent buys from many processes, checks that no trade is lost
+    :param pool: process pool
+    :param data_dir: data directory
+    :param processes: number of processes
+    :param trades: trades per process
+    :param same_user: all processes trade for user1 if True, every process for its own user otherwise
+    :return: result
+    """
+    users = [1 if same_user else i + 1 for i in range(processes)]
+    before = _btc_balances(data_dir, sorted(set(users)))
+    started = time.perf_counter()
+    results = pool.map(_trade_worker, [(user, trades) for user in users], chunksize=1)
+    elapsed = time.perf_counter() - started
+    after = _btc_balances(data_dir, sorted(set(users)))
+
+    succeeded = {user: 0 for user in before}
+    for user, result in zip(users, results):
+        succeeded[user] += trades - len(result["errors"])
+    lost = sum(
+        round((before[user] + succeeded[user] * AMOUNT - after[user]) / AMOUNT) for user in before
+    )
+    summary = _summary("trades_same_user" if same_user else "trades_own_user", results, elapsed)
+    summary["lost_updates"] = lost
+    return summary
+
+
+def run_rates(pool, data_dir: str, processes: int, saves: int) -> dict:
+    """
+    Concurrent saves of rates from many processes, checks that no pair is lost
+    :param pool: process pool
+    :param data_dir: data directory
+    :param processes: number of processes
+    :param saves: saves per process
+    :return: result
+    """
+    started = time.perf_counter()
+    results = pool.map(_rates_worker, [(worker, saves) for worker in range(processes)], chunksize=1)
+    elapsed = time.perf_counter() - started
+    with open(os.path.join(data_dir, "data", "rates.json")) as f:
+        pairs = json.load(f)["pairs"]
+    expected = {f"W{worker:03d}N{i:05d}_USD" for worker in range(processes) for i in range(saves)}
+    summary = _summary("save_rates", results, elapsed)
+    summary["lost_updates"] = len(expected - set(pairs))
+    return summary
+
+
+def main():
+    """
+    Run concurrent writers in separate processes and check that no update is lost
+    Usage: python -m benchmarks.contention --data /tmp/bench --processes 8 --trades 200
+    Run it on a copy of generated data: rates.json gets synthetic pairs
+    """
+    parser = argparse.ArgumentParser(description="Benchmark concurrent writers")
+    parser.add_argument("--data", required=True, help="directory made by benchmarks.generate")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=200, help="buys per process")
+    parser.add_argument("--saves", type=int, default=20, help="rates saves per process")
+    parser.add_argument("--output", help="path to save results as JSON")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    with multiprocessing.get_context("spawn").Pool(args.processes, _init_worker, (data_dir,)) as pool:
+        results = {}
+        for same_user in (False, True):
+            result = run_trades(pool, data_dir, args.processes, args.trades, same_user)
+            results[result["name"]] = result
+        results["save_rates"] = run_rates(pool, data_dir, args.processes, args.saves)
+
+    print(f"{'benchmark':<18} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7} {'lost':>5}")
+    for name, result in results.items():
+        print(
+            f"{name:<18} {result['throughput_ops']:>10.1f} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+            f"{result['errors']:>7} {result['lost_updates']:>5}"
+        )
+        if result["first_error"]:
+            print(f"  first error: {result['first_error']}")
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "processes": args.processes,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+    if any(result["lost_updates"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
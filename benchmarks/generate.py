@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from hashlib import sha256
+
+FIAT = {"USD": 1.0, "EUR": 1.08, "RUB": 0.011, "CZK": 0.044}
+CRYPTO = {"BTC": 60000.0, "ETH": 3000.0, "XMR": 150.0}
+CRYPTO_ID_MAP = {"BTC": "bitcoin", "ETH": "ethereum", "XMR": "monero"}
+PASSWORD = "benchmark"
+
+
+def make_rates(extra_currencies: int, now: datetime) -> dict:
+    """
+    Make rates.json content: configured currencies plus synthetic crypto currencies
+    :param extra_currencies: number of synthetic currencies
+    :param now: time of rates
+    :return: rates.json content
+    """
+    updated_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    pairs = {}
+    for code, rate in FIAT.items():
+        pairs[f"{code}_USD"] = {"rate": rate, "updated_at": updated_at, "source": "exchange_rates"}
+    for code, rate in CRYPTO.items():
+        pairs[f"{code}_USD"] = {"rate": rate, "updated_at": updated_at, "source": "coin_gecko"}
+    for i in range(extra_currencies):
+        pairs[f"X{i:04d}_USD"] = {
+            "rate": round(random.lognormvariate(0, 3), 6),
+            "updated_at": updated_at,
+            "source": "coin_gecko",
+        }
+    return {"pairs": pairs, "last_refresh": updated_at}
+
+
+def write_json_array(path: str, items):
+    """
+    Stream items into json array without building it in memory
+    :param path: path to file
+    :param items: iterable of json-serializable items
+    :return: None
+    """
+    with open(path, "w") as f:
+        f.write("[\n")
+        first = True
+        for item in items:
+            if not first:
+                f.write(",\n")
+            json.dump(item, f)
+            first = False
+        f.write("\n]\n")
+
+
+def iter_users(count: int):
+    for user_id in range(1, count + 1):
+        salt = f"salt{user_id:07d}"
+        yield {
+            "user_id": user_id,
+            "username": f"user{user_id}",
+            "registration_date": "2026-01-01 00:00:00",
+            "salt": salt,
+            "hashed_password": sha256((PASSWORD + salt).encode("utf-8")).hexdigest(),
+        }
+
+
+def iter_portfolios(count: int, codes: list[str]):
+    others = [code for code in codes if code != "USD"]
+    for user_id in range(1, count + 1):
+        wallets = {"USD": {"currency_code": "USD", "balance": round(random.uniform(1000, 100000), 2)}}
+        for code in random.sample(others, k=min(len(others), random.randint(0, 3))):
+            wallets[code] = {"currency_code": code, "balance": round(random.uniform(0, 10), 6)}
+        yield {"user_id": user_id, "wallets": wallets}
+
+
+def iter_history(rows: int, rates: dict, now: datetime):
+    """
+    Make history ticks going back from now, one tick per pair per minute
+    :param rows: number of records
+    :param rates: rates.json content
+    :param now: time of the last tick
+    :return: iterator of history records
+    """
+    pairs = list(rates["pairs"].items())
+    ticks = rows // len(pairs) + 1
+    start = now - timedelta(minutes=ticks)
+    produced = 0
+    for tick in range(ticks):
+        timestamp = (start + timedelta(minutes=tick)).strftime("%Y-%m-%d %H:%M:%S")
+        for pair, value in pairs:
+            if produced >= rows:
+                return
+            code = pair.split("_")[0]
+            yield {
+                "id": f"{pair}_{value['source']}",
+                "from_currency": code,
+                "to_currency": "USD",
+                "rate": value["rate"] * random.uniform(0.95, 1.05),
+                "timestamp": timestamp,
+                "source": value["source"],
+                "meta": {"raw_id": CRYPTO_ID_MAP.get(code, code), "request_ms": 100.0},
+            }
+            produced += 1
+
+
+def generate(out: str, users: int, history: int, extra_currencies: int, history_format: str, seed: int):
+    """
+    Write benchmark data directory
+    :param out: output directory, data/ and logs/ are created inside
+    :param users: number of users
+    :param history: number of history records
+    :param extra_currencies: number of synthetic currencies
+    :param history_format: legacy (exchange_rates.json array) or segments (history store)
+    :param seed: random seed
+    :return: None
+    """
+    random.seed(seed)
+    now = datetime.now()
+    data_path = os.path.join(out, "data")
+    os.makedirs(data_path, exist_ok=True)
+    os.makedirs(os.path.join(out, "logs"), exist_ok=True)
+
+    config = {
+        "data_path": "data/",
+        "rates_ttl_seconds": 3600,
+        "default_base_currency": "USD",
+        "log_path": "logs/",
+        "log_format": "json",
+        "log_level": "INFO",
+        "log_rotation_size": 10 * 1024 * 1024,
+        "mask_keywords": ["password", "salt", "hash"],
+        "coingecko_api_key": "benchmark",
+        "exchangerates_api_key": "benchmark",
+    }
+    with open(os.path.join(data_path, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+
+    rates = make_rates(extra_currencies, now)
+    with open(os.path.join(data_path, "rates.json"), "w") as f:
+        json.dump(rates, f, indent=2)
+    from valutrade_hub.infra.rate_table import RateTable
+
+    RateTable.publish(
+        os.path.join(data_path, "rates.bin"),
+        rates["pairs"],
+        rates["last_refresh"],
+        "USD",
+        os.path.join(data_path, "rates.json"),
+    )
+
+    codes = [pair.split("_")[0] for pair in rates["pairs"]][: len(FIAT) + len(CRYPTO)]
+    write_json_array(os.path.join(data_path, "users.json"), iter_users(users))
+    write_json_array(os.path.join(data_path, "portfolios.json"), iter_portfolios(users, codes))
+
+    if history_format == "legacy":
+        write_json_array(os.path.join(data_path, "exchange_rates.json"), iter_history(history, rates, now))
+        return
+
+    cwd = os.getcwd()
+    os.chdir(out)
+    try:
+        from valutrade_hub.parser_service.history import get_history_store
+
+        store = get_history_store(migrate=False)
+        chunk = []
+        for record in iter_history(history, rates, now):
+            chunk.append(record)
+            if len(chunk) >= 100000:
+                store.append(chunk)
+                chunk = []
+        store.append(chunk)
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    """
+    Generate benchmark data
+    Usage: python -m benchmarks.generate --out /tmp/bench --users 100000 --history 1000000
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic data for benchmarks")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=10000, help="number of history records")
+    parser.add_argument("--extra-currencies", type=int, default=0, help="synthetic currencies in rates.json")
+    parser.add_argument("--history-format", choices=["legacy", "segments"], default="segments")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.out, args.users, args.history, args.extra_currencies, args.history_format, args.seed)
+    print(f"Data written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
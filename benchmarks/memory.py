@@ -0,0 +1,149 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from .run import REPO_ROOT, git_commit, peak_rss_kb
+
+CODES = ["USD", "EUR", "RUB", "CZK", "BTC", "ETH", "XMR"]
+
+
+def build_portfolios(wallets: int, per_portfolio: int) -> dict:
+    """
+    Build portfolios in memory and measure allocated memory
+    :param wallets: total number of wallets
+    :param per_portfolio: wallets in one portfolio
+    :return: result
+    """
+    from valutrade_hub.core.models import Portfolio, Wallet
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    portfolios = []
+    for user_id in range(wallets // per_portfolio):
+        portfolios.append(
+            Portfolio(user_id, {code: Wallet(code, float(user_id)) for code in CODES[:per_portfolio]})
+        )
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(portfolios) * per_portfolio
+    return {
+        "name": "build_portfolios",
+        "wallets": count,
+        "wall_s": elapsed,
+        "allocated_mb": current / 2**20,
+        "peak_mb": peak / 2**20,
+        "bytes_per_wallet": current / count if count else 0,
+        "portfolios": portfolios,
+    }
+
+
+def access_wallets(portfolios: list, iterations: int) -> dict:
+    """
+    Membership test and iteration over wallets, as buy/sell and show_portfolio do
+    :param portfolios: portfolios
+    :param iterations: number of accesses
+    :return: result
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    total = 0.0
+    for i in range(iterations):
+        portfolio = portfolios[i % len(portfolios)]
+        if "BTC" in portfolio.wallets:
+            total += portfolio.get_wallet("BTC").balance
+        for wallet in portfolio.wallets.values():
+            total += wallet.balance
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "name": "access_wallets",
+        "iterations": iterations,
+        "wall_s": elapsed,
+        "ns_per_access": elapsed * 1e9 / iterations if iterations else 0,
+        "peak_kb": peak / 1024,
+    }
+
+
+def load_portfolios(data_dir: str) -> dict:
+    """
+    Load all portfolios from database made by benchmarks.generate
+    :param data_dir: data directory
+    :return: result
+    """
+    os.chdir(data_dir)
+    from valutrade_hub.core.repositories import portfolio_repository
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    portfolios = list(portfolio_repository.all())
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = sum(len(portfolio.wallets) for portfolio in portfolios)
+    return {
+        "name": "load_portfolios",
+        "wallets": count,
+        "wall_s": elapsed,
+        "allocated_mb": current / 2**20,
+        "peak_mb": peak / 2**20,
+        "bytes_per_wallet": current / count if count else 0,
+    }
+
+
+def main():
+    """
+    Measure memory used by model layer
+    Usage: python -m benchmarks.memory --wallets 1000000 [--data /tmp/bench]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark memory of models")
+    parser.add_argument("--wallets", type=int, default=1000000, help="number of wallets built in memory")
+    parser.add_argument("--per-portfolio", type=int, default=4, choices=range(1, len(CODES) + 1))
+    parser.add_argument("--accesses", type=int, default=1000000)
+    parser.add_argument("--data", help="also load all portfolios from directory made by benchmarks.generate")
+    parser.add_argument("--output", help="path to save results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    output = os.path.abspath(args.output) if args.output else None
+    built = build_portfolios(args.wallets, args.per_portfolio)
+    portfolios = built.pop("portfolios")
+    results = {"build_portfolios": built, "access_wallets": access_wallets(portfolios, args.accesses)}
+    del portfolios
+    if args.data:
+        results["load_portfolios"] = load_portfolios(os.path.abspath(args.data))
+
+    for name, result in results.items():
+        details = ", ".join(
+            f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in result.items()
+            if key != "name"
+        )
+        print(f"{name:<18} {details}")
+    print(f"peak rss {peak_rss_kb() / 1024:.1f} MB")
+
+    if output:
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "results": results,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
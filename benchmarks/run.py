@@ -0,0 +1,235 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from time import perf_counter_ns
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: list[int], q: float) -> int:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(len(sorted_values) * q / 100) - 1))]
+
+
+def measure(name: str, func, iterations: int, setup=None) -> dict:
+    """
+    Run func iterations times and collect latency percentiles
+    Output of func is discarded
+    :param name: benchmark name
+    :param func: function of iteration number
+    :param iterations: number of iterations
+    :param setup: function of iteration number called before func, not measured
+    :return: result
+    """
+    latencies = []
+    sink = io.StringIO()
+    started = time.perf_counter()
+    with redirect_stdout(sink):
+        for i in range(iterations):
+            if setup is not None:
+                setup(i)
+            start = perf_counter_ns()
+            func(i)
+            latencies.append(perf_counter_ns() - start)
+            sink.seek(0)
+            sink.truncate()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    measured = sum(latencies) / 1e9
+    return {
+        "name": name,
+        "iterations": iterations,
+        "throughput_ops": iterations / measured if measured else None,
+        "wall_s": elapsed,
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p95_ms": percentile(latencies, 95) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+        "max_ms": latencies[-1] / 1e6 if latencies else 0,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def peak_rss_kb() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def make_stub_updater(latency_s: float):
+    """
+    Make RatesUpdater with clients that return fixed rates without network
+    :param latency_s: simulated request latency
+    :return: rates updater
+    """
+    from valutrade_hub.parser_service.api_clients import BaseApiClient
+    from valutrade_hub.parser_service.config import ParserConfig
+    from valutrade_hub.parser_service.updater import RatesUpdater
+
+    config = ParserConfig()
+
+    class StubClient(BaseApiClient):
+        def __init__(self, rates: dict):
+            super().__init__()
+            self.rates = rates
+            self.currencies = [pair.split("_")[0] for pair in rates]
+
+        def fetch_rates(self, codes=None) -> dict:
+            time.sleep(latency_s)
+            return dict(self.rates)
+
+    updater = RatesUpdater()
+    updater.coingecko_client = StubClient({f"{code}_USD": 100.0 + i for i, code in enumerate(config.CRYPTO_CURRENCIES)})
+    updater.exchangerates_client = StubClient({f"{code}_USD": 1.0 + i for i, code in enumerate(config.FIAT_CURRENCIES)})
+    updater.sources = {
+        "coin_gecko": ("CoinGecko", updater.coingecko_client),
+        "exchange_rates": ("ExchangeratesAPI", updater.exchangerates_client),
+    }
+    return updater
+
+
+def make_http_updater(stub):
+    """
+    Make RatesUpdater with real clients pointed to local stub server
+    :param stub: running StubServer
+    :return: rates updater
+    """
+    from valutrade_hub.parser_service.updater import RatesUpdater
+
+    updater = RatesUpdater()
+    updater.coingecko_client.api_url = stub.coingecko_api_url
+    updater.exchangerates_client.api_url = stub.exchangerates_api_url
+    return updater
+
+
+def run(data_dir: str, iterations: int, only: list[str], stub_latency: float, stub_server: str = None) -> dict:
+    """
+    Run benchmarks of core use cases against generated data directory
+    :param data_dir: directory made by benchmarks.generate
+    :param iterations: iterations per benchmark
+    :param only: names of benchmarks to run, all if empty
+    :param stub_latency: simulated latency of stubbed API clients in seconds
+    :param stub_server: latency spec of local stub HTTP server, run_update_http is skipped if None
+    :return: results
+    """
+    os.chdir(data_dir)
+    from valutrade_hub.core import usecases
+    from valutrade_hub.core.utils import get_portfolio, get_user_by_username
+    from valutrade_hub.infra.database import get_connection
+
+    results = {}
+
+    setup_start = time.perf_counter()
+    get_user_by_username("user1")
+    get_portfolio(1)
+    usecases.get_snapshot()
+    results["setup"] = {"name": "setup", "wall_s": time.perf_counter() - setup_start, "peak_rss_kb": peak_rss_kb()}
+
+    users = get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    run_id = int(time.time())
+
+    def login_as(i):
+        usecases.set_session_user_id(None)
+        usecases.login(username=f"user{i % max(users, 1) + 1}", password="benchmark")
+
+    benchmarks = {
+        "register": (lambda i: usecases.register(username=f"bench{run_id}_{i}", password="benchmark"), None),
+        "login": (login_as, None),
+        "buy": (lambda i: usecases.buy(currency="BTC", amount=0.0001), lambda i: login_as(i)),
+        "sell": (lambda i: usecases.sell(currency="BTC", amount=0.0001), lambda i: login_as(i)),
+        "show_portfolio": (lambda i: usecases.show_portfolio(None), lambda i: login_as(i)),
+        "show_rates_top": (lambda i: usecases.show_rates(None, 10, "EUR"), None),
+        "get_rate": (lambda i: usecases.get_rate("BTC", "EUR"), None),
+    }
+
+    for name, (func, setup) in benchmarks.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(name, func, iterations, setup)
+
+    if not only or "run_update" in only:
+        updater = make_stub_updater(stub_latency)
+        results["run_update"] = measure(
+            "run_update", lambda i: updater.run_update(verbose=False, force=True), max(1, iterations // 10)
+        )
+
+    if not only or "leaderboard" in only:
+        results["leaderboard"] = measure(
+            "leaderboard", lambda i: usecases.leaderboard(10, "USD"), max(1, iterations // 100)
+        )
+
+    if stub_server is not None and (not only or "run_update_http" in only):
+        from valutrade_hub.parser_service.stub_server import StubServer
+
+        stub = StubServer(latency=stub_server).start()
+        try:
+            updater = make_http_updater(stub)
+            results["run_update_http"] = measure(
+                "run_update_http", lambda i: updater.run_update(verbose=False, force=True), max(1, iterations // 10)
+            )
+        finally:
+            stub.stop()
+    return results
+
+
+def main():
+    """
+    Run benchmarks and save results as JSON
+    Usage: python -m benchmarks.run --data /tmp/bench --output results.json
+    """
+    parser = argparse.ArgumentParser(description="Benchmark core use cases")
+    parser.add_argument("--data", required=True, help="directory made by benchmarks.generate")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--only", nargs="*", default=[], help="benchmarks to run")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="latency of stubbed API clients, seconds")
+    parser.add_argument(
+        "--stub-server", metavar="LATENCY", help="also benchmark updater over HTTP against local stub, e.g. fixed:20"
+    )
+    parser.add_argument("--output", help="path to save results as JSON")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    results = run(os.path.abspath(args.data), args.iterations, args.only, args.stub_latency, args.stub_server)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "data": os.path.abspath(args.data),
+        "iterations": args.iterations,
+        "results": results,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+    print(f"{'benchmark':<16} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'rss MB':>8}")
+    for name, result in results.items():
+        if "p50_ms" not in result:
+            print(f"{name:<16} {'':>10} {result['wall_s'] * 1000:>10.1f} ms total {result['peak_rss_kb'] / 1024:>8.1f}")
+            continue
+        print(
+            f"{name:<16} {result['throughput_ops']:>10.1f} {result['p50_ms']:>10.3f} "
+            f"{result['p95_ms']:>10.3f} {result['p99_ms']:>10.3f} {result['peak_rss_kb'] / 1024:>8.1f}"
+        )
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
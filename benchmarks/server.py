@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from .run import REPO_ROOT, git_commit, percentile
+
+SCENARIO = [
+    "show_portfolio",
+    "buy --currency BTC --amount 0.0001",
+    "get_rate --from_cur BTC --to_cur EUR",
+    "sell --currency BTC --amount 0.0001",
+    "show_rates --top 3",
+]
+
+
+async def client(host: str, port: int, user: int, requests: int, latencies: list[int], errors: list[dict]):
+    """
+    One client session: login and run scenario commands in a loop
+    :param host: server host
+    :param port: server port
+    :param user: number of generated user
+    :param requests: number of commands after login
+    :param latencies: list to add latencies to, nanoseconds
+    :param errors: list to add failed results to
+    :return: None
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send(cmd: str) -> dict:
+        start = time.perf_counter_ns()
+        writer.write((cmd + "\n").encode("utf-8"))
+        await writer.drain()
+        result = json.loads(await reader.readline())
+        latencies.append(time.perf_counter_ns() - start)
+        if not result["ok"]:
+            errors.append(result)
+        return result
+
+    await send(f"login --username user{user} --password benchmark")
+    for i in range(requests):
+        await send(SCENARIO[i % len(SCENARIO)])
+    writer.write(b"exit\n")
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def load(host: str, port: int, clients: int, users: int, requests: int) -> dict:
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, port, i % users + 1, requests, latencies, errors) for i in range(clients))
+    )
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "name": "server",
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_ops": len(latencies) / elapsed,
+        "wall_s": elapsed,
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p95_ms": percentile(latencies, 95) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+        "max_ms": latencies[-1] / 1e6 if latencies else 0,
+    }
+
+
+def main():
+    """
+    Run server against generated data and load it with concurrent client sessions
+    Usage: python -m benchmarks.server --data /tmp/bench --clients 200 --requests 50
+    """
+    parser = argparse.ArgumentParser(description="Benchmark multi-session server")
+    parser.add_argument("--data", required=True, help="directory made by benchmarks.generate")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--users", type=int, default=100, help="number of distinct generated users to log in as")
+    parser.add_argument("--requests", type=int, default=50, help="commands per client after login")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--output", help="path to save results as JSON")
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "valutrade_hub.cli.server", "--port", "0", "--workers", str(args.workers)],
+        cwd=os.path.abspath(args.data),
+        env={**os.environ, "PYTHONPATH": REPO_ROOT},
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        line = server.stdout.readline()
+        if not line.startswith("Server is listening on "):
+            print(f"Server did not start: {line}", file=sys.stderr)
+            sys.exit(1)
+        host, port = line.rsplit(" ", 1)[1].strip().rsplit(":", 1)
+        result = asyncio.run(load(host, int(port), args.clients, args.users, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        f"{result['clients']} clients, {result['requests']} requests, {result['errors']} errors, "
+        f"{result['throughput_ops']:.1f} ops/s, p50 {result['p50_ms']:.3f} ms, "
+        f"p95 {result['p95_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms"
+    )
+    if result["first_error"]:
+        print(f"First error: {result['first_error']}")
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "results": {"server": result},
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from .run import REPO_ROOT, git_commit, percentile
+
+
+def import_times(data_dir: str) -> tuple[int, dict[str, int]]:
+    """
+    Import main module in fresh interpreter with -X importtime
+    :param data_dir: working directory of interpreter
+    :return: cumulative import time of main in microseconds and self time of every module
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import main"],
+        cwd=data_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules[name] = int(self_us)
+        if name == "main":
+            total = int(cumulative_us)
+    return total, modules
+
+
+def command_time(data_dir: str, command: str) -> int:
+    """
+    Run one scripted CLI invocation in fresh interpreter
+    :param data_dir: working directory of interpreter
+    :param command: commands for -c
+    :return: wall time in nanoseconds
+    """
+    start = time.perf_counter_ns()
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, "main.py"), "-c", command],
+        cwd=data_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    return time.perf_counter_ns() - start
+
+
+def summarize(name: str, latencies: list[int]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "name": name,
+        "iterations": len(latencies),
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p95_ms": percentile(latencies, 95) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+        "max_ms": latencies[-1] / 1e6 if latencies else 0,
+    }
+
+
+def main():
+    """
+    Measure startup time of CLI and check it against budget
+    Usage: python -m benchmarks.startup --data /tmp/bench --budget-ms 50
+    """
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup")
+    parser.add_argument("--data", required=True, help="directory with data/config.json")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--command", default="help", help="commands of scripted invocation")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="max p50 import time of main")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to show")
+    parser.add_argument("--output", help="path to save results as JSON")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data)
+    imports, commands = [], []
+    modules = {}
+    for _ in range(args.iterations):
+        total, modules = import_times(data_dir)
+        imports.append(total * 1000)
+        commands.append(command_time(data_dir, args.command))
+
+    results = {
+        "import_main": summarize("import_main", imports),
+        "cli_command": summarize("cli_command", commands),
+    }
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "data": data_dir,
+        "iterations": args.iterations,
+        "budget_ms": args.budget_ms,
+        "results": results,
+    }
+
+    print(f"{'benchmark':<16} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {result['max_ms']:>10.3f}")
+    print("\nSlowest modules (self time, last run):")
+    for name, self_us in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:>8.3f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if results["import_main"]["p50_ms"] > args.budget_ms:
+        print(f"[ERROR] import of main takes {results['import_main']['p50_ms']:.1f} ms, budget is {args.budget_ms} ms")
+        sys.exit(1)
+    print(f"Startup is within budget of {args.budget_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
-import prompt
+import sys
 
 from valutrade_hub.cli.interface import process_comand
+from valutrade_hub.cli.script import run_cli
+from valutrade_hub.core.usecases import settings, start_rates_refresher
 
 
 def main():
+    if len(sys.argv) > 1 or not sys.stdin.isatty():
+        sys.exit(run_cli(sys.argv[1:]))
+
+    import prompt
+
+    if settings.get("background_refresh", False):
+        start_rates_refresher()
     while True:
         command = prompt.string("> ")
         process_comand(command)
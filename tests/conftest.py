@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.generate import generate
+from valutrade_hub import log_writer
+from valutrade_hub.core import usecases
+from valutrade_hub.infra.settings import SettingsLoader
+from valutrade_hub.parser_service import history
+from valutrade_hub.parser_service.history import HistoryStore
+
+USERS = 4
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    Fresh data directory with rates and USERS users (user1..userN) from benchmarks.generate, used as working directory
+    Settings, history store and session of the test are reset, so every test sees only its own data
+    :return: path to directory containing data/ and logs/
+    """
+    generate(str(tmp_path), users=USERS, history=0, extra_currencies=0, history_format="legacy", seed=1)
+    os.remove(tmp_path / "data" / "exchange_rates.json")
+    config_path = tmp_path / "data" / "config.json"
+    config = json.loads(config_path.read_text())
+    # absolute path, connections and caches keyed by data path of previous test are not reused
+    config["data_path"] = f"{tmp_path}/data"
+    config_path.write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+
+    settings = SettingsLoader("data/config.json")
+    for key in list(vars(settings)):
+        if key != "config_path":
+            monkeypatch.delattr(settings, key)
+    monkeypatch.setattr(settings, "_config", None, raising=False)
+
+    monkeypatch.setattr(history, "history_store", HistoryStore(history.config.history_path, 1024 * 1024))
+    monkeypatch.setattr(log_writer, "_writer", None)
+    token = usecases.session_user_id.set(None)
+    yield tmp_path
+    usecases.session_user_id.reset(token)
+    if log_writer._writer is not None:
+        log_writer._writer.close()
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+from valutrade_hub.core.currencies import get_snapshot
+from valutrade_hub.infra.rate_table import RateTable
+
+RATES_PATH = "data/rates.json"
+TABLE_PATH = "data/rates.bin"
+
+
+def edit_rates(btc_rate: float) -> dict:
+    with open(RATES_PATH) as f:
+        rates = json.load(f)
+    rates["pairs"]["BTC_USD"]["rate"] = btc_rate
+    with open(RATES_PATH, "w") as f:
+        json.dump(rates, f)
+    return rates
+
+
+def publish(rates: dict) -> None:
+    RateTable.publish(TABLE_PATH, rates["pairs"], rates["last_refresh"], "USD", RATES_PATH)
+
+
+def test_table_published_from_current_rates_is_used(data_dir):
+    snapshot = get_snapshot()
+    assert snapshot.stamp[0].endswith("rates.bin")
+    assert snapshot.pairs["BTC_USD"]["rate"] == 60000.0
+
+
+def test_rates_changed_after_table_are_read_from_json(data_dir, capsys):
+    get_snapshot()
+    rates = edit_rates(61000.0)
+    assert get_snapshot().pairs["BTC_USD"]["rate"] == 61000.0
+    assert get_snapshot().stamp[0].endswith("rates.json")
+    assert capsys.readouterr().err.count("[WARNING]") == 1
+
+    publish(rates)
+    snapshot = get_snapshot()
+    assert snapshot.stamp[0].endswith("rates.bin")
+    assert snapshot.pairs["BTC_USD"]["rate"] == 61000.0
+
+
+def test_rates_are_read_from_json_without_table(data_dir, capsys):
+    os.remove(TABLE_PATH)
+    edit_rates(62000.0)
+    assert get_snapshot().pairs["BTC_USD"]["rate"] == 62000.0
+    assert capsys.readouterr().err == ""
+
+
+def test_table_without_rates_json_is_not_used(data_dir):
+    os.remove(RATES_PATH)
+    with pytest.raises(ValueError, match="update_rates"):
+        get_snapshot()
@@ -0,0 +1,80 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from benchmarks.generate import iter_history, make_rates, write_json_array
+from valutrade_hub.core.usecases import rate_at
+from valutrade_hub.parser_service.history import HistoryStore, to_epoch
+
+LEGACY_PATH = "data/exchange_rates.json"
+
+
+def record_key(record: dict) -> tuple[str, str]:
+    return record["id"], record["timestamp"]
+
+
+@pytest.fixture
+def legacy_records(data_dir):
+    records = list(iter_history(2500, make_rates(0, datetime(2026, 3, 1, 12)), datetime(2026, 3, 1, 12)))
+    write_json_array(LEGACY_PATH, records)
+    return records
+
+
+def test_interrupted_migration_is_resumed(legacy_records, monkeypatch):
+    store = HistoryStore("data/history", 1024 * 1024)
+    save_manifest = store._save_manifest
+    saves = []
+
+    def crash_on_third_save():
+        saves.append(1)
+        if len(saves) == 3:
+            raise KeyboardInterrupt
+        save_manifest()
+
+    # the second chunk is written to segments, but its manifest is not saved
+    monkeypatch.setattr(store, "_save_manifest", crash_on_third_save)
+    with pytest.raises(KeyboardInterrupt):
+        store.migrate_from_json(LEGACY_PATH, chunk_size=1000)
+    assert os.path.exists(LEGACY_PATH)
+
+    store = HistoryStore("data/history", 1024 * 1024)
+    assert store.migrate_from_json(LEGACY_PATH, chunk_size=1000) == 1500
+    assert not os.path.exists(LEGACY_PATH)
+
+    assert sorted(map(record_key, store.iter_records())) == sorted(map(record_key, legacy_records))
+    last = max((record for record in legacy_records if record["id"] == "BTC_USD_coin_gecko"), key=record_key)
+    epoch = to_epoch(last["timestamp"])
+    assert store.index.as_of("BTC_USD", epoch + 3600) == (epoch, last["rate"])
+    assert len(store.index.between("BTC_USD", None, None)) == sum(
+        record["id"] == "BTC_USD_coin_gecko" for record in legacy_records
+    )
+
+
+def test_finished_migration_is_not_repeated(legacy_records):
+    store = HistoryStore("data/history", 1024 * 1024)
+    assert store.migrate_from_json(LEGACY_PATH) == 2500
+    write_json_array(LEGACY_PATH, legacy_records)
+    assert store.migrate_from_json(LEGACY_PATH) == 0
+    assert sum(1 for _ in store.iter_records()) == 2500
+
+
+@pytest.mark.parametrize("pair", ["../../users", "BTC_USD/../x", "BTC", "BTC_USD_EUR", ""])
+def test_invalid_pair_is_rejected_before_file_is_opened(data_dir, monkeypatch, pair):
+    def fail_open(*args, **kwargs):
+        raise AssertionError("file opened")
+
+    store = HistoryStore("data/history", 1024 * 1024)
+    monkeypatch.setattr("builtins.open", fail_open)
+    with pytest.raises(ValueError, match="Неверная пара"):
+        store.index.as_of(pair, 0)
+    with pytest.raises(ValueError, match="Неверная пара"):
+        store.rollups.between(pair, "1h", None, None)
+
+
+def test_rate_at_accepts_pair_in_any_case(legacy_records, capsys):
+    HistoryStore("data/history", 1024 * 1024).migrate_from_json(LEGACY_PATH)
+    rate_at("btc_usd", "2026-03-01 12:00", None, None)
+    assert capsys.readouterr().out.startswith("Курс BTC_USD на 2026-03-01 12:00:")
+    with pytest.raises(ValueError, match="Неверная пара '../../X'"):
+        rate_at("../../x", "2026-03-01 12:00", None, None)
@@ -0,0 +1,98 @@
+import pytest
+
+from valutrade_hub.core.exceptions import ApiRequestError
+from valutrade_hub.parser_service.api_clients import BaseApiClient
+from valutrade_hub.parser_service.policy import CircuitBreaker, ResilientClient
+
+
+class FakeClient(BaseApiClient):
+    """
+    Client which answers with given results in turn, exceptions are raised
+    """
+    currencies = ["BTC"]
+
+    def __init__(self, *results):
+        super().__init__()
+        self.results = list(results)
+        self.calls = 0
+
+    def fetch_rates(self, codes=None):
+        result = self.results[min(self.calls, len(self.results) - 1)]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def api_error(status: int) -> ApiRequestError:
+    error = ApiRequestError(f"{status} Error")
+    error.status = status
+    error.retryable = status == 429 or status >= 500
+    return error
+
+
+def fetch(client: ResilientClient, times: int = 1):
+    for _ in range(times):
+        try:
+            client.fetch_rates()
+        except ApiRequestError:
+            pass
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+
+def resilient(fake: FakeClient, breaker: CircuitBreaker, retries: int = 2) -> ResilientClient:
+    return ResilientClient("fake", fake, retries=retries, backoff=0.001, max_backoff=0.001, breaker=breaker)
+
+
+def test_client_errors_do_not_open_circuit(data_dir, breaker):
+    fake = FakeClient(api_error(404))
+    fetch(resilient(fake, breaker), times=5)
+    assert fake.calls == 5
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_retries_of_one_fetch_count_once(data_dir, breaker):
+    fake = FakeClient(api_error(503))
+    client = resilient(fake, breaker)
+    fetch(client)
+    assert fake.calls == 3
+    assert breaker.failures == 1
+    assert breaker.allow()
+    fetch(client)
+    assert breaker.failures == 2
+    assert not breaker.allow()
+
+
+def test_retry_success_resets_failures(data_dir, breaker):
+    fake = FakeClient(api_error(500), {"BTC_USD": 1.0})
+    client = resilient(fake, breaker)
+    fetch(resilient(FakeClient(api_error(500)), breaker, retries=0))
+    assert client.fetch_rates() == {"BTC_USD": 1.0}
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize("error", [KeyError("bitcoin"), TypeError("'NoneType' object is not subscriptable")])
+def test_unparsable_responses_open_circuit(data_dir, breaker, error):
+    fake = FakeClient(error)
+    client = resilient(fake, breaker)
+    with pytest.raises(ApiRequestError, match=type(error).__name__):
+        client.fetch_rates()
+    fetch(client)
+    assert fake.calls == 6
+    assert not breaker.allow()
+    with pytest.raises(ApiRequestError, match="circuit is open"):
+        client.fetch_rates()
+    assert fake.calls == 6
+
+
+def test_client_error_releases_trial(data_dir, breaker, monkeypatch):
+    fetch(resilient(FakeClient(api_error(500)), breaker, retries=0), times=2)
+    monkeypatch.setattr(breaker, "reset_timeout", 0)
+    fetch(resilient(FakeClient(api_error(400)), breaker))
+    assert breaker.failures == 2
+    assert breaker.allow()
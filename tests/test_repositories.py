@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+from valutrade_hub.core.repositories import portfolio_repository
+from valutrade_hub.infra.database import get_connection
+
+
+@pytest.fixture
+def low_parameter_limit(data_dir):
+    """
+    Limit number of query parameters to 999, default of SQLite before 3.32
+    """
+    connection = get_connection()
+    if not hasattr(connection, "setlimit"):
+        pytest.skip("Connection.setlimit needs Python 3.11")
+    limit = connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    yield
+    connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+
+
+def test_balance_rows_with_large_currency_index(low_parameter_limit):
+    code_index = {f"X{i:04d}": i for i in range(1000)}
+    code_index.update(USD=1000, BTC=1001)
+    expected = sorted(
+        (portfolio.user, code_index.get(code, -1), wallet.balance)
+        for portfolio in portfolio_repository.all()
+        for code, wallet in portfolio.wallets.items()
+    )
+    assert sorted(portfolio_repository.balance_rows(code_index)) == expected
+    assert {user_id for user_id, index, _ in expected if index == 1000} == {1, 2, 3, 4}
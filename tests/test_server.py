@@ -0,0 +1,90 @@
+import asyncio
+import contextvars
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from valutrade_hub.cli.interface import parser
+from valutrade_hub.cli.server import SessionServer, SessionStdout, run_command
+
+PAIRS = [("BTC", "EUR"), ("ETH", "RUB"), ("XMR", "CZK"), ("EUR", "BTC")]
+
+
+@contextmanager
+def session_stdout():
+    """
+    Send output of commands to their sessions as server main does, set inside test because pytest
+    replaces sys.stdout between setup and call
+    """
+    stdout = sys.stdout
+    sys.stdout = SessionStdout(stdout)
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+def test_parse_returns_own_values_in_every_thread():
+    def parse(i):
+        parsed = parser.parse(f"buy --currency C{i % 7} --amount {i}")
+        return parsed.currency == f"C{i % 7}" and parsed.amount == i
+
+    with ThreadPoolExecutor(8) as executor:
+        assert all(executor.map(parse, range(40000)))
+
+
+def test_concurrent_commands_get_own_output(data_dir):
+    def run(i):
+        from_cur, to_cur = PAIRS[i % len(PAIRS)]
+        if i % 2:
+            result = contextvars.Context().run(run_command, f"show_rates --currency {from_cur} --base {to_cur}")
+        else:
+            result = contextvars.Context().run(run_command, f"get_rate --from_cur {from_cur} --to_cur {to_cur}")
+        return result["ok"] and result["output"][0].startswith(f"Курс {from_cur}→{to_cur}:")
+
+    # switch threads as often as possible to make races likely
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with session_stdout(), ThreadPoolExecutor(16) as executor:
+            assert all(executor.map(run, range(40000)))
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_sessions_are_isolated(data_dir):
+    async def client(port, user):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        commands = [f"register --username {user} --password {user}"]
+        commands += [f"login --username {user} --password {user}", "buy --currency BTC --amount 0.001"] * 5
+        commands += ["show_portfolio"]
+        replies = []
+        for cmd in commands:
+            writer.write((cmd + "\n").encode())
+            await writer.drain()
+            replies.append(json.loads(await reader.readline()))
+        writer.write(b"exit\n")
+        await writer.drain()
+        await reader.read()
+        writer.close()
+        return replies
+
+    async def main():
+        server = SessionServer("127.0.0.1", 0, 8)
+        await server.start()
+        try:
+            return await asyncio.gather(*(client(server.port, f"client{i}") for i in range(8)))
+        finally:
+            server.close()
+
+    with session_stdout():
+        results = asyncio.run(main())
+    for replies in results:
+        assert replies.pop(0)["ok"]
+        logins, buys, portfolio = replies[0:10:2], replies[1:10:2], replies[-1]
+        assert logins[0]["ok"]
+        assert all(not reply["ok"] and reply["error"]["message"] == "You are already logged in" for reply in logins[1:])
+        assert all(reply["ok"] for reply in buys)
+        assert portfolio["ok"]
+        assert sorted(line.split(" -> ")[0] for line in portfolio["output"]) == ["0.005 BTC", "700.0 USD"]
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from valutrade_hub.core import usecases
+from valutrade_hub.core.exceptions import ConcurrentUpdateError
+from valutrade_hub.core.repositories import portfolio_repository, user_repository
+from valutrade_hub.core.utils import get_portfolio, save_portfolio
+
+
+@pytest.fixture
+def user_id(data_dir):
+    usecases.register("trader", "trader")
+    return user_repository.get_by_username("trader").user_id
+
+
+def balances(user_id: int) -> dict[str, float]:
+    return {code: round(wallet.balance, 6) for code, wallet in get_portfolio(user_id).wallets.items()}
+
+
+def test_save_of_stale_portfolio_is_rejected(user_id):
+    first, second = get_portfolio(user_id), get_portfolio(user_id)
+    first.get_wallet("USD").withdraw(100)
+    save_portfolio(first)
+    second.get_wallet("USD").withdraw(200)
+    with pytest.raises(ConcurrentUpdateError):
+        save_portfolio(second)
+    assert balances(user_id) == {"USD": 900.0}
+
+
+def test_buy_is_retried_after_concurrent_update(user_id, monkeypatch):
+    reads = []
+
+    def get_portfolio_then_sell_elsewhere(uid):
+        portfolio = portfolio_repository.get(uid)
+        if not reads:
+            # another writer withdraws between read and save of this buy
+            other = portfolio_repository.get(uid)
+            other.get_wallet("USD").withdraw(100)
+            portfolio_repository.save(other)
+        reads.append(portfolio.version)
+        return portfolio
+
+    monkeypatch.setattr(usecases, "get_portfolio", get_portfolio_then_sell_elsewhere)
+    usecases.set_session_user_id(user_id)
+    usecases.buy("BTC", 0.001)
+    assert reads == [1, 2]
+    assert balances(user_id) == {"USD": 840.0, "BTC": 0.001}
+
+
+def test_concurrent_orders_are_not_lost(user_id):
+    usecases.set_session_user_id(user_id)
+    usecases.buy("BTC", 0.01)
+    errors = []
+
+    def trade(side):
+        usecases.set_session_user_id(user_id)
+        try:
+            for _ in range(10):
+                getattr(usecases, side)("BTC", 0.0001)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=trade, args=(side,)) for side in ("buy", "sell") * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert balances(user_id) == {"USD": 400.0, "BTC": 0.01}
@@ -0,0 +1,34 @@
+import pytest
+
+from valutrade_hub.core.currencies import get_snapshot
+from valutrade_hub.core.exceptions import ApiRequestError
+from valutrade_hub.parser_service.updater import RatesUpdater
+
+COINGECKO_BODY = {"bitcoin": {"usd": 1.0}, "ethereum": {"usd": 2.0}, "monero": {"usd": 3.0}}
+
+
+@pytest.fixture
+def updater(data_dir, monkeypatch):
+    updater = RatesUpdater()
+    monkeypatch.setattr(updater.coingecko_client, "get_json", lambda url: COINGECKO_BODY)
+    for _, client in updater.sources.values():
+        monkeypatch.setattr(client, "retries", 0)
+    return updater
+
+
+@pytest.mark.parametrize("body", [[], {"conversion_rates": None}, {"conversion_rates": {"USD": 1, "EUR": 0}}])
+def test_malformed_response_fails_only_its_source(updater, monkeypatch, body):
+    monkeypatch.setattr(updater.exchangerates_client, "get_json", lambda url: body)
+    with pytest.raises(ApiRequestError, match="Exchangerates"):
+        updater.run_update(verbose=False, force=True)
+    assert get_snapshot().pairs["BTC_USD"]["rate"] == 1.0
+
+
+def test_unexpected_client_error_fails_only_its_source(updater, monkeypatch):
+    def fetch_rates(codes=None):
+        raise RuntimeError("broken client")
+
+    monkeypatch.setattr(updater.exchangerates_client, "fetch_rates", fetch_rates)
+    with pytest.raises(ApiRequestError, match="RuntimeError: broken client"):
+        updater.run_update(verbose=False, force=True)
+    assert get_snapshot().pairs["ETH_USD"]["rate"] == 2.0
@@ -1,7 +1,33 @@
 import shlex
+import sqlite3
 
-from ..core.exceptions import ApiRequestError, CurrencyNotFoundError, InsufficientFundsError
-from ..core.usecases import buy, get_rate, help_show, login, register, sell, show_portfolio, show_rates, update_rates
+from ..core.exceptions import (
+    ApiRequestError,
+    ConcurrentUpdateError,
+    CurrencyNotFoundError,
+    InsufficientFundsError,
+)
+from ..core.usecases import (
+    batch,
+    buy,
+    export_history,
+    get_rate,
+    help_show,
+    history,
+    leaderboard,
+    login,
+    parse_orders,
+    rate_at,
+    register,
+    replay_history,
+    sell,
+    show_portfolio,
+    show_rates,
+    show_stats,
+    update_rates,
+    updater_status,
+)
+from ..metrics import metrics
 
 
 class Arg:
@@ -12,12 +38,27 @@ class Arg:
         self.name = arg_name
         self.required = required
         self.value_type = value_type
-        self.value = None
+
+
+class ParsedCommand:
+    """
+    Command with values of its arguments, every parse makes a new one
+    so commands parsed in different threads do not share state
+    """
+    def __init__(self, cmd_name: str, values: dict):
+        self.cmd = cmd_name
+        self.values = values
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["values"][name]
+        except KeyError:
+            raise AttributeError(name)
 
 
 class Command:
     """
-    Command class
+    Command class, description of command arguments, not changed by parsing
     """
     def __init__(self, cmd_name: str):
         self.cmd = cmd_name
@@ -38,12 +79,14 @@ class Command:
 
         self.args[arg_name_called] = Arg(arg_name, required, value_type)
 
-    def parse_args(self, cmd: list[str]):
+    def parse_args(self, cmd: list[str]) -> ParsedCommand:
         """
         Parse arguments from command
         :param cmd: command from user
-        :return: None
+        :return: parsed command
         """
+        cmd = list(cmd)
+        values = {}
         for arg in self.args:
             arg_object = self.args[arg]
             if arg_object.name in cmd:
@@ -54,24 +97,18 @@ class Command:
                     raise ValueError(f"Argument {arg_object.name} must be of type {arg_object.value_type.__name__}")
                 except IndexError:
                     raise ValueError(f"Argument for {arg_object.name} cannot be empty")
-                arg_object.value = value
+                values[arg] = value
                 cmd.pop(index)
                 cmd.pop(index)
             else:
                 if arg_object.required:
                     raise ValueError(f"Argument {arg_object.name} is required for command {self.cmd}")
                 else:
-                    arg_object.value = None
-                    arg_object.parsed = True
+                    values[arg] = None
 
         if len(cmd) > 0:
             raise ValueError(f"Unknown arguments {', '.join(cmd)} for command {self.cmd}")
-
-    def __getattr__(self, name):
-        try:
-            return self.args[name].value
-        except KeyError:
-            raise AttributeError(name)
+        return ParsedCommand(self.cmd, values)
 
 
 class DummyParser:
@@ -81,7 +118,6 @@ class DummyParser:
     """
     def __init__(self):
         self._commands = {}
-        self.parsed_command = None
 
     def add_command(self, cmd_name: str):
         """
@@ -91,19 +127,17 @@ class DummyParser:
         """
         self._commands[cmd_name] = Command(cmd_name)
 
-    def parse(self, cmd: str):
+    def parse(self, cmd: str) -> ParsedCommand:
         """
         Parse command from user
         :param cmd: command from user
-        :return: None
+        :return: parsed command
         """
         result = shlex.split(cmd)
         command = result[0]
         if command not in self._commands:
             raise ValueError(f"Unknown command {command}")
-        if command in self._commands:
-            self._commands[command].parse_args(result[1:])
-        self.parsed_command = self._commands[command]
+        return self._commands[command].parse_args(result[1:])
 
     def __getattr__(self, name):
         try:
@@ -145,52 +179,178 @@ parser.show_rates.add_arg("--currency", False, str)
 parser.show_rates.add_arg("--top", False, int)
 parser.show_rates.add_arg("--base", False, str)
 
+parser.add_command("rate_at")
+parser.rate_at.add_arg("--pair", True, str)
+parser.rate_at.add_arg("--at", False, str)
+parser.rate_at.add_arg("--from", False, str)
+parser.rate_at.add_arg("--to", False, str)
+
+parser.add_command("history")
+parser.history.add_arg("--pair", True, str)
+parser.history.add_arg("--interval", False, str)
+parser.history.add_arg("--from", False, str)
+parser.history.add_arg("--to", False, str)
+parser.history.add_arg("--limit", False, int)
+
+parser.add_command("export_history")
+parser.export_history.add_arg("--format", False, str)
+parser.export_history.add_arg("--output", False, str)
+parser.export_history.add_arg("--pair", False, str)
+parser.export_history.add_arg("--from", False, str)
+parser.export_history.add_arg("--to", False, str)
+parser.export_history.add_arg("--source", False, str)
+
+parser.add_command("replay_history")
+parser.replay_history.add_arg("--pair", False, str)
+parser.replay_history.add_arg("--from", False, str)
+parser.replay_history.add_arg("--to", False, str)
+parser.replay_history.add_arg("--source", False, str)
+parser.replay_history.add_arg("--speed", False, float)
+
+parser.add_command("batch")
+parser.batch.add_arg("--orders", False, str)
+parser.batch.add_arg("--file", False, str)
+
+parser.add_command("updater_status")
+
+parser.add_command("stats")
+parser.stats.add_arg("--export", False, str)
+
+parser.add_command("leaderboard")
+parser.leaderboard.add_arg("--top", False, int)
+parser.leaderboard.add_arg("--base", False, str)
+parser.leaderboard.add_arg("--export", False, str)
+
 parser.add_command("help")
 
 parser.add_command("exit")
 
 
-def process_comand(cmd: str):
+def execute_command(cmd: str):
     """
-    Process command from user
+    Parse and execute command, errors are raised to caller
     :param cmd: command from user
     :return: None
     """
-    try:
-        parser.parse(cmd)
-        parsed_command = parser.parsed_command
-        if parsed_command is not None:
-            if parsed_command.cmd == "register":
-                register(username=parsed_command.username, password=parsed_command.password)
-            elif parsed_command.cmd == "login":
-                login(username=parsed_command.username, password=parsed_command.password)
-            elif parsed_command.cmd == "show_portfolio":
-                show_portfolio(parsed_command.base)
-            elif parsed_command.cmd == "buy":
-                buy(currency=parsed_command.currency, amount=parsed_command.amount)
-            elif parsed_command.cmd == "sell":
-                sell(currency=parsed_command.currency, amount=parsed_command.amount)
-            elif parsed_command.cmd == "get_rate":
-                get_rate(parsed_command.from_cur, parsed_command.to_cur)
-            elif parsed_command.cmd == "exit":
-                exit()
-            elif parsed_command.cmd == "help":
-                help_show()
-            elif parsed_command.cmd == "update_rates":
-                update_rates(parsed_command.source)
-            elif parsed_command.cmd == "show_rates":
-                show_rates(parsed_command.currency, parsed_command.top, parsed_command.base)
-            else:
-                print("Unknown command")
+    parsed_command = parser.parse(cmd)
+    with metrics.timed(f"command.{parsed_command.cmd}"):
+        _dispatch(parsed_command)
+
+
+def _dispatch(parsed_command: ParsedCommand):
+    """
+    Run use case of parsed command
+    :param parsed_command: parsed command
+    :return: None
+    """
+    if parsed_command.cmd == "register":
+        register(username=parsed_command.username, password=parsed_command.password)
+    elif parsed_command.cmd == "login":
+        login(username=parsed_command.username, password=parsed_command.password)
+    elif parsed_command.cmd == "show_portfolio":
+        show_portfolio(parsed_command.base)
+    elif parsed_command.cmd == "buy":
+        buy(currency=parsed_command.currency, amount=parsed_command.amount)
+    elif parsed_command.cmd == "sell":
+        sell(currency=parsed_command.currency, amount=parsed_command.amount)
+    elif parsed_command.cmd == "get_rate":
+        get_rate(parsed_command.from_cur, parsed_command.to_cur)
+    elif parsed_command.cmd == "exit":
+        exit()
+    elif parsed_command.cmd == "help":
+        help_show()
+    elif parsed_command.cmd == "update_rates":
+        update_rates(parsed_command.source)
+    elif parsed_command.cmd == "show_rates":
+        show_rates(parsed_command.currency, parsed_command.top, parsed_command.base)
+    elif parsed_command.cmd == "batch":
+        if parsed_command.orders and parsed_command.file:
+            raise ValueError("You can't use --orders and --file together")
+        if parsed_command.file:
+            try:
+                with open(parsed_command.file, "r") as f:
+                    orders_text = f.read()
+            except OSError as e:
+                raise ValueError(f"Cannot read orders file: {e}")
         else:
-            print("No parsed command found")
-    except ValueError as e:
-        print("Error:", e)
-    except ApiRequestError as e:
-        print("Error:", e)
-        print("Try again later")
-    except InsufficientFundsError as e:
-        print("Error:", e)
-    except CurrencyNotFoundError as e:
-        print("Error:", e)
-        print("Try command 'get-rate' to see all available currencies")
+            orders_text = parsed_command.orders or ""
+        batch(orders=parse_orders(orders_text))
+    elif parsed_command.cmd == "updater_status":
+        updater_status()
+    elif parsed_command.cmd == "stats":
+        show_stats(parsed_command.export)
+    elif parsed_command.cmd == "leaderboard":
+        leaderboard(parsed_command.top, parsed_command.base, parsed_command.export)
+    elif parsed_command.cmd == "rate_at":
+        rate_at(
+            parsed_command.pair,
+            parsed_command.at,
+            getattr(parsed_command, "from"),
+            getattr(parsed_command, "to"),
+        )
+    elif parsed_command.cmd == "history":
+        history(
+            parsed_command.pair,
+            parsed_command.interval,
+            getattr(parsed_command, "from"),
+            getattr(parsed_command, "to"),
+            parsed_command.limit,
+        )
+    elif parsed_command.cmd == "export_history":
+        export_history(
+            parsed_command.format,
+            parsed_command.output,
+            parsed_command.pair,
+            getattr(parsed_command, "from"),
+            getattr(parsed_command, "to"),
+            parsed_command.source,
+        )
+    elif parsed_command.cmd == "replay_history":
+        replay_history(
+            parsed_command.pair,
+            getattr(parsed_command, "from"),
+            getattr(parsed_command, "to"),
+            parsed_command.source,
+            parsed_command.speed,
+        )
+    else:
+        print("Unknown command")
+
+
+# sqlite3.OperationalError is raised when database stays locked by another process longer than timeout
+HANDLED_ERRORS = (
+    ValueError,
+    ApiRequestError,
+    InsufficientFundsError,
+    CurrencyNotFoundError,
+    ConcurrentUpdateError,
+    sqlite3.OperationalError,
+)
+
+
+def error_lines(error: Exception) -> list[str]:
+    """
+    Format handled error for user
+    :param error: error raised by command
+    :return: lines to print
+    """
+    lines = [f"Error: {error}"]
+    if isinstance(error, (ApiRequestError, sqlite3.OperationalError)):
+        lines.append("Try again later")
+    elif isinstance(error, CurrencyNotFoundError):
+        lines.append("Try command 'get-rate' to see all available currencies")
+    return lines
+
+
+def process_comand(cmd: str) -> bool:
+    """
+    Process command from user
+    :param cmd: command from user
+    :return: True if command succeeded, False otherwise
+    """
+    try:
+        execute_command(cmd)
+        return True
+    except HANDLED_ERRORS as e:
+        print("\n".join(error_lines(e)))
+        return False
@@ -0,0 +1,159 @@
+import io
+import json
+import os
+import stat
+import sys
+from contextlib import nullcontext, redirect_stdout
+from typing import Iterable, Iterator, Optional
+
+from ..infra.database import flush_group, group_commit, transaction
+from ..infra.settings import SettingsLoader
+from .interface import HANDLED_ERRORS, error_lines, execute_command
+
+settings = SettingsLoader("data/config.json")
+
+USAGE = """Usage:
+  project                     interactive mode
+  project --script <file>     run commands from file, '-' for stdin
+  project -c "cmd; cmd"       run commands from argument
+  project ... --json          print one JSON object per command
+Commands are separated by new lines or ';', 'checkpoint' commits changes made so far"""
+
+# commands which are committed together, any other command commits changes made before it
+GROUPED_COMMANDS = ("register", "buy", "sell", "batch")
+
+
+def split_commands(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Split script into commands by new lines and semicolons outside of quotes
+    Empty lines and lines starting with # are skipped
+    :param lines: lines of script
+    :return: iterator of commands
+    """
+    for line in lines:
+        if line.lstrip().startswith("#"):
+            continue
+        current, quote = [], None
+        for char in line.rstrip("\n"):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+            elif char == ";":
+                command = "".join(current).strip()
+                if command:
+                    yield command
+                current = []
+                continue
+            current.append(char)
+        command = "".join(current).strip()
+        if command:
+            yield command
+
+
+def run_script(commands: Iterable[str], json_output: bool = False) -> int:
+    """
+    Run commands in one process and one session
+    Changes of consecutive register/buy/sell/batch commands are committed together: transaction is opened
+    by the first of them and committed after script_commit_seconds or script_commit_commands commands,
+    before any other command, at 'checkpoint' command and at the end of script, so commands which only read
+    do not hold write lock. Every such command runs in its own savepoint so a failed command leaves no partial
+    changes
+    :param commands: commands
+    :param json_output: print one JSON object per command instead of plain output
+    :return: exit code, 0 if every command succeeded, 1 otherwise
+    """
+    exit_code = 0
+    with group_commit(settings.get("script_commit_seconds", 0.5), settings.get("script_commit_commands", 100)):
+        for cmd in commands:
+            flush_group(if_full=cmd.split(maxsplit=1)[0] in GROUPED_COMMANDS)
+            if cmd == "checkpoint":
+                continue
+            if cmd == "exit":
+                break
+            ok, error, output = _run_command(cmd, json_output)
+            if not ok:
+                exit_code = 1
+            if json_output:
+                print(json.dumps(command_result(cmd, ok, error, output), ensure_ascii=False))
+            elif error is not None:
+                print("\n".join(error_lines(error)))
+        sys.stdout.flush()
+    return exit_code
+
+
+def command_result(cmd: str, ok: bool, error: Optional[Exception], output: list[str]) -> dict:
+    """
+    Make JSON-serializable result of one command
+    :param cmd: command
+    :param ok: success flag
+    :param error: error raised by command
+    :param output: output lines
+    :return: result
+    """
+    return {
+        "command": cmd,
+        "ok": ok,
+        "output": output,
+        "error": None if error is None else {"type": type(error).__name__, "message": str(error)},
+    }
+
+
+def _run_command(cmd: str, capture: bool) -> tuple[bool, Optional[Exception], list[str]]:
+    """
+    Run one command, commands which change data run inside savepoint
+    :param cmd: command
+    :param capture: capture output of command
+    :return: success flag, handled error and captured output lines
+    """
+    buffer = io.StringIO()
+    grouped = cmd.split(maxsplit=1)[0] in GROUPED_COMMANDS
+    try:
+        with redirect_stdout(buffer) if capture else nullcontext(), transaction() if grouped else nullcontext():
+            execute_command(cmd)
+    except HANDLED_ERRORS as e:
+        return False, e, buffer.getvalue().splitlines()
+    return True, None, buffer.getvalue().splitlines()
+
+
+def _committing(commands: Iterator[str]) -> Iterator[str]:
+    """
+    Commit changes before waiting for next command, unless stdin is a regular file
+    Commands from pipe or terminal may come at any time, write lock is not held while they are awaited
+    :param commands: commands read from stdin
+    :return: iterator of commands
+    """
+    try:
+        regular = stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode)
+    except (OSError, ValueError):
+        regular = False
+    for cmd in commands:
+        yield cmd
+        if not regular:
+            flush_group()
+
+
+def run_cli(argv: list[str]) -> int:
+    """
+    Run non-interactive mode from command line arguments
+    :param argv: arguments without program name
+    :return: exit code
+    """
+    json_output = "--json" in argv
+    argv = [arg for arg in argv if arg != "--json"]
+
+    if not argv or argv == ["--script", "-"]:
+        return run_script(_committing(split_commands(sys.stdin)), json_output)
+    if len(argv) == 2 and argv[0] == "-c":
+        return run_script(split_commands(argv[1].splitlines()), json_output)
+    if len(argv) == 2 and argv[0] == "--script":
+        try:
+            with open(argv[1], "r") as f:
+                return run_script(split_commands(f), json_output)
+        except FileNotFoundError:
+            print(f"Error: script {argv[1]} not found", file=sys.stderr)
+            return 2
+
+    print(USAGE, file=sys.stderr)
+    return 2
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import shlex
+import sys
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Optional
+
+from ..core.repositories import portfolio_repository
+from ..core.usecases import get_session_user_id, settings, start_rates_refresher
+from .interface import HANDLED_ERRORS, execute_command
+from .script import command_result
+
+WRITE_COMMANDS = ("buy", "sell", "batch")
+LOCAL_COMMANDS = ("exit",)
+# commands available without login, they only read rates or log in
+ANONYMOUS_COMMANDS = ("register", "login", "help", "get_rate", "show_rates", "rate_at", "history")
+# other commands need login, commands not listed here (export_history, replay_history) are not available
+SERVER_COMMANDS = ANONYMOUS_COMMANDS + (
+    "show_portfolio", "buy", "sell", "batch", "update_rates", "updater_status", "stats", "leaderboard"
+)
+# options which read or write files of server
+FILE_OPTIONS = {"batch": ("--file",), "stats": ("--export",), "leaderboard": ("--export",)}
+
+_output: ContextVar[Optional[io.StringIO]] = ContextVar("output", default=None)
+
+
+class SessionStdout:
+    """
+    Stdout which sends output of command to buffer of session running it
+    Output outside of commands goes to original stream
+    :param stream: original stream
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        buffer = _output.get()
+        return (buffer if buffer is not None else self._stream).write(text)
+
+    def flush(self) -> None:
+        if _output.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Session:
+    """
+    State of one client connection
+    Use cases keep logged in user in context variables, every session runs its commands in its own context
+    :param session_id: session id
+    :param peer: address of client
+    """
+    def __init__(self, session_id: int, peer):
+        self.id = session_id
+        self.peer = peer
+        self.context = contextvars.Context()
+        self.commands = 0
+
+    @property
+    def user_id(self) -> Optional[int]:
+        return self.context.run(get_session_user_id)
+
+
+def check_command(cmd: str, logged_in: bool) -> str:
+    """
+    Check that client may run command through server
+    :param cmd: command
+    :param logged_in: session has logged in user
+    :raises ValueError: if command or its option is not available
+    :return: command name
+    """
+    args = shlex.split(cmd)
+    if args[0] not in SERVER_COMMANDS:
+        raise ValueError(f"Command {args[0]} is not available in server mode")
+    for option in FILE_OPTIONS.get(args[0], ()):
+        if option in args:
+            raise ValueError(f"Argument {option} of command {args[0]} is not available in server mode")
+    if not logged_in and args[0] not in ANONYMOUS_COMMANDS:
+        raise ValueError("You are not logged in")
+    return args[0]
+
+
+def run_command(cmd: str) -> dict:
+    """
+    Run one command and capture its output, called in worker thread inside session context
+    :param cmd: command
+    :return: result of command
+    """
+    buffer = io.StringIO()
+    token = _output.set(buffer)
+    try:
+        execute_command(cmd)
+        ok, error = True, None
+    except HANDLED_ERRORS as e:
+        ok, error = False, e
+    except Exception as e:
+        print(f"[ERROR] Command '{cmd}' failed: {type(e).__name__}: {e}", file=sys.stderr)
+        ok, error = False, e
+    finally:
+        _output.reset(token)
+    return command_result(cmd, ok, error, buffer.getvalue().splitlines())
+
+
+class SessionServer:
+    """
+    Asyncio server hosting many authenticated sessions over line protocol
+    Client sends one command per line in CLI syntax and gets one JSON object per line, as in script --json mode.
+    Only SERVER_COMMANDS without options touching server files are accepted, anonymous clients
+    may run only ANONYMOUS_COMMANDS. Commands run in thread pool, buy/sell/batch of one user are serialized
+    :param host: host to bind
+    :param port: port to bind
+    :param workers: number of worker threads
+    """
+    def __init__(self, host: str, port: int, workers: int):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="session")
+        self.sessions: dict[int, Session] = {}
+        self._user_locks = weakref.WeakValueDictionary()
+        self._next_id = 0
+        self._server = None
+
+    def _user_lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user_id] = lock
+        return lock
+
+    async def execute(self, session: Session, cmd: str) -> dict:
+        """
+        Execute command of session in worker thread
+        :param session: session
+        :param cmd: command
+        :return: result of command
+        """
+        loop = asyncio.get_running_loop()
+        user_id = session.user_id
+        session.commands += 1
+        try:
+            name = check_command(cmd, bool(user_id))
+        except ValueError as e:
+            return command_result(cmd, False, e, [])
+        if user_id and name in WRITE_COMMANDS:
+            async with self._user_lock(user_id):
+                return await loop.run_in_executor(self.executor, session.context.run, run_command, cmd)
+        return await loop.run_in_executor(self.executor, session.context.run, run_command, cmd)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve one client connection until it sends exit or disconnects
+        :param reader: stream reader
+        :param writer: stream writer
+        :return: None
+        """
+        self._next_id += 1
+        session = Session(self._next_id, writer.get_extra_info("peername"))
+        self.sessions[session.id] = session
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode("utf-8", errors="replace").strip()
+                if not cmd:
+                    continue
+                if cmd in LOCAL_COMMANDS:
+                    break
+                result = await self.execute(session, cmd)
+                writer.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            del self.sessions[session.id]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    """
+    Run multi-session server
+    Usage: python -m valutrade_hub.cli.server --port 8765
+    """
+    parser = argparse.ArgumentParser(description="Multi-session valutrade server")
+    parser.add_argument("--host", default=settings.get("server_host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=settings.get("server_port", 8765))
+    parser.add_argument("--workers", type=int, default=settings.get("server_workers", 16))
+    parser.add_argument(
+        "--cache-size", type=int, default=settings.get("server_portfolio_cache", 10000),
+        help="number of portfolios kept in memory, 0 disables cache",
+    )
+    args = parser.parse_args()
+
+    portfolio_repository.enable_cache(args.cache_size)
+    if settings.get("background_refresh", False):
+        start_rates_refresher()
+    sys.stdout = SessionStdout(sys.stdout)
+
+    server = SessionServer(args.host, args.port, args.workers)
+
+    async def serve():
+        await server.start()
+        print(f"Server is listening on {server.host}:{server.port}")
+        sys.stdout.flush()
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("Server stopped")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
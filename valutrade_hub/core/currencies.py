@@ -1,8 +1,18 @@
 import json
+import os
+import sys
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping, Optional
 
+from ..infra.rate_table import RECORD, TIME_FORMAT, RateTableReader, file_stamp
 from ..infra.settings import SettingsLoader
+from ..metrics import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
 from .exceptions import ApiRequestError, CurrencyNotFoundError
 
 settings = SettingsLoader("data/config.json")
@@ -12,6 +22,8 @@ class Currency(ABC):
     """
     Inteface class for currencies
     """
+    __slots__ = ("_name", "_code")
+
     @abstractmethod
     def __init__(self, name: str, code: str):
         self._name = name
@@ -34,6 +46,8 @@ class FiatCurrency(Currency):
     """
     Implementation for fiat currencies
     """
+    __slots__ = ("_issuing_country",)
+
     def __init__(self, name: str, code: str, issuing_country: str):
         super().__init__(name, code)
         self._issuing_country = issuing_country
@@ -46,6 +60,8 @@ class CryptoCurrency(Currency):
     """
     Implementation for crypto currencies
     """
+    __slots__ = ("_algorithm", "_market_cap")
+
     def __init__(self, name: str, code: str, algorithm: str, market_cap: float):
         super().__init__(name, code)
         self._algorithm = algorithm
@@ -55,32 +71,362 @@ class CryptoCurrency(Currency):
         return f"[CRYPTO] {self._code} - {self._name} (Algorithm: {self._algorithm}, MCAP: {self._market_cap})"
 
 
-def get_currencies() -> dict:
+class _TablePairs(Mapping):
+    """
+    Read-only pairs mapping over records copied from binary rate table
+    Values are unpacked on first access to pair
+    :param table: table from RateTableReader.read
+    """
+    def __init__(self, table: dict):
+        self._base = table["base"]
+        self._sources = table["sources"]
+        self._records = table["records"]
+        self.codes = table["codes"]
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self._values = {}
+
+    def __getitem__(self, pair: str) -> Mapping:
+        value = self._values.get(pair)
+        if value is None:
+            code, _, base = pair.rpartition("_")
+            i = self.index.get(code) if base == self._base else None
+            if i is None:
+                raise KeyError(pair)
+            _, source, rate, epoch = RECORD.unpack_from(self._records, i * RECORD.size)
+            value = MappingProxyType({
+                "rate": rate,
+                "updated_at": datetime.fromtimestamp(epoch).strftime(TIME_FORMAT),
+                "source": self._sources[source],
+            })
+            self._values[pair] = value
+        return value
+
+    def __iter__(self):
+        return (f"{code}_{self._base}" for code in self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def rates(self) -> "np.ndarray":
+        """
+        Get rates of all codes to base currency without unpacking records one by one
+        :return: float64 array ordered as codes
+        """
+        import numpy as np
+
+        return np.frombuffer(self._records, dtype=np.dtype(
+            [("code", "<u4"), ("source", "<u4"), ("rate", "<f8"), ("epoch", "<f8")]
+        ))["rate"]
+
+
+class RateSnapshot:
+    """
+    Immutable view of the rates cache taken at one moment
+    :param pairs: pairs from rates.json or from binary rate table
+    :param last_refresh: time of last refresh
+    :param stamp: (path, inode, size, mtime) of rates.json or (path, generation, stamp of rates.json) of rate table
+        the snapshot was loaded from
+    """
+    def __init__(self, pairs: Mapping, last_refresh: Optional[str], stamp: tuple):
+        if isinstance(pairs, _TablePairs):
+            self._pairs = pairs
+            self._codes = pairs.codes
+            self._index = MappingProxyType(pairs.index)
+        else:
+            self._pairs = MappingProxyType({pair: MappingProxyType(dict(value)) for pair, value in pairs.items()})
+            self._codes = tuple(pair.split("_")[0] for pair in self._pairs)
+            self._index = MappingProxyType({code: i for i, code in enumerate(self._codes)})
+        self._last_refresh = last_refresh
+        self._stamp = stamp
+        self._currencies = None
+        self._matrix = None
+
+    @property
+    def pairs(self) -> Mapping:
+        return self._pairs
+
+    @property
+    def last_refresh(self) -> Optional[str]:
+        return self._last_refresh
+
+    @property
+    def stamp(self) -> tuple:
+        return self._stamp
+
+    @property
+    def codes(self) -> tuple:
+        return self._codes
+
+    @property
+    def index(self) -> Mapping:
+        return self._index
+
+    @property
+    def matrix(self) -> "np.ndarray":
+        """
+        Cross-rate matrix, matrix[i, j] is the price of codes[i] in codes[j]
+        numpy is imported on first build, single lookups do not need it
+        :return: read-only NxN float64 array
+        """
+        if self._matrix is None:
+            import numpy as np
+
+            if isinstance(self._pairs, _TablePairs):
+                usd_rates = self._pairs.rates()
+            else:
+                usd_rates = np.fromiter(
+                    (self._pairs[f"{code}_{settings.default_base_currency}"]["rate"] for code in self._codes),
+                    dtype=np.float64,
+                    count=len(self._codes),
+                )
+            matrix = usd_rates[:, None] / usd_rates[None, :]
+            matrix.flags.writeable = False
+            self._matrix = matrix
+        return self._matrix
+
+    def code_index(self, code: str) -> int:
+        """
+        Get index of currency in cross-rate matrix
+        :param code: currency code
+        :return: index
+        """
+        try:
+            return self._index[code]
+        except KeyError as e:
+            raise ValueError(f"Курс для {e} не найден в кеше.")
+
+    def cross_rate(self, from_currency: str, to_currency: str) -> float:
+        """
+        Get price of one currency in another
+        :param from_currency: from currency code
+        :param to_currency: to currency code
+        :return: rate
+        """
+        from_index, to_index = self.code_index(from_currency), self.code_index(to_currency)
+        if self._matrix is None:
+            base = settings.default_base_currency
+            return self._pairs[f"{from_currency}_{base}"]["rate"] / self._pairs[f"{to_currency}_{base}"]["rate"]
+        return float(self._matrix[from_index, to_index])
+
+    def rates_in(self, base: str) -> "np.ndarray":
+        """
+        Get prices of all currencies in base currency, ordered as codes
+        :param base: base currency code
+        :return: read-only array of rates
+        """
+        return self.matrix[:, self.code_index(base)]
+
+    def top(self, base: str, k: int) -> list[tuple[str, float]]:
+        """
+        Get k most expensive currencies in base currency
+        :param base: base currency code
+        :param k: number of currencies
+        :return: list of (code, rate) sorted by rate descending
+        """
+        import numpy as np
+
+        column = self.rates_in(base)
+        k = min(k, len(column))
+        if k <= 0:
+            return []
+        if k < len(column):
+            idx = np.argpartition(-column, k - 1)[:k]
+        else:
+            idx = np.arange(len(column))
+        idx = idx[np.lexsort((idx, -column[idx]))]
+        return list(zip([self._codes[i] for i in idx], column[idx].tolist()))
+
+    def is_expired(self, code: str, ttl: Optional[float] = None) -> bool:
+        """
+        Check if rate of currency is older than ttl
+        :param code: currency code
+        :param ttl: ttl in seconds, ttl of source of the rate if None (rates_ttl_by_source or rates_ttl_seconds)
+        :return: True if rate is expired
+        """
+        pair = self._pairs[f"{code}_{settings.default_base_currency}"]
+        updated_at = pair["updated_at"]
+        if ttl is None:
+            ttl = settings.get("rates_ttl_by_source", {}).get(pair.get("source"), settings.rates_ttl_seconds)
+        return datetime.now() - datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S") > timedelta(seconds=ttl)
+
+    def as_dict(self) -> dict:
+        """
+        Get snapshot as dict in rates.json format
+        :return: dict of exchange rates
+        """
+        return {
+            "pairs": {pair: dict(value) for pair, value in self._pairs.items()},
+            "last_refresh": self._last_refresh,
+        }
+
+    def get_currencies(self) -> dict:
+        """
+        Get currencies known by this snapshot
+        :return: dict of currencies
+        """
+        if self._currencies is None:
+            currencies = {}
+            try:
+                for rate in self._pairs:
+                    code = rate.split("_")[0]
+                    currencies[code] = (
+                        FiatCurrency(code, code, "Unknown")
+                        if self._pairs[rate]["source"] == "exchange_rates"
+                        else CryptoCurrency(code, code, "Unknown", -1)
+                    )
+            except KeyError as e:
+                raise ApiRequestError(f"Курс для {e} не найден в кеше.")
+            self._currencies = MappingProxyType(currencies)
+        return dict(self._currencies)
+
+    def exchange(self, from_currency: str, to_currency: str, amount: float) -> float:
+        """
+        Exchange currency
+        :param from_currency: from currency code
+        :param to_currency: to currency code
+        :param amount: amount of currency
+        :return: amount of currency
+        """
+        return (
+            amount
+            * self._pairs[f"{from_currency}_{settings.default_base_currency}"]["rate"]
+            / self._pairs[f"{to_currency}_{settings.default_base_currency}"]["rate"]
+        )
+
+
+class _SnapshotCache:
+    """
+    Process-wide cache of the last loaded RateSnapshot
+    Binary rate table next to rates.json is preferred: it stays mapped and a change is detected by its
+    generation counter. Table is used only if it was published from current rates.json (same inode, size
+    and mtime), rates.json is parsed if there is no usable table or rates.json was changed after it
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._tables = {}
+        self._stale_table = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _count_load(self):
+        if self._snapshot is None:
+            self.misses += 1
+        else:
+            self.reloads += 1
+
+    def _get_from_table(self, rates_path: str, source: tuple) -> Optional[RateSnapshot]:
+        """
+        Get snapshot from binary rate table next to rates.json
+        :param rates_path: path to rates.json
+        :param source: stamp of rates.json
+        :return: snapshot, None if there is no usable table or it was not published from current rates.json
+        """
+        with self._lock:
+            reader = self._tables.get(rates_path)
+            if reader is None:
+                reader = RateTableReader(os.path.join(os.path.dirname(rates_path), "rates.bin"))
+                self._tables[rates_path] = reader
+        path = reader.path
+        generation = reader.generation()
+        if generation is None:
+            return None
+        stamp = (path, generation, source)
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.stamp == stamp:
+                self.hits += 1
+                return self._snapshot
+            if self._stale_table == stamp:
+                return None
+        table = reader.read()
+        if table is None:
+            return None
+        stamp = (path, table["generation"], source)
+        if table["source"] != source:
+            with self._lock:
+                if self._stale_table != stamp:
+                    self._stale_table = stamp
+                    print(f"[WARNING] {path} is older than {rates_path}, rates are read from {rates_path}",
+                          file=sys.stderr)
+            return None
+        with self._lock:
+            self._count_load()
+            self._snapshot = RateSnapshot(_TablePairs(table), table["last_refresh"], stamp)
+            return self._snapshot
+
+    def get(self, path: str) -> RateSnapshot:
+        """
+        Get snapshot for path, reload it only if rate table or file was changed
+        :param path: path to rates.json
+        :return: snapshot
+        """
+        source = file_stamp(path)
+        if source == (0, 0, 0):
+            raise ValueError("Локальный кеш курсов пуст. Выполните 'update_rates', чтобы загрузить данные.")
+        snapshot = self._get_from_table(path, source)
+        if snapshot is not None:
+            return snapshot
+        stamp = (path, *source)
+
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.stamp == stamp:
+                self.hits += 1
+                return self._snapshot
+
+            try:
+                with open(path, "r") as f:
+                    exchange_rates = json.load(f)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                raise ValueError("Локальный кеш курсов пуст. Выполните 'update_rates', чтобы загрузить данные.")
+
+            self._count_load()
+            self._snapshot = RateSnapshot(
+                exchange_rates.get("pairs", {}), exchange_rates.get("last_refresh"), stamp
+            )
+            return self._snapshot
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "reloads": self.reloads}
+
+
+_cache = _SnapshotCache()
+
+
+def get_snapshot() -> RateSnapshot:
+    """
+    Get current snapshot of rates cache
+    :return: snapshot
+    """
+    with metrics.timed("phase.rate_load"):
+        return _cache.get(f"{settings.data_path}/rates.json")
+
+
+def get_cache_stats() -> dict:
+    """
+    Get hit/miss/reload counters of rates cache
+    :return: dict of counters
+    """
+    return _cache.stats()
+
+
+def get_currencies(snapshot: Optional[RateSnapshot] = None) -> dict:
     """
     Get currencies from cache
+    :param snapshot: rates snapshot, current one if not passed
     :return: dict of currencies
     """
-    currencies = {}
-    er = get_exchange_rates()
-    try:
-        for rate in er["pairs"]:
-            currencies[rate.split("_")[0]] = (
-                FiatCurrency(rate.split("_")[0], rate.split("_")[0], "Unknown")
-                if er["pairs"][rate]["source"] == "exchange_rates"
-                else CryptoCurrency(rate.split("_")[0], rate.split("_")[0], "Unknown", -1)
-            )
-    except KeyError as e:
-        raise ApiRequestError(f"Курс для {e} не найден в кеше.")
-    return currencies
+    return (snapshot or get_snapshot()).get_currencies()
 
 
-def get_currency(code: Optional[str]) -> Currency:
+def get_currency(code: Optional[str], snapshot: Optional[RateSnapshot] = None) -> Currency:
     """
     Get currency by code
     :param code: code of currency
+    :param snapshot: rates snapshot, current one if not passed
     :return: currency
     """
-    currencies = get_currencies()
+    currencies = get_currencies(snapshot)
     if code is None:
         code = settings.default_base_currency
 
@@ -95,28 +441,22 @@ def get_exchange_rates() -> dict:
     Get exchange rates from cache
     :return: dict of exchange rates
     """
-    try:
-        with open(f"{settings.data_path}/rates.json", "r") as f:
-            exchange_rates = json.load(f)
-        return exchange_rates
-    except FileNotFoundError:
-        raise ValueError("Локальный кеш курсов пуст. Выполните 'update_rates', чтобы загрузить данные.")
-    except json.decoder.JSONDecodeError:
-        raise ValueError("Локальный кеш курсов пуст. Выполните 'update_rates', чтобы загрузить данные.")
+    return get_snapshot().as_dict()
 
 
-def get_cur_rate(currency: str, base: Optional[str] = None) -> dict:
+def get_cur_rate(currency: str, base: Optional[str] = None, snapshot: Optional[RateSnapshot] = None) -> dict:
     """
     Get currency rate from cache
     :param currency: currency code
     :param base: base currency code
+    :param snapshot: rates snapshot, current one if not passed
     :return: dict of currency rate
     """
-    exchange_rates = get_exchange_rates()
+    snapshot = snapshot or get_snapshot()
     try:
         return {
-            "rate": exchange(currency, base or settings.default_base_currency, 1),
-            "updated_at": exchange_rates["pairs"][
+            "rate": snapshot.exchange(currency, base or settings.default_base_currency, 1),
+            "updated_at": snapshot.pairs[
                 f"{currency}_{settings.default_base_currency}"
             ]["updated_at"],
         }
@@ -124,21 +464,13 @@ def get_cur_rate(currency: str, base: Optional[str] = None) -> dict:
         raise ValueError(f"Курс для {e} не найден в кеше.")
 
 
-def exchange(from_currency: str, to_currency: str, amount: float) -> float:
+def exchange(from_currency: str, to_currency: str, amount: float, snapshot: Optional[RateSnapshot] = None) -> float:
     """
     Exchange currency
     :param from_currency: from currency code
     :param to_currency: to currency code
     :param amount: amount of currency
+    :param snapshot: rates snapshot, current one if not passed
     :return: amount of currency
     """
-    exchange_rates = get_exchange_rates()
-    return (
-        amount
-        * exchange_rates["pairs"][f"{from_currency}_{settings.default_base_currency}"][
-            "rate"
-        ]
-        / exchange_rates["pairs"][f"{to_currency}_{settings.default_base_currency}"][
-            "rate"
-        ]
-    )
+    return (snapshot or get_snapshot()).exchange(from_currency, to_currency, amount)
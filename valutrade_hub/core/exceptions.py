@@ -40,3 +40,16 @@ class ApiRequestError(Exception):
 
     def __str__(self):
         return self.msg
+
+
+class ConcurrentUpdateError(Exception):
+    """
+    Exception for record changed by another writer after it was read
+    """
+    def __init__(self, record: str, msg="Запись {record} изменена другим процессом, повторите операцию"):
+        self.record = record
+        self.msg = msg.format(record=record)
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return self.msg
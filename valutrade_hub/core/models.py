@@ -1,7 +1,7 @@
-from copy import deepcopy
 from datetime import datetime
 from hashlib import sha256
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 from .exceptions import InsufficientFundsError
 
@@ -15,6 +15,8 @@ class User:
     :param hashed_password: hashed password
     :param salt: salt
     """
+    __slots__ = ("_user_id", "_username", "_hashed_password", "_salt", "_registration_date")
+
     def __init__(
         self,
         user_id: int,
@@ -99,6 +101,8 @@ class Wallet:
     :param currency_code: currency code
     :param balance: balance
     """
+    __slots__ = ("currency_code", "_balance")
+
     def __init__(self, currency_code: str, balance: float):
         self.currency_code = currency_code
         self._balance = balance
@@ -159,10 +163,15 @@ class Portfolio:
     Portfolio class
     :param user_id: user id
     :param wallets: wallets
+    :param version: version of stored record the portfolio was loaded from, 0 for new portfolio
     """
-    def __init__(self, user_id: int, wallets: dict[str, Wallet]):
+    __slots__ = ("_user_id", "_wallets", "_wallets_view", "version")
+
+    def __init__(self, user_id: int, wallets: dict[str, Wallet], version: int = 0):
         self._user_id = user_id
         self._wallets = wallets
+        self._wallets_view = MappingProxyType(wallets)
+        self.version = version
 
     def add_currency(self, currency_code: str):
         """
@@ -215,5 +224,10 @@ class Portfolio:
         return self._user_id
 
     @property
-    def wallets(self) -> dict[str, Wallet]:
-        return deepcopy(self._wallets)
+    def wallets(self) -> Mapping[str, Wallet]:
+        """
+        Read-only view of wallets, not a copy: it follows later changes of portfolio
+        Use add_currency and get_wallet to change portfolio
+        :return: mapping of currency code to wallet
+        """
+        return self._wallets_view
@@ -0,0 +1,465 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterator, Mapping, Optional
+
+from ..infra.database import after_commit, get_connection, get_meta, next_sequence_value, set_meta, transaction
+from ..infra.settings import SettingsLoader
+from ..metrics import metrics
+from .exceptions import ConcurrentUpdateError
+from .models import Portfolio, User, Wallet
+
+settings = SettingsLoader("data/config.json")
+
+
+class UserRepository(ABC):
+    """
+    Interface for user storages
+    """
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[User]:
+        pass
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[User]:
+        pass
+
+    @abstractmethod
+    def add(self, username: str, hashed_password: str, salt: str) -> User:
+        pass
+
+    @abstractmethod
+    def save(self, user: User) -> None:
+        pass
+
+    @abstractmethod
+    def all(self) -> Iterator[User]:
+        pass
+
+
+class SqliteUserRepository(UserRepository):
+    """
+    User storage in local SQLite database
+    Usernames are looked up through unique index, ids are taken from monotonic sequence
+    """
+    COLUMNS = "user_id, username, registration_date, salt, hashed_password"
+    _migrated = False
+
+    def _connection(self):
+        connection = get_connection()
+        if not self._migrated:
+            if get_meta(connection, "users_migrated") is None:
+                self.migrate_from_json(f"{settings.data_path}/users.json")
+            self._migrated = True
+        return connection
+
+    @staticmethod
+    def _user(row) -> Optional[User]:
+        if row is None:
+            return None
+        user_id, username, registration_date, salt, hashed_password = row
+        return User(user_id, username, registration_date, hashed_password, salt)
+
+    def get(self, user_id: int) -> Optional[User]:
+        """
+        Get user by id
+        :param user_id: user id
+        :return: user or None
+        """
+        return self._user(
+            self._connection().execute(f"SELECT {self.COLUMNS} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        )
+
+    def get_by_username(self, username: str) -> Optional[User]:
+        """
+        Get user by username through username index
+        :param username: username
+        :return: user or None
+        """
+        with metrics.timed("phase.user_load"):
+            return self._user(
+                self._connection().execute(
+                    f"SELECT {self.COLUMNS} FROM users WHERE username = ?", (username,)
+                ).fetchone()
+            )
+
+    def add(self, username: str, hashed_password: str, salt: str) -> User:
+        """
+        Add new user with next id from sequence
+        :param username: username
+        :param hashed_password: hashed password
+        :param salt: salt
+        :return: new user
+        """
+        self._connection()
+        try:
+            with transaction() as connection:
+                user = User(next_sequence_value(connection, "user_id"), username, None, hashed_password, salt)
+                self._write(connection, user)
+        except sqlite3.IntegrityError:
+            raise ValueError("Username already exists")
+        return user
+
+    def save(self, user: User) -> None:
+        """
+        Save user
+        :param user: user
+        :return: None
+        """
+        self._connection()
+        with transaction() as connection:
+            self._write(connection, user)
+
+    @classmethod
+    def _write(cls, connection, user: User) -> None:
+        info = user.get_user_info()
+        connection.execute(
+            f"INSERT INTO users ({cls.COLUMNS}) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, "
+            "registration_date = excluded.registration_date, salt = excluded.salt, "
+            "hashed_password = excluded.hashed_password",
+            (info["user_id"], info["username"], info["registration_date"], info["salt"], info["hashed_password"]),
+        )
+
+    def all(self) -> Iterator[User]:
+        """
+        Iterate over all users
+        :return: iterator of users
+        """
+        for row in self._connection().execute(f"SELECT {self.COLUMNS} FROM users ORDER BY user_id"):
+            yield self._user(row)
+
+    def check_index(self) -> list[str]:
+        """
+        Check consistency of username index and id sequence
+        :return: list of found problems, empty if everything is consistent
+        """
+        connection = self._connection()
+        problems = []
+        for (message,) in connection.execute("PRAGMA integrity_check"):
+            if message != "ok":
+                problems.append(f"integrity: {message}")
+        indexed = connection.execute(
+            "SELECT COUNT(*) FROM users INDEXED BY users_username_idx WHERE username IS NOT NULL"
+        ).fetchone()[0]
+        total = connection.execute("SELECT COUNT(*) FROM users NOT INDEXED").fetchone()[0]
+        if indexed != total:
+            problems.append(f"username index has {indexed} entries, users table has {total} rows")
+        for username, count in connection.execute(
+            "SELECT username, COUNT(*) FROM users NOT INDEXED GROUP BY username HAVING COUNT(*) > 1"
+        ):
+            problems.append(f"username '{username}' is used by {count} users")
+        max_id = connection.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]
+        sequence = connection.execute("SELECT value FROM sequences WHERE name = 'user_id'").fetchone()
+        if max_id and (sequence is None or sequence[0] < max_id):
+            problems.append(f"user_id sequence {sequence[0] if sequence else None} is behind max user_id {max_id}")
+        return problems
+
+    def rebuild_index(self) -> None:
+        """
+        Rebuild username index and move id sequence past max user id
+        :return: None
+        """
+        self._connection()
+        with transaction() as connection:
+            connection.execute("REINDEX users_username_idx")
+            max_id = connection.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]
+            connection.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('user_id', 0)")
+            connection.execute(
+                "UPDATE sequences SET value = MAX(value, ?) WHERE name = 'user_id'", (max_id,)
+            )
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        One-shot migration of legacy users.json into database
+        Legacy file is renamed to <json_path>.migrated afterwards
+        :param json_path: path to users.json
+        :return: number of migrated users
+        """
+        try:
+            with open(json_path, "r") as f:
+                users_json = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            users_json = []
+
+        with transaction() as connection:
+            if get_meta(connection, "users_migrated") is not None:
+                return 0
+            for user in users_json:
+                self._write(connection, User(**user))
+            max_id = max([user["user_id"] for user in users_json], default=0)
+            connection.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('user_id', 0)")
+            connection.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'user_id'", (max_id,))
+            set_meta(connection, "users_migrated", "1")
+        if users_json:
+            os.replace(json_path, json_path + ".migrated")
+        return len(users_json)
+
+
+class PortfolioRepository(ABC):
+    """
+    Interface for portfolio storages
+    """
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        pass
+
+    @abstractmethod
+    def save(self, portfolio: Portfolio) -> None:
+        pass
+
+    @abstractmethod
+    def all(self) -> Iterator[Portfolio]:
+        pass
+
+    @abstractmethod
+    def balance_rows(self, code_index: Mapping[str, int]) -> Iterator[tuple[int, int, float]]:
+        pass
+
+    @abstractmethod
+    def currency_codes(self) -> list[str]:
+        pass
+
+
+class SqlitePortfolioRepository(PortfolioRepository):
+    """
+    Portfolio storage in local SQLite database
+    Every call touches only wallets of one user. Every portfolio has version which is checked and
+    incremented on save (compare-and-swap), so a portfolio changed by another writer after it was read
+    is not overwritten
+    Optional write-through cache keeps balances of recently used portfolios in memory, see enable_cache
+    """
+    _migrated = False
+
+    def __init__(self):
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def enable_cache(self, size: int) -> None:
+        """
+        Keep balances of up to size recently used portfolios in memory
+        Cache is filled and read only outside of transactions and updated after commit.
+        Cached balances are used only if version stored in database is still the cached one,
+        so writes of other processes are seen at the cost of one primary key lookup
+        :param size: max number of cached portfolios, 0 disables cache
+        :return: None
+        """
+        with self._cache_lock:
+            self._cache_size = size
+            self._cache.clear()
+
+    def _cache_get(self, user_id: int, version: int) -> Optional[Portfolio]:
+        """
+        Get cached portfolio of given version
+        :param user_id: user id
+        :param version: version stored in database
+        :return: portfolio or None if it is not cached or cached version differs
+        """
+        with self._cache_lock:
+            entry = self._cache.get(user_id)
+            if entry is None or entry[0] != version:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(user_id)
+            self.cache_hits += 1
+        return Portfolio(user_id, {code: Wallet(code, balance) for code, balance in entry[1]}, version)
+
+    def _cache_put(self, user_id: int, entry: tuple, generation: Optional[int] = None) -> None:
+        """
+        Put version and balances of portfolio into cache
+        A read is not cached if any write happened meanwhile, it might be older than that write
+        :param user_id: user id
+        :param entry: (version, tuple of (currency code, balance))
+        :param generation: generation seen before balances were read from database, None for committed writes
+        :return: None
+        """
+        with self._cache_lock:
+            if not self._cache_size or (generation is not None and generation != self._cache_generation):
+                return
+            if generation is None:
+                self._cache_generation += 1
+            self._cache[user_id] = entry
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_evict(self, user_id: int) -> None:
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cache.pop(user_id, None)
+
+    def _connection(self):
+        connection = get_connection()
+        if not self._migrated:
+            if get_meta(connection, "portfolios_migrated") is None:
+                self.migrate_from_json(f"{settings.data_path}/portfolios.json")
+            self._migrated = True
+        return connection
+
+    def get(self, user_id: int) -> Optional[Portfolio]:
+        """
+        Get portfolio of user
+        :param user_id: user id
+        :return: portfolio or None if user has no portfolio
+        """
+        with metrics.timed("phase.portfolio_load"):
+            connection = self._connection()
+            cacheable = self._cache_size and not connection.in_transaction
+            if cacheable:
+                generation = self._cache_generation
+            row = connection.execute("SELECT version FROM portfolios WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            if cacheable:
+                portfolio = self._cache_get(user_id, row[0])
+                if portfolio is not None:
+                    return portfolio
+            balances = tuple(
+                connection.execute("SELECT currency_code, balance FROM wallets WHERE user_id = ?", (user_id,))
+            )
+            if cacheable:
+                self._cache_put(user_id, (row[0], balances), generation)
+            return Portfolio(user_id, {code: Wallet(code, balance) for code, balance in balances}, row[0])
+
+    def save(self, portfolio: Portfolio) -> None:
+        """
+        Save portfolio of one user if it was not changed since it was read, version of portfolio is incremented
+        :param portfolio: portfolio
+        :raises ConcurrentUpdateError: if stored version differs from version of portfolio
+        :return: None
+        """
+        self._connection()
+        if self._cache_size:
+            self._cache_evict(portfolio.user)
+        with metrics.timed("phase.persist"), transaction() as connection:
+            if portfolio.version == 0:
+                connection.execute(
+                    "INSERT OR IGNORE INTO portfolios (user_id, version) VALUES (?, 0)", (portfolio.user,)
+                )
+            updated = connection.execute(
+                "UPDATE portfolios SET version = version + 1 WHERE user_id = ? AND version = ?",
+                (portfolio.user, portfolio.version),
+            ).rowcount
+            if not updated:
+                raise ConcurrentUpdateError(f"portfolio {portfolio.user}")
+            self._write(connection, portfolio)
+            portfolio.version += 1
+            if self._cache_size:
+                entry = (portfolio.version, tuple((code, wallet.balance) for code, wallet in portfolio.wallets.items()))
+                after_commit(lambda: self._cache_put(portfolio.user, entry))
+
+    @staticmethod
+    def _write(connection, portfolio: Portfolio) -> None:
+        connection.execute("INSERT OR IGNORE INTO portfolios (user_id) VALUES (?)", (portfolio.user,))
+        connection.executemany(
+            "INSERT INTO wallets (user_id, currency_code, balance) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id, currency_code) DO UPDATE SET balance = excluded.balance",
+            [(portfolio.user, code, wallet.balance) for code, wallet in portfolio.wallets.items()],
+        )
+
+    def all(self) -> Iterator[Portfolio]:
+        """
+        Iterate over all portfolios
+        :return: iterator of portfolios
+        """
+        connection = self._connection()
+        rows = connection.execute(
+            "SELECT p.user_id, p.version, w.currency_code, w.balance FROM portfolios p "
+            "LEFT JOIN wallets w ON w.user_id = p.user_id ORDER BY p.user_id"
+        )
+        current_id, current_version, wallets = None, 0, {}
+        for user_id, version, code, balance in rows:
+            if user_id != current_id:
+                if current_id is not None:
+                    yield Portfolio(current_id, wallets, current_version)
+                current_id, current_version, wallets = user_id, version, {}
+            if code is not None:
+                wallets[code] = Wallet(code, balance)
+        if current_id is not None:
+            yield Portfolio(current_id, wallets, current_version)
+
+    def balance_rows(self, code_index: Mapping[str, int]) -> Iterator[tuple[int, int, float]]:
+        """
+        Iterate over all wallets as numeric rows in one table scan
+        Currency codes are mapped to indexes while rows are read, so they can be loaded straight into arrays.
+        Mapping is not done in SQL: a CASE with parameters per code would exceed parameter limit of SQLite
+        for large currency sets
+        :param code_index: index of every known currency code
+        :return: iterator of (user_id, currency index, balance), currency index is -1 for unknown codes
+        """
+        rows = self._connection().execute("SELECT user_id, currency_code, balance FROM wallets")
+        return ((user_id, code_index.get(code, -1), balance) for user_id, code, balance in rows)
+
+    def currency_codes(self) -> list[str]:
+        """
+        Get codes of all currencies held in wallets
+        :return: sorted list of currency codes
+        """
+        return [
+            code for (code,) in self._connection().execute(
+                "SELECT DISTINCT currency_code FROM wallets ORDER BY currency_code"
+            )
+        ]
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        One-shot migration of legacy portfolios.json into database
+        Legacy file is renamed to <json_path>.migrated afterwards
+        :param json_path: path to portfolios.json
+        :return: number of migrated portfolios
+        """
+        try:
+            with open(json_path, "r") as f:
+                portfolios_json = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            portfolios_json = []
+
+        with transaction() as connection:
+            if get_meta(connection, "portfolios_migrated") is not None:
+                return 0
+            for portfolio in portfolios_json:
+                wallets = {
+                    code: Wallet(code, wallet["balance"]) for code, wallet in portfolio["wallets"].items()
+                }
+                self._write(connection, Portfolio(portfolio["user_id"], wallets))
+            set_meta(connection, "portfolios_migrated", "1")
+        if portfolios_json:
+            os.replace(json_path, json_path + ".migrated")
+        return len(portfolios_json)
+
+
+user_repository = SqliteUserRepository()
+portfolio_repository = SqlitePortfolioRepository()
+
+
+def main():
+    """
+    Maintenance of user index: check or rebuild
+    Usage: python -m valutrade_hub.core.repositories check|rebuild
+    :return: None
+    """
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "rebuild":
+        user_repository.rebuild_index()
+        print("Username index rebuilt")
+    elif command != "check":
+        print(f"Unknown command {command}, use check or rebuild")
+        sys.exit(2)
+    problems = user_repository.check_index()
+    for problem in problems:
+        print(f"[ERROR] {problem}")
+    if problems:
+        sys.exit(1)
+    print("Username index is consistent")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,99 @@
 import datetime
+import json
+import os
 import string
-from random import choice
-from typing import Optional
-
-from valutrade_hub.core.exceptions import InsufficientFundsError
+import sys
+import time
+from contextvars import ContextVar
+from random import choice, uniform
+from typing import TYPE_CHECKING, Callable, Optional
+
+from valutrade_hub.core.exceptions import (
+    ApiRequestError,
+    ConcurrentUpdateError,
+    CurrencyNotFoundError,
+    InsufficientFundsError,
+)
 
 from ..decorators import log_action
+from ..infra.database import transaction
 from ..infra.settings import SettingsLoader
-from ..parser_service.updater import RatesUpdater
-from .currencies import exchange, get_cur_rate, get_currency, get_exchange_rates
+from ..log_writer import get_log_writer
+from ..metrics import metrics
+from ..parser_service.history import (
+    get_bars,
+    get_rate_at,
+    get_rates_between,
+    iter_history,
+    parse_timestamp,
+    write_history,
+)
+from .currencies import Currency, exchange, get_cache_stats, get_cur_rate, get_currency, get_snapshot
 from .models import Portfolio, User
 from .utils import (
-    get_portfolios,
-    get_users,
-    save_portfolios,
-    save_users,
+    add_user,
+    get_portfolio,
+    get_user,
+    get_user_by_username,
+    save_portfolio,
 )
 
-session_user_id = None
+if TYPE_CHECKING:
+    from ..parser_service.updater import RatesUpdater
+
+session_user_id: ContextVar[Optional[int]] = ContextVar("session_user_id", default=None)
+rates_updater = None
+rates_scheduler = None
 
 settings = SettingsLoader("data/config.json")
 
 
+def get_session_user_id() -> Optional[int]:
+    """
+    Get id of user logged in in current session
+    Session is kept in context variable, so every context (REPL, script, server connection) has its own
+    :return: user id or None
+    """
+    return session_user_id.get()
+
+
+def set_session_user_id(user_id: Optional[int]) -> None:
+    """
+    Set id of user logged in in current session
+    :param user_id: user id or None to log out
+    :return: None
+    """
+    session_user_id.set(user_id)
+
+
+def _get_rates_updater() -> "RatesUpdater":
+    """
+    Get rates updater shared by the process
+    Updater and its http clients are imported on first use to keep startup fast
+    :return: rates updater
+    """
+    global rates_updater
+    if rates_updater is None:
+        from ..parser_service.updater import RatesUpdater
+
+        rates_updater = RatesUpdater()
+    return rates_updater
+
+
+def _check_rates_fresh(snapshot, *codes: str) -> None:
+    """
+    Refuse to trade on expired rates when background refresher is running or strict_rates_ttl is set
+    :param snapshot: rates snapshot
+    :param codes: currency codes
+    :return: None
+    """
+    if not settings.get("strict_rates_ttl", False) and not (rates_scheduler and rates_scheduler.is_running()):
+        return
+    for code in codes:
+        if snapshot.is_expired(code):
+            raise ApiRequestError(f"Курс {code} устарел, дождитесь обновления курсов")
+
+
 @log_action
 def register(username: str, password: str) -> None:
     """
@@ -30,29 +102,24 @@ def register(username: str, password: str) -> None:
     :param password: password
     :return: None
     """
-    users = get_users()
-    for user_id in users:
-        if users[user_id].username == username:
-            raise ValueError("Username already exists")
-    user_id = max(users) + 1
-    user = User(user_id, username)
-    portfolios = get_portfolios()
-    portfolio = Portfolio(user_id, {})
-    portfolio.add_currency(settings.default_base_currency)
-    portfolio.get_wallet(settings.default_base_currency).deposit(1000)
-    portfolios[user_id] = portfolio
-    save_portfolios(portfolios)
+    if get_user_by_username(username) is not None:
+        raise ValueError("Username already exists")
     salt = "".join(
         [
             choice(string.ascii_letters + string.digits + string.punctuation)
             for _ in range(10)
         ]
     )
+    user = User(0, username)
     if not user.change_password(password, salt):
         raise ValueError("Password should be longer then 4 characters")
 
-    users[user_id] = user
-    save_users(users)
+    with transaction():
+        user = add_user(username, user.hashed_password, user.salt)
+        portfolio = Portfolio(user.user_id, {})
+        portfolio.add_currency(settings.default_base_currency)
+        portfolio.get_wallet(settings.default_base_currency).deposit(1000)
+        save_portfolio(portfolio)
 
 
 @log_action
@@ -63,17 +130,13 @@ def login(username: str, password: str) -> None:
     :param password: password
     :return: None
     """
-    global session_user_id
-    if session_user_id:
+    if get_session_user_id():
         raise ValueError("You are already logged in")
 
-    users = get_users()
-    for user_id in users:
-        if users[user_id].username == username and users[user_id].verify_password(
-            password
-        ):
-            session_user_id = user_id
-            return
+    user = get_user_by_username(username)
+    if user is not None and user.verify_password(password):
+        set_session_user_id(user.user_id)
+        return
 
     raise ValueError("Invalid username or password")
 
@@ -84,72 +147,133 @@ def show_portfolio(base_currency: Optional[str] = None) -> None:
     :param base_currency: base currency
     :return: None
     """
-    if not session_user_id:
+    user_id = get_session_user_id()
+    if not user_id:
         raise ValueError("You are not logged in")
 
-    base_currency_object = get_currency(base_currency)
+    snapshot = get_snapshot()
+    base_currency_object = get_currency(base_currency, snapshot)
 
-    portfolios = get_portfolios()
-    if session_user_id not in portfolios:
+    portfolio = get_portfolio(user_id)
+    if portfolio is None:
         raise ValueError("You have no portfolio")
 
-    portfolio = portfolios[session_user_id]
-
     for wallet in portfolio.wallets.values():
         print(
             wallet.balance,
             wallet.currency_code,
             "->",
-            exchange(wallet.currency_code, base_currency_object.name, wallet.balance),
+            exchange(wallet.currency_code, base_currency_object.name, wallet.balance, snapshot),
             base_currency_object.code,
         )
 
 
-@log_action
-def buy(currency: str, amount: float) -> None:
+def _validate_order(side: str, currency: str, amount: float, snapshot) -> Currency:
     """
-    Buy currency for current user
+    Validate buy/sell order against rates snapshot
+    :param side: buy or sell
     :param currency: currency code
     :param amount: amount of currency
-    :return: None
+    :param snapshot: rates snapshot
+    :return: currency object
     """
-    if not session_user_id:
-        raise ValueError("You are not logged in")
+    if side not in ("buy", "sell"):
+        raise ValueError(f"Unknown order side {side}")
 
-    currency_object = get_currency(currency)
+    currency_object = get_currency(currency, snapshot)
 
     if currency_object.code == settings.default_base_currency:
-        raise ValueError("You cannot buy the base currency")
+        raise ValueError(f"You cannot {side} the base currency")
+    _check_rates_fresh(snapshot, currency_object.code, settings.default_base_currency)
 
-    if amount <= 0:
+    if amount < 0 or (side == "buy" and amount == 0):
         raise ValueError("Amount cannot be negative")
+    return currency_object
+
 
-    portfolios = get_portfolios()
-    if session_user_id not in portfolios:
-        portfolio = Portfolio(session_user_id, {})
-        portfolios[session_user_id] = portfolio
+def _apply_order(portfolio: Portfolio, side: str, currency_object: Currency, amount: float, snapshot) -> None:
+    """
+    Apply validated buy/sell order to portfolio in memory
+    :param portfolio: portfolio
+    :param side: buy or sell
+    :param currency_object: currency
+    :param amount: amount of currency
+    :param snapshot: rates snapshot
+    :return: None
+    """
+    if side == "buy":
+        if currency_object.code not in portfolio.wallets:
+            portfolio.add_currency(currency_object.code)
+        portfolio.get_wallet(settings.default_base_currency).withdraw(
+            exchange(currency_object.code, settings.default_base_currency, amount, snapshot)
+        )
+        portfolio.get_wallet(currency_object.code).deposit(amount)
     else:
-        portfolio = portfolios[session_user_id]
+        if currency_object.code not in portfolio.wallets:
+            raise InsufficientFundsError(
+                available_funds=0,
+                required_funds=amount,
+                code=currency_object.code,
+            )
+        portfolio.get_wallet(currency_object.code).withdraw(amount)
+        portfolio.get_wallet(settings.default_base_currency).deposit(
+            exchange(currency_object.code, settings.default_base_currency, amount, snapshot)
+        )
+
+
+def _update_portfolio(user_id: int, apply: Callable[[Portfolio], None]) -> tuple[Portfolio, dict[str, float]]:
+    """
+    Load portfolio, apply changes and save it with compare-and-swap on version
+    If another writer saved portfolio in between, changes are applied again to fresh portfolio
+    after short random backoff, up to portfolio_update_retries times
+    :param user_id: user id
+    :param apply: function changing portfolio in memory
+    :return: saved portfolio and balances before changes
+    """
+    retries = settings.get("portfolio_update_retries", 10)
+    for attempt in range(retries + 1):
+        portfolio = get_portfolio(user_id) or Portfolio(user_id, {})
+        before = {code: wallet.balance for code, wallet in portfolio.wallets.items()}
+        apply(portfolio)
+        try:
+            save_portfolio(portfolio)
+            return portfolio, before
+        except ConcurrentUpdateError:
+            if attempt == retries:
+                raise
+            with metrics.timed("phase.conflict_backoff"):
+                time.sleep(uniform(0, min(0.05, 0.001 * 2 ** attempt)))
 
-    if currency_object.code not in portfolio.wallets:
-        portfolio.add_currency(currency_object.code)
 
-    before_amount = portfolio.get_wallet(currency_object.code).balance
-    portfolio.get_wallet(settings.default_base_currency).withdraw(
-        exchange(currency_object.code, settings.default_base_currency, amount)
+@log_action
+def buy(currency: str, amount: float) -> None:
+    """
+    Buy currency for current user
+    :param currency: currency code
+    :param amount: amount of currency
+    :return: None
+    """
+    user_id = get_session_user_id()
+    if not user_id:
+        raise ValueError("You are not logged in")
+
+    snapshot = get_snapshot()
+    currency_object = _validate_order("buy", currency, amount, snapshot)
+
+    portfolio, before = _update_portfolio(
+        user_id, lambda portfolio: _apply_order(portfolio, "buy", currency_object, amount, snapshot)
     )
-    portfolio.get_wallet(currency_object.code).deposit(amount)
+
     print(
         f"Покупка выполнена: {amount} {currency_object.code} по курсу "
-        f"{get_cur_rate(currency_object.code)['rate']} USD/{currency_object.code}"
+        f"{get_cur_rate(currency_object.code, snapshot=snapshot)['rate']} USD/{currency_object.code}"
     )
     print("Изменения в портфеле:")
     print(
-        f"- {currency_object.code}: было {before_amount} → стало {portfolio.get_wallet(currency_object.code).balance}"
+        f"- {currency_object.code}: было {before.get(currency_object.code, 0)} → "
+        f"стало {portfolio.get_wallet(currency_object.code).balance}"
     )
 
-    save_portfolios(portfolios)
-
 
 @log_action
 def sell(currency: str, amount: float) -> None:
@@ -159,46 +283,89 @@ def sell(currency: str, amount: float) -> None:
     :param amount: amount of currency
     :return: None
     """
-    if not session_user_id:
+    user_id = get_session_user_id()
+    if not user_id:
         raise ValueError("You are not logged in")
 
-    currency_object = get_currency(currency)
-
-    if currency_object.code == settings.default_base_currency:
-        raise ValueError("You cannot sell the base currency")
-
-    if amount < 0:
-        raise ValueError("Amount cannot be negative")
-
-    portfolios = get_portfolios()
-    if session_user_id not in portfolios:
-        portfolio = Portfolio(session_user_id, {})
-        portfolios[session_user_id] = portfolio
-    else:
-        portfolio = portfolios[session_user_id]
-
-    if currency_object.code not in portfolio.wallets:
-        raise InsufficientFundsError(
-            available_funds=0,
-            required_funds=amount,
-            code=currency_object.code,
-        )
+    snapshot = get_snapshot()
+    currency_object = _validate_order("sell", currency, amount, snapshot)
 
-    before_amount = portfolio.get_wallet(currency_object.code).balance
-    portfolio.get_wallet(currency_object.code).withdraw(amount)
-    portfolio.get_wallet(settings.default_base_currency).deposit(
-        exchange(currency_object.code, settings.default_base_currency, amount)
+    portfolio, before = _update_portfolio(
+        user_id, lambda portfolio: _apply_order(portfolio, "sell", currency_object, amount, snapshot)
     )
+
     print(
         f"Продажа выполнена: {amount} {currency_object.code} по курсу "
-        f"{get_cur_rate(currency_object.code)['rate']} USD/{currency_object.code}"
+        f"{get_cur_rate(currency_object.code, snapshot=snapshot)['rate']} USD/{currency_object.code}"
     )
     print("Изменения в портфеле:")
     print(
-        f"- {currency_object.code}: было {before_amount} → стало {portfolio.get_wallet(currency_object.code).balance}"
+        f"- {currency_object.code}: было {before.get(currency_object.code, 0)} → "
+        f"стало {portfolio.get_wallet(currency_object.code).balance}"
     )
 
-    save_portfolios(portfolios)
+
+def parse_orders(text: str) -> list[tuple[str, str, float]]:
+    """
+    Parse orders separated by new lines or semicolons
+    Every order is "<buy|sell> <currency> <amount>", empty lines and lines starting with # are skipped
+    :param text: orders
+    :return: list of (side, currency, amount)
+    """
+    orders = []
+    for line in text.replace(";", "\n").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) != 3:
+            raise ValueError(f"Order '{line}' must be in format '<buy|sell> <currency> <amount>'")
+        try:
+            amount = float(parts[2])
+        except ValueError:
+            raise ValueError(f"Amount of order '{line}' must be of type float")
+        orders.append((parts[0].lower(), parts[1].upper(), amount))
+    return orders
+
+
+@log_action
+def batch(orders: list[tuple[str, str, float]]) -> None:
+    """
+    Execute many buy/sell orders for current user all-or-nothing
+    All orders use one rates snapshot and are saved at once
+    :param orders: list of (side, currency, amount)
+    :return: None
+    """
+    user_id = get_session_user_id()
+    if not user_id:
+        raise ValueError("You are not logged in")
+    if not orders:
+        raise ValueError("No orders to execute")
+
+    snapshot = get_snapshot()
+    validated = []
+    for i, (side, currency, amount) in enumerate(orders, start=1):
+        try:
+            validated.append((side, _validate_order(side, currency, amount, snapshot), amount))
+        except (ValueError, CurrencyNotFoundError, ApiRequestError) as e:
+            raise ValueError(f"Order {i} ({side} {currency} {amount}): {e}")
+
+    def apply(portfolio: Portfolio) -> None:
+        for i, (side, currency_object, amount) in enumerate(validated, start=1):
+            try:
+                _apply_order(portfolio, side, currency_object, amount, snapshot)
+            except (ValueError, InsufficientFundsError) as e:
+                raise ValueError(
+                    f"Order {i} ({side} {currency_object.code} {amount}): {e}. No orders were executed"
+                )
+
+    portfolio, before = _update_portfolio(user_id, apply)
+
+    print(f"Пакет выполнен: {len(validated)} ордеров")
+    print("Изменения в портфеле:")
+    for code, wallet in portfolio.wallets.items():
+        if before.get(code, 0) != wallet.balance:
+            print(f"- {code}: было {before.get(code, 0)} → стало {wallet.balance}")
 
 
 def get_rate(from_currency: str, to_currency: str) -> None:
@@ -208,17 +375,18 @@ def get_rate(from_currency: str, to_currency: str) -> None:
     :param to_currency: to currency code
     :return: None
     """
-    from_currency_object = get_currency(from_currency)
-    to_currency_object = get_currency(to_currency)
+    snapshot = get_snapshot()
+    from_currency_object = get_currency(from_currency, snapshot)
+    to_currency_object = get_currency(to_currency, snapshot)
 
     print(
         f"Курс {from_currency_object.code}→{to_currency_object.code}: "
-        f"{get_cur_rate(from_currency_object.code)['rate']/get_cur_rate(to_currency_object.code)['rate']}"
-        f" ({get_cur_rate(from_currency_object.code)['rate']})"
+        f"{snapshot.cross_rate(from_currency_object.code, to_currency_object.code)}"
+        f" ({snapshot.cross_rate(from_currency_object.code, settings.default_base_currency)})"
     )
     print(
         f"Обратный курс {to_currency_object.code}→{from_currency_object.code}: "
-        f"{get_cur_rate(to_currency_object.code)['rate']/get_cur_rate(from_currency_object.code)['rate']}"
+        f"{snapshot.cross_rate(to_currency_object.code, from_currency_object.code)}"
     )
 
 
@@ -236,6 +404,14 @@ def help_show() -> None:
     print("get_rate --from_cur <currency> --to_cur <currency>")
     print("update_rates --source <source>")
     print("show_rates --currency <currency> --top <number> --base <currency>")
+    print("rate_at --pair <pair> --at <timestamp> | --from <timestamp> --to <timestamp>")
+    print("history --pair <pair> --interval <1m|1h|1d> --from <timestamp> --to <timestamp> --limit <number>")
+    print("export_history --format <csv|jsonl> --output <path> --pair <pair> --from <timestamp> --to <timestamp>")
+    print("replay_history --pair <pair> --from <timestamp> --to <timestamp> --speed <number>")
+    print("batch --orders \"buy BTC 0.1; sell ETH 2\" | --file <path>")
+    print("updater_status")
+    print("stats --export <path>")
+    print("leaderboard --top <number> --base <currency> --export <path.csv|path.json>")
     print("exit")
     print("help")
 
@@ -246,12 +422,87 @@ def update_rates(source: Optional[str] = None) -> None:
     :param source: source of rates
     :return: None
     """
-    rates_updater = RatesUpdater()
     print("Updating rates...")
-    rates_updater.run_update(source)
+    _get_rates_updater().run_update(source)
     print("Rates updated")
 
 
+def start_rates_refresher() -> None:
+    """
+    Start background refresher of rates cache
+    :return: None
+    """
+    global rates_scheduler
+    if rates_scheduler is None:
+        from ..parser_service.scheduler import RatesScheduler
+
+        rates_scheduler = RatesScheduler(_get_rates_updater())
+    rates_scheduler.start()
+
+
+def updater_status() -> None:
+    """
+    Show metrics of background refresher
+    :return: None
+    """
+    if rates_scheduler is None or not rates_scheduler.is_running():
+        print("Background refresher is not running")
+        return
+    from ..parser_service.scheduler import format_metrics
+
+    print(format_metrics(rates_scheduler.metrics()))
+
+
+def show_stats(export: Optional[str] = None) -> None:
+    """
+    Show latency percentiles of commands and their phases
+    :param export: path to write metrics in Prometheus text format
+    :return: None
+    """
+    print(metrics.format_stats())
+    cache = get_cache_stats()
+    print(f"Кеш курсов: hits={cache['hits']} misses={cache['misses']} reloads={cache['reloads']}")
+    log_stats = get_log_writer().stats()
+    print("Лог: " + " ".join(f"{k}={v}" for k, v in log_stats.items()))
+    if export:
+        try:
+            metrics.export_prometheus(export)
+        except OSError as e:
+            raise ValueError(f"Cannot write metrics to {export}: {e}")
+        print(f"Метрики сохранены в {export}")
+
+
+def leaderboard(top: Optional[int] = None, base: Optional[str] = None, export: Optional[str] = None) -> None:
+    """
+    Show most valuable portfolios of all users
+    :param top: number of portfolios, 10 if None
+    :param base: base currency code
+    :param export: path to write values of all portfolios, .csv or .json
+    :return: None
+    """
+    from .valuation import value_portfolios
+
+    top = 10 if top is None else top
+    if top <= 0:
+        raise ValueError("Argument --top must be positive")
+    snapshot = get_snapshot()
+    base_currency_object = get_currency(base, snapshot)
+
+    valuation = value_portfolios(base_currency_object.code, snapshot)
+    leaders = valuation.top(top)
+    print(f"Топ-{len(leaders)} портфелей из {len(valuation)} в {valuation.base}:")
+    for place, (user_id, total) in enumerate(leaders, start=1):
+        user = get_user(user_id)
+        print(f"{place}. {user.username if user else user_id}: {total:.2f} {valuation.base}")
+
+    if export:
+        try:
+            valuation.export(export)
+        except OSError as e:
+            raise ValueError(f"Cannot write valuation to {export}: {e}")
+        print(f"Оценка портфелей сохранена в {export}")
+
+
 def show_rates(currency: Optional[str], top: Optional[int], base: Optional[str]) -> None:
     """
     Show rates from last update of cache
@@ -260,63 +511,203 @@ def show_rates(currency: Optional[str], top: Optional[int], base: Optional[str])
     :param base: base currency code
     :return: None
     """
-    rates = get_exchange_rates()
+    snapshot = get_snapshot()
     currency = currency.upper() if currency else None
-    base = base.upper() if base else None
+    base = (base.upper() if base else None) or settings.default_base_currency
 
     if currency and top:
         raise ValueError("You can't use --currency and --top together")
 
     if currency:
-        rate = get_cur_rate(currency, base)
-        print(
-            f"Курс {currency}→{base or settings.default_base_currency}: {rate['rate']} ({rate['updated_at']})"
-        )
-        if datetime.datetime.now() - datetime.datetime.strptime(
-            rate["updated_at"], "%Y-%m-%d %H:%M:%S"
-        ) > datetime.timedelta(seconds=settings.rates_ttl_seconds):
+        get_currency(currency, snapshot)
+        rate = snapshot.pairs[f"{currency}_{settings.default_base_currency}"]
+        print(f"Курс {currency}→{base}: {snapshot.cross_rate(currency, base)} ({rate['updated_at']})")
+        if snapshot.is_expired(currency):
             print("Курс устарел, обновите курсы с помощью команды update_rates")
         return
 
     if top:
-        rates = sorted(rates["pairs"].items(), key=lambda x: x[1]["rate"], reverse=True)
-        rates = rates[:top]
-        print(f"Топ-{top} курсов по курсу {base or settings.default_base_currency}:")
-        print(
-            "\n".join(
-                [
-                    f"{pair.split('_')[0]}→{base or settings.default_base_currency}:"
-                    f" {get_cur_rate(pair.split('_')[0], base)['rate']} ({rate['updated_at']})"
-                    for pair, rate in rates
-                ]
-            )
+        rates = snapshot.top(base, top)
+        print(f"Топ-{top} курсов по курсу {base}:")
+    else:
+        rates = list(zip(snapshot.codes, snapshot.rates_in(base).tolist()))
+
+    print(
+        "\n".join(
+            [
+                f"{code}→{base}: {rate} ({snapshot.pairs[f'{code}_{settings.default_base_currency}']['updated_at']})"
+                for code, rate in rates
+            ]
         )
-        for pair, rate in rates:
-            if datetime.datetime.now() - datetime.datetime.strptime(
-                rate["updated_at"], "%Y-%m-%d %H:%M:%S"
-            ) > datetime.timedelta(seconds=settings.rates_ttl_seconds):
-                print(
-                    "Один или больше курсов устарели, обновите курсы с помощью команды update_rates"
-                )
-                return
+    )
+    for code, _ in rates:
+        if snapshot.is_expired(code):
+            print(
+                "Один или больше курсов устарели, обновите курсы с помощью команды update_rates"
+            )
+            return
+
+
+def rate_at(pair: str, at: Optional[str], from_ts: Optional[str], to_ts: Optional[str]) -> None:
+    """
+    Show rate of pair at moment of time or all rates in time range from history
+    :param pair: pair name, e.g. BTC_USD
+    :param at: timestamp
+    :param from_ts: start of range
+    :param to_ts: end of range
+    :return: None
+    """
+    pair = pair.upper()
+    if at and (from_ts or to_ts):
+        raise ValueError("You can't use --at and --from/--to together")
+
+    if at:
+        tick = get_rate_at(pair, parse_timestamp(at))
+        if tick is None:
+            raise ValueError(f"Нет данных для {pair} на {at}")
+        tick_time = datetime.datetime.fromtimestamp(tick[0]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"Курс {pair} на {at}: {tick[1]} ({tick_time})")
         return
 
-    if not currency and not top:
-        print(
-            "\n".join(
-                [
-                    f"{pair.split('_')[0]}→{base or settings.default_base_currency}:"
-                    f" {get_cur_rate(pair.split('_')[0], base)['rate']} ({rate['updated_at']})"
-                    for pair, rate in rates["pairs"].items()
-                ]
-            )
+    if not from_ts and not to_ts:
+        raise ValueError("Argument --at or --from/--to is required for command rate_at")
+
+    ticks = get_rates_between(
+        pair,
+        parse_timestamp(from_ts) if from_ts else None,
+        parse_timestamp(to_ts) if to_ts else None,
+    )
+    if not ticks:
+        raise ValueError(f"Нет данных для {pair} в указанном интервале")
+    print(f"Курсы {pair} ({len(ticks)}):")
+    print(
+        "\n".join(
+            [
+                f"{datetime.datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')}: {rate}"
+                for epoch, rate in ticks
+            ]
         )
-        for pair, rate in rates["pairs"].items():
-            if datetime.datetime.now() - datetime.datetime.strptime(
-                rate["updated_at"], "%Y-%m-%d %H:%M:%S"
-            ) > datetime.timedelta(seconds=settings.rates_ttl_seconds):
-                print(
-                    "Один или больше курсов устарели, обновите курсы с помощью команды update_rates"
-                )
-                return
+    )
+
+
+def history(
+    pair: str, interval: Optional[str], from_ts: Optional[str], to_ts: Optional[str], limit: Optional[int]
+) -> None:
+    """
+    Show OHLC bars of pair from history rollups
+    :param pair: pair name, e.g. BTC_USD
+    :param interval: 1m, 1h or 1d, 1h if None
+    :param from_ts: start of range
+    :param to_ts: end of range
+    :param limit: number of last bars to show, 24 if range is not given
+    :return: None
+    """
+    pair = pair.upper()
+    interval = interval or "1h"
+    if limit is not None and limit <= 0:
+        raise ValueError("Argument --limit must be positive")
+    if limit is None and not from_ts and not to_ts:
+        limit = 24
+
+    bars = get_bars(
+        pair,
+        interval,
+        parse_timestamp(from_ts) if from_ts else None,
+        parse_timestamp(to_ts) if to_ts else None,
+    )
+    if limit is not None:
+        bars = bars[-limit:]
+    if not bars:
+        raise ValueError(f"Нет данных для {pair} в указанном интервале")
+    time_format = "%Y-%m-%d" if interval == "1d" else "%Y-%m-%d %H:%M"
+    print(f"Свечи {pair} {interval} ({len(bars)}):")
+    print(
+        "\n".join(
+            [
+                f"{datetime.datetime.fromtimestamp(start).strftime(time_format)}: "
+                f"O={open_} H={high} L={low} C={close} ({count})"
+                for start, open_, high, low, close, count in bars
+            ]
+        )
+    )
+
+
+def export_history(
+    fmt: Optional[str],
+    output: Optional[str],
+    pair: Optional[str],
+    from_ts: Optional[str],
+    to_ts: Optional[str],
+    source: Optional[str],
+) -> None:
+    """
+    Export history records matching filters, records are streamed and never loaded at once
+    :param fmt: csv or jsonl, jsonl if None
+    :param output: path to file, stdout if None
+    :param pair: pair name, e.g. BTC_USD
+    :param from_ts: start of range
+    :param to_ts: end of range
+    :param source: source name
+    :return: None
+    """
+    fmt = (fmt or "jsonl").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Неизвестный формат '{fmt}', доступные: csv, jsonl")
+    records = iter_history(
+        pair,
+        parse_timestamp(from_ts) if from_ts else None,
+        parse_timestamp(to_ts) if to_ts else None,
+        source,
+    )
+    if output is None:
+        write_history(sys.stdout, records, fmt)
         return
+
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            count = write_history(f, records, fmt)
+        os.replace(tmp_path, output)
+    except BaseException as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if isinstance(e, OSError):
+            raise ValueError(f"Cannot export history to {output}: {e.strerror}")
+        raise
+    print(f"Экспортировано записей истории: {count} в {output}")
+
+
+def replay_history(
+    pair: Optional[str],
+    from_ts: Optional[str],
+    to_ts: Optional[str],
+    source: Optional[str],
+    speed: Optional[float],
+) -> None:
+    """
+    Print history records one JSON line at a time, keeping original pauses between them divided by speed
+    :param pair: pair name, e.g. BTC_USD
+    :param from_ts: start of range
+    :param to_ts: end of range
+    :param source: source name
+    :param speed: replay speed, e.g. 60 plays one minute of history per second, no pauses if None or 0
+    :return: None
+    """
+    if speed is not None and speed < 0:
+        raise ValueError("Argument --speed must not be negative")
+    previous = None
+    count = 0
+    for record in iter_history(
+        pair,
+        parse_timestamp(from_ts) if from_ts else None,
+        parse_timestamp(to_ts) if to_ts else None,
+        source,
+    ):
+        epoch = datetime.datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        if speed and previous is not None and epoch > previous:
+            time.sleep((epoch - previous) / speed)
+        previous = epoch if previous is None else max(previous, epoch)
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        count += 1
+    if count == 0:
+        raise ValueError("Нет записей истории для указанных фильтров")
@@ -1,9 +1,7 @@
-import json
+from typing import Optional
 
-from ..infra.settings import SettingsLoader
-from .models import Portfolio, User, Wallet
-
-settings = SettingsLoader("data/config.json")
+from .models import Portfolio, User
+from .repositories import portfolio_repository, user_repository
 
 
 def get_users():
@@ -11,21 +9,7 @@ def get_users():
     Get users from local data storage
     :return: dict of users
     """
-    try:
-        with open(f"{settings.data_path}/users.json", "r") as f:
-            users_json = json.load(f)
-    except FileNotFoundError:
-        return []
-    except json.decoder.JSONDecodeError:
-        return []
-
-    with open(f"{settings.data_path}/users.json", "r") as f:
-        users_json = json.load(f)
-    users = {}
-    for user in users_json:
-        users[user["user_id"]] = User(**user)
-
-    return users
+    return {user.user_id: user for user in user_repository.all()}
 
 
 def save_users(users):
@@ -34,31 +18,63 @@ def save_users(users):
     :param users: dict of users
     :return: None
     """
-    with open(f"{settings.data_path}/users.json", "w") as f:
-        json.dump([user.get_user_info() for user in users.values()], f, indent=2)
+    for user in users.values():
+        user_repository.save(user)
 
 
-def get_portfolios():
+def get_user(user_id: int) -> Optional[User]:
     """
-    Get portfolios from local data storage
-    :return: dict of portfolios
+    Get user by id from local data storage
+    :param user_id: user id
+    :return: user or None
+    """
+    return user_repository.get(user_id)
+
+
+def get_user_by_username(username: str) -> Optional[User]:
+    """
+    Get user by username from local data storage
+    :param username: username
+    :return: user or None
+    """
+    return user_repository.get_by_username(username)
+
+
+def add_user(username: str, hashed_password: str, salt: str) -> User:
+    """
+    Add new user to local data storage
+    :param username: username
+    :param hashed_password: hashed password
+    :param salt: salt
+    :return: new user
     """
-    try:
-        with open(f"{settings.data_path}/portfolios.json", "r") as f:
-            portfolios_json = json.load(f)
-    except FileNotFoundError:
-        return {}
-    except json.decoder.JSONDecodeError:
-        return {}
+    return user_repository.add(username, hashed_password, salt)
 
-    portfolios = {}
-    for portfolio in portfolios_json:
-        wallets = {}
-        for wallet in portfolio["wallets"]:
-            wallets[wallet] = Wallet(wallet, portfolio["wallets"][wallet]["balance"])
-        portfolios[portfolio["user_id"]] = Portfolio(portfolio["user_id"], wallets)
 
-    return portfolios
+def get_portfolio(user_id: int) -> Optional[Portfolio]:
+    """
+    Get portfolio of one user from local data storage
+    :param user_id: user id
+    :return: portfolio or None if user has no portfolio
+    """
+    return portfolio_repository.get(user_id)
+
+
+def save_portfolio(portfolio: Portfolio):
+    """
+    Save portfolio of one user to local data storage
+    :param portfolio: portfolio
+    :return: None
+    """
+    portfolio_repository.save(portfolio)
+
+
+def get_portfolios():
+    """
+    Get all portfolios from local data storage
+    :return: dict of portfolios
+    """
+    return {portfolio.user: portfolio for portfolio in portfolio_repository.all()}
 
 
 def save_portfolios(portfolios: dict[int, Portfolio]):
@@ -67,5 +83,5 @@ def save_portfolios(portfolios: dict[int, Portfolio]):
     :param portfolios: dict of portfolios
     :return: None
     """
-    with open(f"{settings.data_path}/portfolios.json", "w") as f:
-        json.dump([portfolio.get_portfolio_info() for portfolio in portfolios.values()], f, indent=2)
+    for portfolio in portfolios.values():
+        portfolio_repository.save(portfolio)
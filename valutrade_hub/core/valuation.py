@@ -0,0 +1,118 @@
+import csv
+import os
+from itertools import chain
+from typing import Optional
+
+import numpy as np
+
+from ..infra.files import atomic_write_json
+from ..infra.settings import SettingsLoader
+from ..metrics import metrics
+from .currencies import RateSnapshot, get_snapshot
+from .repositories import portfolio_repository
+
+settings = SettingsLoader("data/config.json")
+
+
+class PortfolioValuation:
+    """
+    Total value of every portfolio in one base currency
+    :param base: base currency code
+    :param user_ids: sorted ids of users with wallets
+    :param totals: total value of portfolio of every user, ordered as user_ids
+    :param last_refresh: time of last refresh of rates used for valuation
+    """
+    def __init__(self, base: str, user_ids: np.ndarray, totals: np.ndarray, last_refresh: Optional[str]):
+        self.base = base
+        self.user_ids = user_ids
+        self.totals = totals
+        self.last_refresh = last_refresh
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def top(self, n: int) -> list[tuple[int, float]]:
+        """
+        Get n most valuable portfolios, ties are ordered by user id
+        :param n: number of portfolios
+        :return: list of (user_id, total) sorted by total descending
+        """
+        n = min(n, len(self.totals))
+        if n <= 0:
+            return []
+        if n < len(self.totals):
+            idx = np.argpartition(-self.totals, n - 1)[:n]
+        else:
+            idx = np.arange(len(self.totals))
+        idx = idx[np.lexsort((self.user_ids[idx], -self.totals[idx]))]
+        return list(zip(self.user_ids[idx].tolist(), self.totals[idx].tolist()))
+
+    def value_of(self, user_id: int) -> float:
+        """
+        Get total value of one portfolio
+        :param user_id: user id
+        :return: total value, 0 if user has no wallets
+        """
+        i = np.searchsorted(self.user_ids, user_id)
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return float(self.totals[i])
+        return 0.0
+
+    def export(self, path: str) -> None:
+        """
+        Write values of all portfolios to file, format is chosen by extension (.csv or .json)
+        :param path: path to file
+        :return: None
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".json":
+            atomic_write_json(
+                path,
+                {
+                    "base": self.base,
+                    "rates_updated_at": self.last_refresh,
+                    "portfolios": [
+                        {"user_id": user_id, "total": total}
+                        for user_id, total in zip(self.user_ids.tolist(), self.totals.tolist())
+                    ],
+                },
+            )
+        elif extension == ".csv":
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["user_id", f"total_{self.base}"])
+                    writer.writerows(zip(self.user_ids.tolist(), self.totals.tolist()))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        else:
+            raise ValueError(f"Unknown export format {extension or path}, use .csv or .json")
+
+
+def value_portfolios(base: Optional[str] = None, snapshot: Optional[RateSnapshot] = None) -> PortfolioValuation:
+    """
+    Value all portfolios at once
+    Balances are loaded as columns (user, currency index, amount) and multiplied by rate vector,
+    totals are summed per user with bincount, no Python call per wallet or portfolio
+    :param base: base currency code, default currency from settings if None
+    :param snapshot: rates snapshot, current one if None
+    :return: valuation
+    """
+    snapshot = snapshot or get_snapshot()
+    base = (base or settings.default_base_currency).upper()
+    with metrics.timed("phase.valuation"):
+        rates = snapshot.rates_in(base)
+        rows = portfolio_repository.balance_rows(snapshot.index)
+        columns = np.fromiter(chain.from_iterable(rows), dtype=np.float64).reshape(-1, 3)
+        currency_idx = columns[:, 1].astype(np.intp)
+        if (currency_idx < 0).any():
+            missing = [code for code in portfolio_repository.currency_codes() if code not in snapshot.index]
+            raise ValueError(f"Курс для {', '.join(missing)} не найден в кеше.")
+
+        user_ids, user_idx = np.unique(columns[:, 0].astype(np.int64), return_inverse=True)
+        totals = np.bincount(user_idx, weights=columns[:, 2] * rates[currency_idx], minlength=len(user_ids))
+    return PortfolioValuation(base, user_ids, totals, snapshot.last_refresh)
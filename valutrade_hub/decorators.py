@@ -1,7 +1,7 @@
-import json
-import os
 from datetime import datetime
+from time import perf_counter
 
+from .log_writer import get_log_writer
 from .logging_config import LoggingConfig
 
 config = LoggingConfig()
@@ -16,15 +16,7 @@ def log_action(func):
         :return: None
         """
         if log_format == "json":
-            try:
-                file_size_bytes = os.path.getsize(f"{config.log_path}/log.json")
-            except FileNotFoundError:
-                file_size_bytes = 0
-            if file_size_bytes > config.rotation and config.rotation != 0:
-                os.remove(f"{config.log_path}/log.json")
-            with open(f"{config.log_path}/log.json", "a") as f:
-                json.dump(log_record, f)
-                f.write("\n")
+            get_log_writer().write(log_record)
         else:
             log_string = f'[{log_record["level"]}] ' + " ".join(
                 [f"{k}={v}" for k, v in log_record.items() if k != "level"]
@@ -41,6 +33,7 @@ def log_action(func):
         timestamp = datetime.now().isoformat()
         action = func.__name__.upper()
         log_format = config.format
+        start = perf_counter()
 
         try:
             func(*args, **kwargs)
@@ -48,6 +41,7 @@ def log_action(func):
                 "level": "INFO",
                 "timestamp": timestamp,
                 "action": action,
+                "duration_ms": round((perf_counter() - start) * 1000, 3),
             }
             log_record.update(kwargs)
             for keyword in config.mask_keywords:
@@ -61,6 +55,7 @@ def log_action(func):
                 "level": "ERROR",
                 "timestamp": timestamp,
                 "action": action,
+                "duration_ms": round((perf_counter() - start) * 1000, 3),
                 "error_type": error_type,
                 "error_message": error_message,
             }
@@ -0,0 +1,275 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Iterator, Optional
+
+from ..metrics import metrics
+from .settings import SettingsLoader
+
+settings = SettingsLoader("data/config.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    registration_date TEXT NOT NULL,
+    salt TEXT,
+    hashed_password TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_idx ON users(username);
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id INTEGER NOT NULL REFERENCES portfolios(user_id),
+    currency_code TEXT NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (user_id, currency_code)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Get connection to local database, one connection per thread
+    Database runs in WAL mode: every commit is appended to the write-ahead log and fsynced,
+    pages are moved to the main file by checkpoints, the log is replayed on open after a crash
+    :return: connection
+    """
+    connection = getattr(_local, "connection", None)
+    path = f"{settings.data_path}/valutrade.db"
+    if connection is None or getattr(_local, "path", None) != path:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.executescript(SCHEMA)
+        _migrate(connection)
+        _local.connection = connection
+        _local.path = path
+        _local.depth = 0
+        _local.on_commit = []
+        _local.group = None
+    return connection
+
+
+def _migrate(connection: sqlite3.Connection) -> None:
+    """
+    Add columns missing in databases created by older versions
+    :param connection: connection
+    :return: None
+    """
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(portfolios)")}
+    if "version" not in columns:
+        try:
+            connection.execute("ALTER TABLE portfolios ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):
+                raise
+
+
+class _Group:
+    """
+    Window of group commit
+    :param max_seconds: max time in seconds transaction of group stays open
+    :param max_blocks: max number of transaction blocks committed together
+    """
+    def __init__(self, max_seconds: float, max_blocks: int):
+        self.max_seconds = max_seconds
+        self.max_blocks = max_blocks
+        self.opened_at: Optional[float] = None
+        self.blocks = 0
+
+    def is_full(self) -> bool:
+        return self.blocks >= self.max_blocks or monotonic() - self.opened_at >= self.max_seconds
+
+
+def _begin(connection: sqlite3.Connection) -> None:
+    _write_lock.acquire()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+    except BaseException:
+        _write_lock.release()
+        raise
+
+
+def _end(connection: sqlite3.Connection, commit: bool) -> None:
+    """
+    Commit or roll back outermost transaction and run callbacks after commit
+    :param connection: connection
+    :param commit: commit if True, roll back otherwise
+    :return: None
+    """
+    try:
+        if commit:
+            with metrics.timed("phase.commit"):
+                connection.execute("COMMIT")
+        else:
+            connection.execute("ROLLBACK")
+    except BaseException:
+        del _local.on_commit[:]
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        _write_lock.release()
+    on_commit, _local.on_commit = _local.on_commit, []
+    if commit:
+        for callback in on_commit:
+            callback()
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Run block in one transaction, nested blocks become savepoints of the outer one
+    Commit (and fsync) happens once when the outermost block exits, so wrapping many
+    mutations in one block commits them as a group
+    Inside group_commit the outermost block opens transaction of the group and becomes its savepoint
+    :return: connection
+    """
+    connection = get_connection()
+    group = _local.group
+    if _local.depth == 0 and group is not None:
+        _begin(connection)
+        group.opened_at = monotonic()
+        _local.depth = 1
+    depth = _local.depth
+    callbacks = len(_local.on_commit)
+    if depth == 0:
+        _begin(connection)
+    else:
+        connection.execute(f"SAVEPOINT sp{depth}")
+    _local.depth = depth + 1
+    try:
+        yield connection
+    except BaseException:
+        _local.depth = depth
+        del _local.on_commit[callbacks:]
+        if depth == 0:
+            _end(connection, commit=False)
+        else:
+            connection.execute(f"ROLLBACK TO sp{depth}")
+            connection.execute(f"RELEASE sp{depth}")
+            if depth == 1 and group is not None and group.blocks == 0:
+                flush_group()
+        raise
+    _local.depth = depth
+    if depth == 0:
+        _end(connection, commit=True)
+    else:
+        connection.execute(f"RELEASE sp{depth}")
+        if depth == 1 and group is not None:
+            group.blocks += 1
+            if group.is_full():
+                flush_group()
+
+
+@contextmanager
+def group_commit(max_seconds: float, max_blocks: int) -> Iterator[None]:
+    """
+    Commit outermost transaction blocks of this thread together
+    Transaction is opened lazily by the first block, so code which only reads takes no write lock.
+    It is committed when max_seconds passed since it was opened or max_blocks blocks ran in it,
+    by flush_group and on exit, also when exit is caused by error: finished blocks are kept
+    :param max_seconds: max time in seconds write lock is held by one group
+    :param max_blocks: max number of blocks in one group
+    :return: None
+    """
+    get_connection()
+    if _local.group is not None or _local.depth:
+        raise RuntimeError("group_commit can not be nested in transaction")
+    _local.group = _Group(max_seconds, max_blocks)
+    try:
+        yield
+    finally:
+        try:
+            flush_group()
+        finally:
+            _local.group = None
+
+
+def flush_group(if_full: bool = False) -> None:
+    """
+    Commit open transaction of current group_commit, next block opens a new one
+    :param if_full: commit only if time or size limit of group is reached
+    :return: None
+    """
+    group = _local.group
+    if group is None or _local.depth != 1 or group.opened_at is None or (if_full and not group.is_full()):
+        return
+    _local.depth = 0
+    group.opened_at = None
+    group.blocks = 0
+    _end(get_connection(), commit=True)
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """
+    Run callback after the outermost transaction of this thread commits
+    Callbacks of rolled back blocks are dropped, without transaction callback runs at once
+    :param callback: function without arguments
+    :return: None
+    """
+    get_connection()
+    if _local.depth == 0:
+        callback()
+    else:
+        _local.on_commit.append(callback)
+
+
+def checkpoint() -> None:
+    """
+    Move write-ahead log into main database file and truncate the log
+    :return: None
+    """
+    get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def get_meta(connection: sqlite3.Connection, key: str):
+    """
+    Get value from meta table
+    :param connection: connection
+    :param key: key
+    :return: value or None
+    """
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(connection: sqlite3.Connection, key: str, value: str):
+    """
+    Set value in meta table, caller commits
+    :param connection: connection
+    :param key: key
+    :param value: value
+    :return: None
+    """
+    connection.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def next_sequence_value(connection: sqlite3.Connection, name: str) -> int:
+    """
+    Get next value of monotonic sequence, caller commits
+    :param connection: connection
+    :param name: sequence name
+    :return: next value
+    """
+    connection.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES (?, 0)", (name,))
+    connection.execute("UPDATE sequences SET value = value + 1 WHERE name = ?", (name,))
+    return connection.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]
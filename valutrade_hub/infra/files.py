@@ -0,0 +1,71 @@
+import json
+import os
+from typing import Iterator
+
+
+def atomic_write_json(path: str, data, **dump_kwargs) -> None:
+    """
+    Write json file atomically: temp file, fsync, rename over target
+    Readers see either the old or the new file, never a partially written one
+    :param path: path to file
+    :param data: data to dump
+    :param dump_kwargs: arguments for json.dump
+    :return: None
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator:
+    """
+    Stream items of top-level json array without loading the whole file
+    Memory is bounded by chunk_size and size of the largest item
+    :param path: path to file
+    :param chunk_size: number of characters read at once
+    :return: iterator of items
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise json.JSONDecodeError("Expecting '['", buffer, 0)
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            if not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+            pos = end
@@ -0,0 +1,292 @@
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from typing import Optional
+
+MAGIC = b"VTRT"
+VERSION = 2
+
+# magic, version, generation, count, capacity, retired, base currency, last refresh epoch (nan if unknown),
+# inode, size and mtime in ns of rates.json the table was published from (zeros if unknown)
+HEADER = struct.Struct("<4sIQIII16sdQQq")
+HEADER_SIZE = 96
+SOURCE = struct.Struct("<16s")
+MAX_SOURCES = 16
+CODE = struct.Struct("<16s")
+# code index, source index, rate, epoch of update
+RECORD = struct.Struct("<IIdd")
+
+_GENERATION_OFFSET = 8
+_GENERATION = struct.Struct("<Q")
+_RETIRED_OFFSET = 24
+_RETIRED = struct.Struct("<I")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _layout(capacity: int) -> tuple[int, int, int]:
+    """
+    Get offsets of tables in file
+    :param capacity: max number of records
+    :return: (offset of codes, offset of records, file size)
+    """
+    codes = HEADER_SIZE + MAX_SOURCES * SOURCE.size
+    records = codes + capacity * CODE.size
+    return codes, records, records + capacity * RECORD.size
+
+
+def file_stamp(path: str) -> tuple[int, int, int]:
+    """
+    Get stamp of file which changes when file is replaced or modified
+    :param path: path to file
+    :return: (inode, size, mtime in ns), zeros if file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0, 0
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _encode(name: str) -> Optional[bytes]:
+    data = name.encode("ascii", errors="replace")
+    return data if len(data) <= CODE.size else None
+
+
+class RateTable:
+    """
+    Fixed-layout binary copy of rates.json shared by processes through mmap
+    Layout: header with generation counter, table of source names, table of currency codes,
+    then packed records (code index, source index, rate, epoch), record i describes code i.
+    Writer updates the file in place as a seqlock: generation is odd while records are written
+    and even when they are consistent.
+    A file replaced by a bigger one is marked retired, so readers reopen the path
+    """
+
+    @staticmethod
+    def publish(path: str, pairs: dict, last_refresh: Optional[str], base: str, source_path: str) -> bool:
+        """
+        Write pairs to table, caller must hold lock of rates.json so there is only one writer
+        :param path: path to table
+        :param pairs: pairs in rates.json format
+        :param last_refresh: time of last refresh in rates.json format
+        :param base: base currency of pairs
+        :param source_path: path to rates.json the pairs were just written to, its stamp is saved in table
+        :return: False if pairs can not be encoded and table was removed
+        """
+        encoded = RateTable._encode_pairs(pairs, base)
+        if encoded is None:
+            RateTable.retire(path)
+            return False
+        sources, codes, records = encoded
+        refresh_epoch = (
+            datetime.strptime(last_refresh, TIME_FORMAT).timestamp() if last_refresh else float("nan")
+        )
+        header = (base.encode("ascii"), refresh_epoch, *file_stamp(source_path))
+
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= HEADER_SIZE:
+                    with mmap.mmap(f.fileno(), 0) as mm:
+                        magic, version, generation, _, capacity, retired = HEADER.unpack_from(mm, 0)[:6]
+                        if (
+                            magic == MAGIC and version == VERSION and not retired
+                            and capacity >= len(records) and size >= _layout(capacity)[2]
+                        ):
+                            RateTable._write(mm, generation, capacity, sources, codes, records, header)
+                            return True
+
+        capacity = 64
+        while capacity < 2 * len(records):
+            capacity *= 2
+        generation = RateTable._generation_of(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w+b") as f:
+                f.truncate(_layout(capacity)[2])
+                with mmap.mmap(f.fileno(), 0) as mm:
+                    HEADER.pack_into(mm, 0, MAGIC, VERSION, generation, 0, capacity, 0, b"", 0.0, 0, 0, 0)
+                    RateTable._write(mm, generation, capacity, sources, codes, records, header)
+                f.flush()
+            RateTable.retire(path, remove=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    @staticmethod
+    def _encode_pairs(pairs: dict, base: str) -> Optional[tuple[list, list, list]]:
+        """
+        Encode pairs to tables
+        :param pairs: pairs in rates.json format
+        :param base: base currency of pairs
+        :return: (source names, codes, records) or None if pairs do not fit the layout
+        """
+        sources, codes, records = [], [], []
+        source_index = {}
+        suffix = f"_{base}"
+        for pair, value in pairs.items():
+            if not pair.endswith(suffix):
+                return None
+            code = _encode(pair[:-len(suffix)])
+            source = value.get("source", "")
+            if code is None or _encode(source) is None:
+                return None
+            if source not in source_index:
+                if len(source_index) >= MAX_SOURCES:
+                    return None
+                source_index[source] = len(sources)
+                sources.append(_encode(source))
+            epoch = datetime.strptime(value["updated_at"], TIME_FORMAT).timestamp()
+            records.append((len(codes), source_index[source], float(value["rate"]), epoch))
+            codes.append(code)
+        return sources, codes, records
+
+    @staticmethod
+    def _write(mm, generation: int, capacity: int, sources, codes, records, header: tuple):
+        """
+        Write tables under seqlock
+        :param header: header fields after retired flag
+        :return: None
+        """
+        codes_offset, records_offset, _ = _layout(capacity)
+        generation += 1 if generation % 2 == 0 else 2
+        _GENERATION.pack_into(mm, _GENERATION_OFFSET, generation)
+        mm[HEADER_SIZE:codes_offset] = b"".join(SOURCE.pack(source) for source in sources).ljust(
+            codes_offset - HEADER_SIZE, b"\0"
+        )
+        mm[codes_offset:codes_offset + len(codes) * CODE.size] = b"".join(CODE.pack(code) for code in codes)
+        mm[records_offset:records_offset + len(records) * RECORD.size] = b"".join(
+            RECORD.pack(*record) for record in records
+        )
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, generation + 1, len(records), capacity, 0, *header)
+
+    @staticmethod
+    def _generation_of(path: str) -> int:
+        try:
+            with open(path, "rb") as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return 0
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            return 0
+        generation = HEADER.unpack(header)[2]
+        return generation + generation % 2
+
+    @staticmethod
+    def retire(path: str, remove: bool = True):
+        """
+        Mark table as retired, so readers stop using their mapping of it
+        :param path: path to table
+        :param remove: also remove the file
+        :return: None
+        """
+        try:
+            with open(path, "r+b") as f:
+                if os.fstat(f.fileno()).st_size >= HEADER_SIZE:
+                    f.seek(_RETIRED_OFFSET)
+                    f.write(_RETIRED.pack(1))
+        except FileNotFoundError:
+            return
+        if remove:
+            os.remove(path)
+
+
+class RateTableReader:
+    """
+    Reader of RateTable, keeps the file mapped and checks generation without system calls
+    :param path: path to table
+    :param retries: attempts to read consistent records while writer is active
+    """
+    def __init__(self, path: str, retries: int = 1000):
+        self.path = path
+        self.retries = retries
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def _map(self) -> bool:
+        """
+        Map table file if it is not mapped or was retired
+        :return: True if table is mapped
+        """
+        if self._mm is not None:
+            if _RETIRED.unpack_from(self._mm, _RETIRED_OFFSET)[0] == 0:
+                return True
+            self._mm.close()
+            self._mm = None
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+                    return False
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return False
+        magic, version = HEADER.unpack_from(mm, 0)[:2]
+        if magic != MAGIC or version != VERSION:
+            mm.close()
+            return False
+        self._mm = mm
+        return True
+
+    def generation(self) -> Optional[int]:
+        """
+        Get current generation of table
+        :return: generation, None if there is no usable table
+        """
+        with self._lock:
+            if not self._map():
+                return None
+            return _GENERATION.unpack_from(self._mm, _GENERATION_OFFSET)[0]
+
+    def read(self) -> Optional[dict]:
+        """
+        Read consistent copy of tables
+        Records are copied out of the mapping, so the copy stays consistent while writer updates the table
+        :return: dict with generation, base, last_refresh, source (stamp of rates.json), sources, codes and records
+            (bytes of packed records), None if there is no usable table or writer did not finish
+        """
+        with self._lock:
+            for _ in range(self.retries):
+                if not self._map():
+                    return None
+                mm = self._mm
+                _, _, generation, count, capacity, _, base, refresh_epoch, *source = HEADER.unpack_from(mm, 0)
+                if generation % 2:
+                    continue
+                codes_offset, records_offset, size = _layout(capacity)
+                if len(mm) < size:
+                    return None
+                sources = mm[HEADER_SIZE:codes_offset]
+                codes = mm[codes_offset:codes_offset + count * CODE.size]
+                records = mm[records_offset:records_offset + count * RECORD.size]
+                if _GENERATION.unpack_from(mm, _GENERATION_OFFSET)[0] != generation:
+                    continue
+                return {
+                    "generation": generation,
+                    "source": tuple(source),
+                    "base": base.rstrip(b"\0").decode("ascii"),
+                    "last_refresh": (
+                        None if refresh_epoch != refresh_epoch
+                        else datetime.fromtimestamp(refresh_epoch).strftime(TIME_FORMAT)
+                    ),
+                    "sources": [
+                        name.rstrip(b"\0").decode("ascii") for (name,) in SOURCE.iter_unpack(sources)
+                    ],
+                    "codes": tuple(code.rstrip(b"\0").decode("ascii") for (code,) in CODE.iter_unpack(codes)),
+                    "records": records,
+                }
+            return None
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
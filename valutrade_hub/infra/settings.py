@@ -18,9 +18,19 @@ class SettingsLoader:
         return cls._instance
 
     def __init__(self, config_path):
+        if "config_path" in self.__dict__:
+            return
         self.config_path = config_path
+        self._config = None
+
+    def _load(self):
+        """
+        Parse config file, called once on first access to any setting
+        :return: None
+        """
         with open(self.config_path, "r") as f:
             config = json.load(f)
+        self._config = config
 
         self.data_path = config["data_path"]
         self.rates_ttl_seconds = config["rates_ttl_seconds"]
@@ -33,8 +43,17 @@ class SettingsLoader:
         self.coingeko_api_key = config["coingecko_api_key"]
         self.exchangerates_api_key = config["exchangerates_api_key"]
 
+    def __getattr__(self, name: str):
+        """
+        Called only for attributes which are not set yet, loads config on first call
+        """
+        if name.startswith("_") or self._config is not None:
+            raise AttributeError(name)
+        self._load()
+        return getattr(self, name)
+
     def get(self, key: str, default: Any = None):
         try:
             return getattr(self, key)
         except AttributeError:
-            return default
+            return self._config.get(key, default)
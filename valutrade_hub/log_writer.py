@@ -0,0 +1,186 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from time import monotonic
+from typing import Optional
+
+from .logging_config import LoggingConfig
+
+config = LoggingConfig()
+
+
+class BufferedLogWriter:
+    """
+    Background writer of json log records
+    Records are queued by callers and written in batches by one thread. Size of log file is
+    tracked in memory, so rotation does not stat the file for every record
+    :param path: path to log file
+    :param rotation: max size of log file in bytes, 0 disables rotation
+    :param max_queue: max number of records waiting to be written
+    :param batch_size: max number of records written at once
+    :param flush_interval: max time in seconds records wait in buffer
+    :param put_timeout: time caller waits for free space in full queue before record is dropped
+    """
+    _STOP = object()
+
+    def __init__(
+        self,
+        path: str,
+        rotation: int,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        put_timeout: float = 0.05,
+    ):
+        self.path = path
+        self.rotation = rotation
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, log_record: dict) -> bool:
+        """
+        Queue record for writing
+        Caller waits at most put_timeout if queue is full, then record is dropped
+        :param log_record: log record
+        :return: True if record was queued, False if it was dropped
+        """
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(log_record)
+        except queue.Full:
+            self.blocked += 1
+            try:
+                self._queue.put(log_record, timeout=self.put_timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.enqueued += 1
+        return True
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+            self._size = self._file.tell()
+
+    def _write_batch(self, batch: list[dict]):
+        """
+        Write batch of records, rotating the file when it exceeds rotation size
+        :param batch: records
+        :return: None
+        """
+        self._open()
+        for log_record in batch:
+            if self._size > self.rotation and self.rotation != 0:
+                self._file.close()
+                os.remove(self.path)
+                self._file = open(self.path, "a")
+                self._size = 0
+            line = json.dumps(log_record) + "\n"
+            self._file.write(line)
+            self._size += len(line.encode("utf-8"))
+        self._file.flush()
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, stop = [], False
+            if item is self._STOP:
+                stop = True
+            else:
+                batch.append(item)
+                deadline = monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError:
+                    self.dropped += len(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """
+        Wait until every queued record is written
+        :return: None
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Write remaining records and stop writer thread
+        :return: None
+        """
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        """
+        Get writer counters
+        :return: dict of counters
+        """
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+        }
+
+
+_writer: Optional[BufferedLogWriter] = None
+
+
+def get_log_writer() -> BufferedLogWriter:
+    """
+    Get log writer shared by the process
+    :return: log writer
+    """
+    global _writer
+    if _writer is None:
+        _writer = BufferedLogWriter(f"{config.log_path}/log.json", config.rotation)
+    return _writer
@@ -5,11 +5,24 @@ settings = SettingsLoader("data/config.json")
 
 class LoggingConfig:
     """
-    Logging configuration
+    Logging configuration, values from config file are read on first access
     """
-    def __init__(self):
-        self.log_path = settings.log_path
-        self.format = settings.log_format
-        self.level = settings.log_level
-        self.rotation = settings.log_rotation_size
-        self.mask_keywords = settings.mask_keywords
+    @property
+    def log_path(self) -> str:
+        return settings.log_path
+
+    @property
+    def format(self) -> str:
+        return settings.log_format
+
+    @property
+    def level(self) -> str:
+        return settings.log_level
+
+    @property
+    def rotation(self) -> int:
+        return settings.log_rotation_size
+
+    @property
+    def mask_keywords(self) -> list[str]:
+        return settings.mask_keywords
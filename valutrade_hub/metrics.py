@@ -0,0 +1,151 @@
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter_ns
+from typing import Iterator
+
+
+class Histogram:
+    """
+    Log-linear latency histogram in the spirit of HdrHistogram
+    Values are stored in nanoseconds in buckets with 7 significant bits, relative error is below 1%
+    """
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return shift * cls.SUB_BUCKET_HALF + (value >> shift)
+
+    @classmethod
+    def _value(cls, index: int) -> int:
+        """
+        Get middle value of bucket
+        :param index: bucket index
+        :return: value in nanoseconds
+        """
+        if index < 2 * cls.SUB_BUCKET_HALF:
+            return index
+        shift = index // cls.SUB_BUCKET_HALF - 1
+        sub = index - shift * cls.SUB_BUCKET_HALF
+        return (sub << shift) + (1 << shift) // 2
+
+    def record(self, value_ns: int):
+        """
+        Record one value
+        :param value_ns: value in nanoseconds
+        :return: None
+        """
+        value_ns = max(0, int(value_ns))
+        index = self._index(value_ns)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value_ns
+            self.min = value_ns if self.min is None else min(self.min, value_ns)
+            self.max = value_ns if self.max is None else max(self.max, value_ns)
+
+    def percentile(self, q: float) -> int:
+        """
+        Get value at percentile
+        :param q: percentile from 0 to 100
+        :return: value in nanoseconds
+        """
+        with self._lock:
+            if not self.count:
+                return 0
+            rank = max(1, round(self.count * q / 100))
+            seen = 0
+            for index in sorted(self._counts):
+                seen += self._counts[index]
+                if seen >= rank:
+                    return min(max(self._value(index), self.min), self.max)
+            return self.max
+
+
+class Metrics:
+    """
+    Registry of named latency histograms
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def histogram(self, name: str) -> Histogram:
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            return self._histograms[name]
+
+    def observe(self, name: str, value_ns: int):
+        self.histogram(name).record(value_ns)
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """
+        Measure block with monotonic clock, failed blocks are measured too
+        :param name: histogram name
+        :return: None
+        """
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter_ns() - start)
+
+    def snapshot(self) -> dict[str, Histogram]:
+        with self._lock:
+            return dict(sorted(self._histograms.items()))
+
+    def format_stats(self) -> str:
+        """
+        Format percentiles of every histogram as table
+        :return: table
+        """
+        histograms = self.snapshot()
+        if not histograms:
+            return "No measurements yet"
+        rows = [f"{'name':<28} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}"]
+        for name, histogram in histograms.items():
+            rows.append(
+                f"{name:<28} {histogram.count:>7} "
+                + " ".join(f"{histogram.percentile(q) / 1e6:>10.3f}" for q in (50, 95, 99))
+                + f" {(histogram.max or 0) / 1e6:>10.3f}"
+            )
+        return "\n".join(rows)
+
+    def export_prometheus(self, path: str):
+        """
+        Write histograms to file in Prometheus text format as summaries
+        :param path: path to file
+        :return: None
+        """
+        lines = [
+            "# HELP valutrade_latency_seconds Latency of commands and their phases",
+            "# TYPE valutrade_latency_seconds summary",
+        ]
+        for name, histogram in self.snapshot().items():
+            for q in (0.5, 0.95, 0.99):
+                lines.append(
+                    f'valutrade_latency_seconds{{name="{name}",quantile="{q}"}} {histogram.percentile(q * 100) / 1e9}'
+                )
+            lines.append(f'valutrade_latency_seconds_sum{{name="{name}"}} {histogram.total / 1e9}')
+            lines.append(f'valutrade_latency_seconds_count{{name="{name}"}} {histogram.count}')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
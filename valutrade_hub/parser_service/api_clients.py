@@ -1,19 +1,135 @@
+import threading
 from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from time import monotonic, time
+from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from ..core.exceptions import ApiRequestError
+from ..metrics import metrics
 from .config import ParserConfig
 
 config = ParserConfig()
 
+deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def request_timeout() -> float:
+    """
+    Get timeout of next request: REQUEST_TIMEOUT limited by time left until deadline of current fetch
+    :return: timeout in seconds
+    """
+    expires = deadline.get()
+    if expires is None:
+        return config.REQUEST_TIMEOUT
+    left = expires - monotonic()
+    if left <= 0:
+        raise ApiRequestError("latency budget exceeded")
+    return min(config.REQUEST_TIMEOUT, left)
+
+
+def request_error(error: requests.exceptions.RequestException) -> ApiRequestError:
+    """
+    Convert requests error to ApiRequestError with status, Retry-After and retryable flag
+    Connection errors, timeouts, 429 and 5xx are retryable
+    :param error: requests error
+    :return: ApiRequestError
+    """
+    response = error.response if isinstance(error, requests.exceptions.HTTPError) else None
+    if response is not None:
+        api_error = ApiRequestError(str(error))
+        api_error.status = response.status_code
+        api_error.retry_after = response.headers.get("Retry-After")
+        api_error.retryable = response.status_code in RETRY_STATUSES
+    else:
+        api_error = ApiRequestError(f"{type(error).__name__}: {error}")
+        api_error.retryable = True
+    return api_error
+
+
+def invalid_response(reason: str) -> ApiRequestError:
+    """
+    Make error for response which can not be parsed, it is retryable as provider failed to answer properly
+    :param reason: reason
+    :return: ApiRequestError
+    """
+    api_error = ApiRequestError(reason)
+    api_error.retryable = True
+    return api_error
+
 
 class BaseApiClient(ABC):
     """
     Interface for api clients
+    Every client keeps its own keep-alive connection pool and validators (ETag, Last-Modified)
+    of last responses, so repeated requests are conditional where provider supports it
     """
+    currencies: list[str] = []
+    not_modified = 0
+
+    def __init__(self):
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._validators = {}
+        self._validators_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def get_json(self, url: str):
+        """
+        Conditional GET: sends If-None-Match/If-Modified-Since from previous response of the same url
+        and reuses its body if provider answers 304 Not Modified
+        :param url: url
+        :return: parsed json body
+        """
+        with self._validators_lock:
+            cached = self._validators.get(url)
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        timeout = request_timeout()
+        try:
+            with metrics.timed(f"http.{type(self).__name__}"):
+                response = self.session.get(url, timeout=timeout, headers=headers)
+            if response.status_code == 304 and cached is not None:
+                self.not_modified += 1
+                return cached[2]
+            response.raise_for_status()
+            body = response.json()
+        except requests.exceptions.JSONDecodeError as e:
+            raise invalid_response(f"Invalid JSON in response: {e}")
+        except requests.exceptions.RequestException as e:
+            raise request_error(e)
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if etag or last_modified:
+            with self._validators_lock:
+                self._validators[url] = (etag, last_modified, body)
+        return body
+
     @abstractmethod
-    def fetch_rates(self) -> dict:
+    def fetch_rates(self, codes: Optional[list[str]] = None) -> dict:
+        """
+        Fetch rates of currencies to base currency
+        :param codes: codes of currencies to fetch, all currencies of client if None
+        :return: dict of pair name to rate
+        """
         pass
 
 
@@ -22,28 +138,43 @@ class ExchangeratesApiClient(BaseApiClient):
     Implementation for exchangerates api
     """
     def __init__(self, api_key: str):
+        super().__init__()
         self.api_key = api_key
         self.api_url = config.exchangerates_api_url
         self.url = "{exchangerates_api_url}/{api_key}/latest/{cur}"
+        self.currencies = list(config.FIAT_CURRENCIES)
+        self._last_body = None
+        self.skipped = 0
 
-    def fetch_rates(self) -> dict:
+    def fetch_rates(self, codes: Optional[list[str]] = None) -> dict:
         """
         Fetches rates from exchangerates api
+        One request returns all currencies, so rates of all fiat currencies are returned for any codes.
+        Provider publishes time of its next update, until then the last response is reused without request
+        :param codes: codes of currencies to fetch
         :return:
         """
-        url = self.url.format(exchangerates_api_url=self.api_url, api_key=self.api_key, cur=config.BASE_CURRENCY)
-        response = requests.get(url)
+        body = self._last_body
+        if body is not None and time() < body.get("time_next_update_unix", 0):
+            self.skipped += 1
+        else:
+            url = self.url.format(
+                exchangerates_api_url=self.api_url, api_key=self.api_key, cur=config.BASE_CURRENCY
+            )
+            body = self.get_json(url)
         try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            raise ApiRequestError(str(e))
-        rates = response.json()["conversion_rates"]
+            rates = body["conversion_rates"]
+        except (KeyError, TypeError):
+            raise invalid_response("Cant find conversion_rates in response from Exchangerates")
         rates_parsed = {}
-        for cur in config.FIAT_CURRENCIES:
+        for cur in self.currencies:
             try:
                 rates_parsed[f"{cur}_{config.BASE_CURRENCY}"] = 1/rates[cur]
             except KeyError as e:
-                raise ApiRequestError(f"Cant find currency {e} in response from Exchangerates")
+                raise invalid_response(f"Cant find currency {e} in response from Exchangerates")
+            except (TypeError, ZeroDivisionError) as e:
+                raise invalid_response(f"Invalid rate of {cur} in response from Exchangerates: {e}")
+        self._last_body = body
         return rates_parsed
 
 
@@ -52,29 +183,30 @@ class CoinGeckoClient(BaseApiClient):
     Implementation for coingecko api
     """
     def __init__(self) -> None:
+        super().__init__()
         self.url = "{coingecko_api_url}/price?ids={ids}&vs_currencies={base_currency}"
         self.api_url = config.coingecko_api_url
+        self.currencies = list(config.CRYPTO_ID_MAP)
 
-    def fetch_rates(self) -> dict:
+    def fetch_rates(self, codes: Optional[list[str]] = None) -> dict:
         """
-        Fetches rates from coingecko api
+        Fetches rates from coingecko api, only ids of requested currencies are asked
+        :param codes: codes of currencies to fetch
         :return:
         """
+        id_map = {code: config.CRYPTO_ID_MAP[code] for code in (codes or self.currencies)}
         url = self.url.format(
             coingecko_api_url=self.api_url,
-            ids=",".join(config.CRYPTO_ID_MAP.values()),
+            ids=",".join(id_map.values()),
             base_currency=config.BASE_CURRENCY,
         )
-        response = requests.get(url)
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            raise ApiRequestError(str(e))
-        rates = response.json()
+        rates = self.get_json(url)
         rates_parsed = {}
-        for k, v in config.CRYPTO_ID_MAP.items():
+        for k, v in id_map.items():
             try:
                 rates_parsed[f"{k.upper()}_{config.BASE_CURRENCY}"] = rates[v][config.BASE_CURRENCY.lower()]
             except KeyError as e:
-                raise ApiRequestError(f"Cant find currency {e} in response from CoinGecko")
+                raise invalid_response(f"Cant find currency {e} in response from CoinGecko")
+            except TypeError as e:
+                raise invalid_response(f"Invalid rate of {k} in response from CoinGecko: {e}")
         return rates_parsed
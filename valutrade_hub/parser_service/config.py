@@ -1,15 +1,15 @@
+from typing import Optional
+
 from ..infra.settings import SettingsLoader
 
 settings = SettingsLoader("data/config.json")
 
 
 class ParserConfig:
+    """
+    Parser configuration, values from config file are read on first access
+    """
     def __init__(self):
-        self.coingecko_api_key = settings.coingeko_api_key
-        self.exchangerates_api_key = settings.exchangerates_api_key
-        self.coingecko_api_url = "https://api.coingecko.com/api/v3/simple/"
-        self.exchangerates_api_url = "https://v6.exchangerate-api.com/v6"
-
         self.FIAT_CURRENCIES = ["USD", "EUR", "RUB", "CZK"]
         self.CRYPTO_CURRENCIES = ["BTC", "ETH", "XMR"]
         self.CRYPTO_ID_MAP = {
@@ -21,5 +21,61 @@ class ParserConfig:
         self.BASE_CURRENCY = "USD"
 
         self.REQUEST_TIMEOUT = 10
+        self.HTTP_POOL_SIZE = 4
         self.rates_path = "data/rates.json"
+        self.rates_table_path = "data/rates.bin"
         self.exchange_path = "data/exchange_rates.json"
+        self.history_path = "data/history"
+        self.HISTORY_SEGMENT_SIZE = 16 * 1024 * 1024
+
+    @property
+    def coingecko_api_key(self) -> str:
+        return settings.coingeko_api_key
+
+    @property
+    def exchangerates_api_key(self) -> str:
+        return settings.exchangerates_api_key
+
+    @property
+    def coingecko_api_url(self) -> str:
+        return settings.get("coingecko_api_url", "https://api.coingecko.com/api/v3/simple/")
+
+    @property
+    def exchangerates_api_url(self) -> str:
+        return settings.get("exchangerates_api_url", "https://v6.exchangerate-api.com/v6")
+
+    def source_ttl(self, source: str) -> float:
+        """
+        Get ttl of rates of one source, rates_ttl_by_source overrides rates_ttl_seconds
+        :param source: source name
+        :return: ttl in seconds
+        """
+        return settings.get("rates_ttl_by_source", {}).get(source, settings.rates_ttl_seconds)
+
+    @property
+    def api_retries(self) -> int:
+        return settings.get("api_retries", 2)
+
+    @property
+    def api_backoff_seconds(self) -> float:
+        return settings.get("api_backoff_seconds", 0.5)
+
+    @property
+    def api_max_backoff_seconds(self) -> float:
+        return settings.get("api_max_backoff_seconds", 4)
+
+    @property
+    def circuit_failure_threshold(self) -> int:
+        return settings.get("circuit_failure_threshold", 5)
+
+    @property
+    def circuit_reset_seconds(self) -> float:
+        return settings.get("circuit_reset_seconds", 60)
+
+    @property
+    def update_budget_seconds(self) -> float:
+        return settings.get("update_budget_seconds", 15)
+
+    @property
+    def history_retention_days(self) -> Optional[float]:
+        return settings.get("history_retention_days")
@@ -0,0 +1,891 @@
+import bisect
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from datetime import datetime
+from time import time
+from typing import Iterator, Optional
+
+from ..infra.files import atomic_write_json, iter_json_array
+from ..infra.locks import file_lock
+from .config import ParserConfig
+
+config = ParserConfig()
+
+PAIR_PATTERN = re.compile(r"^[A-Z0-9]+_[A-Z0-9]+$")
+
+
+def to_epoch(timestamp: str) -> float:
+    """
+    Convert history timestamp to epoch seconds
+    :param timestamp: timestamp in %Y-%m-%d %H:%M:%S format
+    :return: epoch seconds
+    """
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def check_pair(pair: str) -> str:
+    """
+    Check pair name before it becomes part of index file name
+    :param pair: pair name, e.g. BTC_USD
+    :raises ValueError: if pair is not two currency codes joined by underscore
+    :return: pair name
+    """
+    if not PAIR_PATTERN.match(pair):
+        raise ValueError(f"Неверная пара '{pair}', ожидается формат BTC_USD")
+    return pair
+
+
+class _EpochColumn:
+    """
+    Sequence view over epochs of mapped index file, used for bisect
+    """
+    def __init__(self, buffer, record: struct.Struct):
+        self._buffer = buffer
+        self._record = record
+        self._len = len(buffer) // record.size
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        return self._record.unpack_from(self._buffer, i * self._record.size)[0]
+
+
+class RateIndex:
+    """
+    Per-pair index of history sorted by time
+    Every pair has its own file of packed (epoch, rate) records
+    :param path: directory of the index
+    """
+    RECORD = struct.Struct("<dd")
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _pair_path(self, pair: str) -> str:
+        return os.path.join(self.path, f"{check_pair(pair)}.idx")
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    def _last_epoch(self, pair_path: str) -> Optional[float]:
+        """
+        Get epoch of last record of pair index
+        :param pair_path: path to pair index
+        :return: epoch or None if index is empty
+        """
+        try:
+            size = os.path.getsize(pair_path)
+        except FileNotFoundError:
+            return None
+        size -= size % self.RECORD.size
+        if size == 0:
+            return None
+        with open(pair_path, "rb") as f:
+            f.seek(size - self.RECORD.size)
+            return self.RECORD.unpack(f.read(self.RECORD.size))[0]
+
+    def add(self, records: list[dict]):
+        """
+        Add history records to index
+        In-order records are appended, late records are merged into the pair file
+        :param records: list of history records
+        :return: None
+        """
+        os.makedirs(self.path, exist_ok=True)
+        by_pair = {}
+        for record in records:
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            by_pair.setdefault(pair, []).append((to_epoch(record["timestamp"]), float(record["rate"])))
+
+        for pair, ticks in by_pair.items():
+            ticks.sort(key=lambda tick: tick[0])
+            pair_path = self._pair_path(pair)
+            last_epoch = self._last_epoch(pair_path)
+            if last_epoch is None or ticks[0][0] >= last_epoch:
+                with open(pair_path, "ab") as f:
+                    f.truncate(f.tell() - f.tell() % self.RECORD.size)
+                    f.write(b"".join(self.RECORD.pack(*tick) for tick in ticks))
+                continue
+
+            merged = sorted(self._read_all(pair) + ticks, key=lambda tick: tick[0])
+            tmp_path = pair_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(self.RECORD.pack(*tick) for tick in merged))
+            os.replace(tmp_path, pair_path)
+
+    def _read_all(self, pair: str) -> list[tuple[float, float]]:
+        try:
+            with open(self._pair_path(pair), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        data = data[:len(data) - len(data) % self.RECORD.size]
+        return list(self.RECORD.iter_unpack(data))
+
+    def _search(self, pair: str, fn):
+        """
+        Run fn(buffer, epochs) over mapped pair index
+        :param pair: pair name
+        :param fn: function of buffer and epoch column
+        :return: result of fn, None if pair has no index
+        """
+        try:
+            f = open(self._pair_path(pair), "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size < self.RECORD.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return fn(mm, _EpochColumn(mm, self.RECORD))
+
+    def as_of(self, pair: str, epoch: float) -> Optional[tuple[float, float]]:
+        """
+        Get last tick of pair at or before epoch
+        :param pair: pair name
+        :param epoch: epoch seconds
+        :return: (epoch, rate) or None
+        """
+        def find(mm, epochs):
+            i = bisect.bisect_right(epochs, epoch)
+            if i == 0:
+                return None
+            return self.RECORD.unpack_from(mm, (i - 1) * self.RECORD.size)
+
+        return self._search(pair, find)
+
+    def between(self, pair: str, start: Optional[float], end: Optional[float]) -> list[tuple[float, float]]:
+        """
+        Get ticks of pair in time range, both ends included
+        :param pair: pair name
+        :param start: epoch seconds, None for beginning of history
+        :param end: epoch seconds, None for end of history
+        :return: list of (epoch, rate)
+        """
+        def find(mm, epochs):
+            lo = 0 if start is None else bisect.bisect_left(epochs, start)
+            hi = len(epochs) if end is None else bisect.bisect_right(epochs, end)
+            if lo >= hi:
+                return []
+            return list(self.RECORD.iter_unpack(mm[lo * self.RECORD.size:hi * self.RECORD.size]))
+
+        return self._search(pair, find) or []
+
+    def rebuild(self, records: Iterator[dict], chunk_size: int = 10000):
+        """
+        Build index from scratch
+        :param records: iterator of history records
+        :param chunk_size: number of records added at once
+        :return: None
+        """
+        if self.exists():
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+        os.makedirs(self.path, exist_ok=True)
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                self.add(chunk)
+                chunk = []
+        if chunk:
+            self.add(chunk)
+
+    def drop_before(self, epoch: float):
+        """
+        Remove ticks before moment
+        :param epoch: epoch seconds
+        :return: None
+        """
+        if not self.exists():
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(".idx"):
+                _drop_before(os.path.join(self.path, name), self.RECORD, epoch)
+
+
+class RollupIndex:
+    """
+    Per-pair OHLC bars of history for fixed intervals, updated incrementally with new ticks
+    Every pair and interval has its own file of packed bars sorted by start:
+    (start, open, high, low, close, open_epoch, close_epoch, count)
+    Minute and hour bars are aligned to epoch, day bars to local midnight
+    :param path: directory of rollups
+    """
+    BAR = struct.Struct("<7dq")
+    INTERVALS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _bars_path(self, interval: str, pair: str) -> str:
+        return os.path.join(self.path, interval, f"{check_pair(pair)}.bars")
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    @classmethod
+    def bucket(cls, epoch: float, interval: str) -> float:
+        """
+        Get start of bar containing moment
+        :param epoch: epoch seconds
+        :param interval: interval name
+        :return: epoch of bar start
+        """
+        if interval == "1d":
+            day = datetime.fromtimestamp(epoch).replace(hour=0, minute=0, second=0, microsecond=0)
+            return day.timestamp()
+        seconds = cls.INTERVALS[interval]
+        return epoch // seconds * seconds
+
+    @staticmethod
+    def _merge(bar: list, epoch: float, rate: float):
+        """
+        Merge tick into bar in place, ticks may come in any order
+        :param bar: bar as list
+        :param epoch: epoch of tick
+        :param rate: rate of tick
+        :return: None
+        """
+        if epoch < bar[5]:
+            bar[1], bar[5] = rate, epoch
+        if epoch >= bar[6]:
+            bar[4], bar[6] = rate, epoch
+        bar[2] = max(bar[2], rate)
+        bar[3] = min(bar[3], rate)
+        bar[7] += 1
+
+    def _read_all(self, path: str) -> list[list]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        data = data[:len(data) - len(data) % self.BAR.size]
+        return [list(bar) for bar in self.BAR.iter_unpack(data)]
+
+    def _last_bar(self, path: str) -> tuple[int, Optional[list]]:
+        """
+        Get size of whole bars in file and last bar
+        :param path: path to bars file
+        :return: (size, last bar or None)
+        """
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return 0, None
+        size -= size % self.BAR.size
+        if size == 0:
+            return 0, None
+        with open(path, "rb") as f:
+            f.seek(size - self.BAR.size)
+            return size, list(self.BAR.unpack(f.read(self.BAR.size)))
+
+    def _add_pair(self, interval: str, pair: str, ticks: list[tuple[float, float]]):
+        """
+        Merge sorted ticks of pair into bars of one interval
+        In-order ticks rewrite only the last bar and append new ones, late ticks rewrite the file
+        :param interval: interval name
+        :param pair: pair name
+        :param ticks: ticks sorted by epoch
+        :return: None
+        """
+        path = self._bars_path(interval, pair)
+        size, last = self._last_bar(path)
+        in_order = last is None or self.bucket(ticks[0][0], interval) >= last[0]
+        bars = ([last] if last else []) if in_order else self._read_all(path)
+        by_start = {bar[0]: bar for bar in bars}
+        for epoch, rate in ticks:
+            start = self.bucket(epoch, interval)
+            bar = by_start.get(start)
+            if bar is None:
+                by_start[start] = [start, rate, rate, rate, rate, epoch, epoch, 1]
+            else:
+                self._merge(bar, epoch, rate)
+        data = b"".join(self.BAR.pack(*bar) for _, bar in sorted(by_start.items()))
+
+        if in_order:
+            with open(path, "ab") as f:
+                f.truncate(size - (self.BAR.size if last else 0))
+                f.write(data)
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def add(self, records: list[dict]):
+        """
+        Add history records to bars of every interval
+        :param records: list of history records
+        :return: None
+        """
+        by_pair = {}
+        for record in records:
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            by_pair.setdefault(pair, []).append((to_epoch(record["timestamp"]), float(record["rate"])))
+        for interval in self.INTERVALS:
+            os.makedirs(os.path.join(self.path, interval), exist_ok=True)
+            for pair, ticks in by_pair.items():
+                ticks.sort(key=lambda tick: tick[0])
+                self._add_pair(interval, pair, ticks)
+
+    def between(
+        self, pair: str, interval: str, start: Optional[float], end: Optional[float]
+    ) -> list[tuple[float, float, float, float, float, int]]:
+        """
+        Get bars of pair which start in time range, both ends included
+        :param pair: pair name
+        :param interval: interval name, one of INTERVALS
+        :param start: epoch seconds, None for beginning of history
+        :param end: epoch seconds, None for end of history
+        :return: list of (start, open, high, low, close, count)
+        """
+        if interval not in self.INTERVALS:
+            raise ValueError(f"Неизвестный интервал '{interval}', доступные: {', '.join(self.INTERVALS)}")
+        try:
+            f = open(self._bars_path(interval, pair), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            if os.fstat(f.fileno()).st_size < self.BAR.size:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                starts = _EpochColumn(mm, self.BAR)
+                lo = 0 if start is None else bisect.bisect_left(starts, self.bucket(start, interval))
+                hi = len(starts) if end is None else bisect.bisect_right(starts, end)
+                return [
+                    (bar[0], bar[1], bar[2], bar[3], bar[4], bar[7])
+                    for bar in self.BAR.iter_unpack(mm[lo * self.BAR.size:hi * self.BAR.size])
+                ]
+
+    def drop_before(self, interval: str, epoch: float):
+        """
+        Remove bars of interval which end before moment
+        :param interval: interval name
+        :param epoch: epoch seconds
+        :return: None
+        """
+        directory = os.path.join(self.path, interval)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.endswith(".bars"):
+                _drop_before(os.path.join(directory, name), self.BAR, self.bucket(epoch, interval))
+
+    def rebuild(self, records: Iterator[dict], chunk_size: int = 10000):
+        """
+        Build rollups from scratch
+        :param records: iterator of history records
+        :param chunk_size: number of records added at once
+        :return: None
+        """
+        if self.exists():
+            for interval in os.listdir(self.path):
+                directory = os.path.join(self.path, interval)
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                self.add(chunk)
+                chunk = []
+        if chunk:
+            self.add(chunk)
+        os.makedirs(self.path, exist_ok=True)
+
+
+def _drop_before(path: str, record: struct.Struct, epoch: float):
+    """
+    Remove records with first field before epoch from sorted file of packed records
+    :param path: path to file
+    :param record: record layout, first field is epoch
+    :param epoch: epoch seconds
+    :return: None
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    data = data[:len(data) - len(data) % record.size]
+    keep = bisect.bisect_left(_EpochColumn(data, record), epoch)
+    if keep == 0:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data[keep * record.size:])
+    os.replace(tmp_path, path)
+
+
+class HistoryStore:
+    """
+    Append-only rate history split into JSONL segments
+    Segments are rolled by day or by size, list of segments is kept in manifest.json.
+    Ticks older than retention are compacted away, hour and day bars are kept forever
+    :param path: directory of the store
+    :param segment_size: max size of one segment in bytes
+    :param retention: seconds raw ticks and minute bars are kept, history_retention_days from settings if None
+    """
+    MANIFEST = "manifest.json"
+    COMPACTED_INTERVALS = ("1m",)
+
+    def __init__(self, path: str, segment_size: int, retention: Optional[float] = None):
+        self.path = path
+        self.segment_size = segment_size
+        self.retention = retention
+        self.index = RateIndex(os.path.join(path, "index"))
+        self.rollups = RollupIndex(os.path.join(path, "rollups"))
+        self._manifest = None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, self.MANIFEST)
+
+    def _load_manifest(self, reload: bool = False) -> dict:
+        """
+        Load manifest from disk, create empty store if it does not exist
+        :param reload: read manifest again even if it is already loaded
+        :return: manifest
+        """
+        if self._manifest is None or reload:
+            try:
+                with open(self._manifest_path(), "r") as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                os.makedirs(self.path, exist_ok=True)
+                self._manifest = {"version": 1, "segments": []}
+        return self._manifest
+
+    def _save_manifest(self):
+        """
+        Write manifest atomically
+        :return: None
+        """
+        atomic_write_json(self._manifest_path(), self._manifest, indent=2)
+
+    def _new_segment(self, day: str) -> dict:
+        """
+        Register new segment in manifest
+        :param day: day of first record in segment, YYYYMMDD
+        :return: segment info
+        """
+        manifest = self._load_manifest()
+        number = sum(1 for segment in manifest["segments"] if segment["day"] == day)
+        segment = {
+            "name": f"segment-{day}-{number:04d}.jsonl",
+            "day": day,
+            "first_ts": None,
+            "last_ts": None,
+            "records": 0,
+            "size": 0,
+        }
+        manifest["segments"].append(segment)
+        return segment
+
+    def _active_segment(self, day: str) -> dict:
+        """
+        Get segment new records should be appended to
+        :param day: day of records, YYYYMMDD
+        :return: segment info
+        """
+        segments = self._load_manifest()["segments"]
+        if segments and segments[-1]["day"] == day and segments[-1]["size"] < self.segment_size:
+            return segments[-1]
+        return self._new_segment(day)
+
+    def _repair_tail(self, segment_path: str) -> int:
+        """
+        Drop partially written last line of segment left by a crash
+        :param segment_path: path to segment
+        :return: size of segment after repair
+        """
+        try:
+            size = os.path.getsize(segment_path)
+        except FileNotFoundError:
+            return 0
+        if size == 0:
+            return 0
+        with open(segment_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return size
+            block = 4096
+            pos = size
+            while pos > 0:
+                start = max(0, pos - block)
+                f.seek(start)
+                chunk = f.read(pos - start)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    f.truncate(start + newline + 1)
+                    return start + newline + 1
+                pos = start
+            f.truncate(0)
+            return 0
+
+    def append(self, records: list[dict], migration: Optional[dict] = None):
+        """
+        Append records to history and fsync them
+        :param records: list of history records
+        :param migration: progress of legacy migration, saved in manifest together with records
+        :return: None
+        """
+        if not records:
+            return
+        had_history = bool(self._load_manifest(reload=True)["segments"])
+        if migration is not None:
+            self._manifest["migration"] = migration
+        by_day = {}
+        for record in records:
+            day = datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S").strftime("%Y%m%d")
+            by_day.setdefault(day, []).append(record)
+
+        for day, day_records in by_day.items():
+            segment = self._active_segment(day)
+            segment_path = os.path.join(self.path, segment["name"])
+            segment["size"] = self._repair_tail(segment_path)
+            with open(segment_path, "ab") as f:
+                for record in day_records:
+                    line = (json.dumps(record, sort_keys=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    segment["size"] += len(line)
+                    segment["records"] += 1
+                    if segment["first_ts"] is None or record["timestamp"] < segment["first_ts"]:
+                        segment["first_ts"] = record["timestamp"]
+                    if segment["last_ts"] is None or record["timestamp"] > segment["last_ts"]:
+                        segment["last_ts"] = record["timestamp"]
+                f.flush()
+                os.fsync(f.fileno())
+        self._save_manifest()
+        if had_history and not self.index.exists():
+            self.index.rebuild(self.iter_records())
+        else:
+            self.index.add(records)
+        if had_history and not self.rollups.exists():
+            self.rollups.rebuild(self.iter_records())
+        else:
+            self.rollups.add(records)
+        retention = self.retention
+        if retention is None and config.history_retention_days:
+            retention = config.history_retention_days * 86400
+        if retention:
+            self.compact(time() - retention)
+
+    def compact(self, before: float) -> int:
+        """
+        Remove segments whose records are all older than moment, ticks and minute bars before moment
+        Segments hold one day, so a segment with older records stays until all its records expire
+        :param before: epoch seconds
+        :return: number of removed records
+        """
+        cutoff = datetime.fromtimestamp(before).strftime("%Y-%m-%d %H:%M:%S")
+        manifest = self._load_manifest(reload=True)
+        expired = [
+            segment for segment in manifest["segments"]
+            if segment["last_ts"] is not None and segment["last_ts"] < cutoff
+        ]
+        if not expired:
+            return 0
+        manifest["segments"] = [segment for segment in manifest["segments"] if segment not in expired]
+        self._save_manifest()
+        for segment in expired:
+            try:
+                os.remove(os.path.join(self.path, segment["name"]))
+            except FileNotFoundError:
+                pass
+        self.index.drop_before(before)
+        for interval in self.COMPACTED_INTERVALS:
+            self.rollups.drop_before(interval, before)
+        return sum(segment["records"] for segment in expired)
+
+    def segments(self) -> list[dict]:
+        """
+        Get segments of history in write order
+        :return: list of segment info
+        """
+        return list(self._load_manifest(reload=True)["segments"])
+
+    def iter_segment(self, segment: dict) -> Iterator[dict]:
+        """
+        Iterate over records of one segment
+        :param segment: segment info
+        :return: iterator of records
+        """
+        try:
+            f = open(os.path.join(self.path, segment["name"]), "r")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def iter_records(self) -> Iterator[dict]:
+        """
+        Iterate over all records of history
+        :return: iterator of records
+        """
+        for segment in self.segments():
+            yield from self.iter_segment(segment)
+
+    def get_index(self) -> RateIndex:
+        """
+        Get per-pair time index, build it from segments if it is missing
+        :return: index
+        """
+        if not self.index.exists() and not self.is_empty():
+            self.index.rebuild(self.iter_records())
+        return self.index
+
+    def get_rollups(self) -> RollupIndex:
+        """
+        Get OHLC rollups, build them from segments if they are missing
+        :return: rollups
+        """
+        if not self.rollups.exists() and not self.is_empty():
+            self.rollups.rebuild(self.iter_records())
+        return self.rollups
+
+    def is_empty(self) -> bool:
+        return not self._load_manifest(reload=True)["segments"]
+
+    def iter_history(
+        self,
+        pair: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        source: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """
+        Stream records of history matching filters in stored order, one line in memory at a time
+        Segments outside of time range are skipped by manifest, lines of other pairs are skipped before parsing
+        :param pair: pair name, e.g. BTC_USD, all pairs if None
+        :param start: epoch seconds, both ends of range are included, None for beginning of history
+        :param end: epoch seconds, None for end of history
+        :param source: source name, all sources if None
+        :return: iterator of records
+        """
+        start_ts = datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M:%S") if start is not None else None
+        end_ts = datetime.fromtimestamp(end).strftime("%Y-%m-%d %H:%M:%S") if end is not None else None
+        pair = pair.upper() if pair else None
+        needle = f'"from_currency": "{pair.split("_")[0]}"' if pair else None
+
+        for segment in self.segments():
+            if start_ts and segment["last_ts"] and segment["last_ts"] < start_ts:
+                continue
+            if end_ts and segment["first_ts"] and segment["first_ts"] > end_ts:
+                continue
+            try:
+                f = open(os.path.join(self.path, segment["name"]), "r")
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    if needle is not None and needle not in line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if pair and f"{record['from_currency']}_{record['to_currency']}" != pair:
+                        continue
+                    if source and record.get("source") != source:
+                        continue
+                    if (start_ts and record["timestamp"] < start_ts) or (end_ts and record["timestamp"] > end_ts):
+                        continue
+                    yield record
+
+    def _truncate_to_manifest(self):
+        """
+        Drop records written after the last manifest save: tails of segments beyond their size in manifest
+        and segments missing in manifest
+        :return: None
+        """
+        segments = self._load_manifest(reload=True)["segments"]
+        for segment in segments:
+            segment_path = os.path.join(self.path, segment["name"])
+            if os.path.exists(segment_path) and os.path.getsize(segment_path) > segment["size"]:
+                os.truncate(segment_path, segment["size"])
+        names = {segment["name"] for segment in segments}
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name.endswith(".jsonl") and name not in names:
+                os.remove(os.path.join(self.path, name))
+
+    def migrate_from_json(self, json_path: str, chunk_size: int = 10000) -> int:
+        """
+        Migration of legacy exchange_rates.json array into the store
+        The array is streamed twice: first to validate it, then to append records in chunks sorted by time.
+        Number of migrated records is saved in manifest with every chunk, so an interrupted migration
+        continues after them. Completion is recorded in manifest, then legacy file is renamed to
+        <json_path>.migrated
+        :param json_path: path to exchange_rates.json
+        :param chunk_size: number of records per append
+        :return: number of records migrated by this call
+        """
+        with file_lock(json_path):
+            if not os.path.exists(json_path):
+                return 0
+            manifest = self._load_manifest(reload=True)
+            migration = manifest.get("migration")
+            if migration is None and manifest["segments"]:
+                print(
+                    f"[WARNING] {json_path} is not migrated: history already has records not written by migration",
+                    file=sys.stderr,
+                )
+                return 0
+            migrated = 0
+            if migration is None or not migration["done"]:
+                try:
+                    for _ in iter_json_array(json_path):
+                        pass
+                except json.JSONDecodeError as e:
+                    print(f"[WARNING] {json_path} is not migrated: {e}", file=sys.stderr)
+                    return 0
+                resumed = migration is not None
+                if resumed:
+                    self._truncate_to_manifest()
+                else:
+                    migration = manifest["migration"] = {"records": 0, "done": False}
+                    self._save_manifest()
+                done = migration["records"]
+                chunk = []
+                for number, record in enumerate(iter_json_array(json_path)):
+                    if number < done:
+                        continue
+                    chunk.append(record)
+                    if len(chunk) >= chunk_size:
+                        migrated += self._migrate_chunk(chunk, done + migrated)
+                        chunk = []
+                if chunk:
+                    migrated += self._migrate_chunk(chunk, done + migrated)
+                if resumed:
+                    self.index.rebuild(self.iter_records())
+                    self.rollups.rebuild(self.iter_records())
+                manifest = self._load_manifest(reload=True)
+                manifest["migration"] = {"records": done + migrated, "done": True}
+                self._save_manifest()
+            os.replace(json_path, json_path + ".migrated")
+            return migrated
+
+    def _migrate_chunk(self, chunk: list[dict], done: int) -> int:
+        """
+        Append chunk of legacy records sorted by time with migration progress
+        :param chunk: records
+        :param done: number of records migrated before chunk
+        :return: number of records in chunk
+        """
+        chunk.sort(key=lambda record: record["timestamp"])
+        self.append(chunk, {"records": done + len(chunk), "done": False})
+        return len(chunk)
+
+
+history_store = HistoryStore(config.history_path, config.HISTORY_SEGMENT_SIZE)
+
+
+def get_history_store(migrate: bool = True) -> HistoryStore:
+    """
+    Get history store, migrating legacy exchange_rates.json on first use
+    :param migrate: run migration if legacy file exists
+    :return: history store
+    """
+    if migrate and os.path.exists(config.exchange_path):
+        history_store.migrate_from_json(config.exchange_path)
+    return history_store
+
+
+def parse_timestamp(value: str) -> float:
+    """
+    Parse user timestamp to epoch seconds
+    :param value: timestamp in ISO format, e.g. 2026-03-01 14:00
+    :return: epoch seconds
+    """
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Неверный формат времени '{value}', ожидается YYYY-MM-DD HH:MM:SS")
+
+
+def get_rate_at(pair: str, at: float) -> Optional[tuple[float, float]]:
+    """
+    Get rate of pair at moment of time
+    :param pair: pair name, e.g. BTC_USD
+    :param at: epoch seconds
+    :return: (epoch, rate) of last tick at or before moment, None if there is no such tick
+    """
+    return get_history_store().get_index().as_of(pair, at)
+
+
+def get_rates_between(pair: str, start: Optional[float], end: Optional[float]) -> list[tuple[float, float]]:
+    """
+    Get rates of pair in time range
+    :param pair: pair name, e.g. BTC_USD
+    :param start: epoch seconds, None for beginning of history
+    :param end: epoch seconds, None for end of history
+    :return: list of (epoch, rate)
+    """
+    return get_history_store().get_index().between(pair, start, end)
+
+
+def get_bars(
+    pair: str, interval: str, start: Optional[float], end: Optional[float]
+) -> list[tuple[float, float, float, float, float, int]]:
+    """
+    Get OHLC bars of pair in time range
+    :param pair: pair name, e.g. BTC_USD
+    :param interval: 1m, 1h or 1d
+    :param start: epoch seconds, None for beginning of history
+    :param end: epoch seconds, None for end of history
+    :return: list of (start, open, high, low, close, count)
+    """
+    return get_history_store().get_rollups().between(pair, interval, start, end)
+
+
+def iter_history(
+    pair: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    source: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Stream history records with constant memory
+    :param pair: pair name, e.g. BTC_USD, all pairs if None
+    :param start: epoch seconds, None for beginning of history
+    :param end: epoch seconds, None for end of history
+    :param source: source name, all sources if None
+    :return: iterator of records in stored order
+    """
+    return get_history_store().iter_history(pair, start, end, source)
+
+
+EXPORT_FIELDS = ["id", "from_currency", "to_currency", "rate", "timestamp", "source", "raw_id", "request_ms"]
+
+
+def write_history(f, records: Iterator[dict], fmt: str) -> int:
+    """
+    Write history records to text stream as they come
+    :param f: text stream
+    :param records: iterator of records
+    :param fmt: csv or jsonl
+    :return: number of written records
+    """
+    count = 0
+    if fmt == "jsonl":
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    elif fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+        for record in records:
+            meta = record.get("meta") or {}
+            writer.writerow([record.get(field, meta.get(field)) for field in EXPORT_FIELDS])
+            count += 1
+    else:
+        raise ValueError(f"Неизвестный формат '{fmt}', доступные: csv, jsonl")
+    return count
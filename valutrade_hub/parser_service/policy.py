@@ -0,0 +1,199 @@
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+from typing import Optional
+
+from ..core.exceptions import ApiRequestError
+from ..metrics import metrics
+from .api_clients import BaseApiClient, deadline, invalid_response
+from .config import ParserConfig
+
+config = ParserConfig()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse Retry-After header, which is either number of seconds or HTTP date
+    :param value: header value
+    :return: delay in seconds, None if header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one provider
+    After failure_threshold consecutive failures the circuit opens and calls fail fast for reset_timeout,
+    then one trial call is let through (half-open): success closes the circuit, failure opens it again
+    :param failure_threshold: consecutive failures to open circuit
+    :param reset_timeout: seconds circuit stays open
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def open_for(self) -> float:
+        """
+        Get time left until trial call is allowed
+        :return: seconds, 0 if circuit is closed or trial is allowed
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - monotonic())
+
+    def allow(self) -> bool:
+        """
+        Check if call is allowed, in half-open state only one caller gets the trial call
+        :return: True if call is allowed
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if monotonic() - self.opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = monotonic()
+            self._trial = False
+
+    def release(self):
+        """
+        Finish call which tells nothing about provider health, trial call is allowed again
+        :return: None
+        """
+        with self._lock:
+            self._trial = False
+
+
+class ResilientClient(BaseApiClient):
+    """
+    Policy layer around api client: bounded retries with exponential backoff and jitter,
+    Retry-After of 429 responses, circuit breaker and latency budget of one fetch
+    :param name: provider name for errors and metrics
+    :param client: wrapped api client
+    :param retries: retries after first attempt
+    :param backoff: delay before first retry in seconds, doubled on every retry
+    :param max_backoff: max delay between retries in seconds
+    :param breaker: circuit breaker of provider
+    """
+    def __init__(
+        self,
+        name: str,
+        client: BaseApiClient,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__()
+        self.name = name
+        self.client = client
+        self.currencies = client.currencies
+        self.retries = config.api_retries if retries is None else retries
+        self.backoff = config.api_backoff_seconds if backoff is None else backoff
+        self.max_backoff = config.api_max_backoff_seconds if max_backoff is None else max_backoff
+        self.breaker = breaker or CircuitBreaker(config.circuit_failure_threshold, config.circuit_reset_seconds)
+
+    def _retry_delay(self, attempt: int, error: ApiRequestError) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if getattr(error, "status", None) == 429:
+            retry_after = parse_retry_after(getattr(error, "retry_after", None))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def fetch_rates(self, codes: Optional[list[str]] = None) -> dict:
+        """
+        Fetch rates through wrapped client
+        Connection errors, timeouts, 429, 5xx and responses which can not be parsed are retried until deadline
+        of current update, other errors fail at once. Without deadline the fetch gets update_budget_seconds.
+        Circuit breaker counts one failure per fetch, only if its last error was retryable:
+        other 4xx responses are errors of request, not of provider
+        :param codes: codes of currencies to fetch
+        :return: dict of pair name to rate
+        """
+        if not self.breaker.allow():
+            metrics.observe(f"circuit_open.{self.name}", 0)
+            raise ApiRequestError(f"{self.name} is unavailable, circuit is open for {self.breaker.open_for():.0f}s")
+        expires = deadline.get()
+        token = None
+        if expires is None:
+            expires = monotonic() + config.update_budget_seconds
+            token = deadline.set(expires)
+        try:
+            rates = self._fetch_with_retries(codes, expires)
+        except ApiRequestError as e:
+            if getattr(e, "retryable", False):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            if token is not None:
+                deadline.reset(token)
+        self.breaker.record_success()
+        return rates
+
+    def _fetch_with_retries(self, codes: Optional[list[str]], expires: float) -> dict:
+        """
+        Fetch rates, retrying retryable errors while retries and time are left
+        :param codes: codes of currencies to fetch
+        :param expires: monotonic deadline
+        :return: dict of pair name to rate
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.client.fetch_rates(codes)
+            except ApiRequestError as e:
+                error = e
+            except Exception as e:
+                # client failed on response it did not expect
+                error = invalid_response(f"{type(e).__name__}: {e}")
+                error.__cause__ = e
+            if attempt >= self.retries or not getattr(error, "retryable", False):
+                raise error
+            delay = self._retry_delay(attempt, error)
+            if monotonic() + delay >= expires:
+                budget_error = ApiRequestError(f"{self.name}: latency budget exceeded, last error: {error}")
+                budget_error.retryable = True
+                raise budget_error from error
+            with metrics.timed(f"retry_backoff.{self.name}"):
+                sleep(delay)
+            attempt += 1
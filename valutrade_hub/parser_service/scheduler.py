@@ -0,0 +1,246 @@
+import random
+import sys
+import threading
+from datetime import datetime
+from time import monotonic, sleep, time
+from typing import Optional
+
+from ..core.currencies import get_snapshot
+from ..core.exceptions import ApiRequestError
+from .config import ParserConfig
+from .updater import RatesUpdater
+
+config = ParserConfig()
+
+
+class RatesScheduler:
+    """
+    Background refresher of rates cache
+    Every source is refreshed before its pairs exceed ttl of source (rates_ttl_by_source or rates_ttl_seconds),
+    readers keep using the current cache while refresh is running (stale-while-revalidate)
+    :param updater: rates updater
+    :param ttl: ttl of rates of every source in seconds, ttl from settings if None
+    :param margin: part of ttl left when refresh starts
+    :param jitter: max part of ttl added as random jitter
+    :param max_backoff: max delay in seconds between retries of failed source
+    """
+    def __init__(
+        self,
+        updater: Optional[RatesUpdater] = None,
+        ttl: Optional[float] = None,
+        margin: float = 0.2,
+        jitter: float = 0.1,
+        max_backoff: float = 300,
+    ):
+        self.updater = updater or RatesUpdater()
+        self.ttl = ttl
+        self.margin = margin
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._state = {
+            name: {
+                "next_run": 0.0,
+                "last_attempt": None,
+                "last_success": None,
+                "lag": None,
+                "failures": 0,
+                "total_failures": 0,
+                "refreshes": 0,
+                "last_error": None,
+            }
+            for name in self.updater.sources
+        }
+
+    def source_ttl(self, source: str) -> float:
+        return self.ttl or config.source_ttl(source)
+
+    def _oldest_age(self, source: str) -> Optional[float]:
+        """
+        Get age of the oldest pair of source in cache
+        :param source: source name
+        :return: age in seconds, None if source has no pairs in cache
+        """
+        try:
+            pairs = get_snapshot().pairs
+        except ValueError:
+            return None
+        updated = [
+            datetime.strptime(pair["updated_at"], "%Y-%m-%d %H:%M:%S").timestamp()
+            for pair in pairs.values()
+            if pair.get("source") == source
+        ]
+        if not updated:
+            return None
+        return time() - min(updated)
+
+    def _due_in(self, source: str) -> float:
+        """
+        Get delay until source should be refreshed
+        :param source: source name
+        :return: delay in seconds
+        """
+        age = self._oldest_age(source)
+        if age is None:
+            return 0.0
+        ttl = self.source_ttl(source)
+        refresh_at = ttl * (1 - self.margin) - random.uniform(0, ttl * self.jitter)
+        return max(0.0, refresh_at - age)
+
+    def _refresh(self, source: str):
+        """
+        Refresh one source and update its metrics
+        :param source: source name
+        :return: None
+        """
+        state = self._state[source]
+        age = self._oldest_age(source)
+        with self._lock:
+            state["last_attempt"] = time()
+            state["lag"] = None if age is None else age - self.source_ttl(source)
+        try:
+            self.updater.run_update(source, verbose=False)
+        except ApiRequestError as e:
+            self._failed(source, str(e))
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Refresh of {source} failed: {error}", file=sys.stderr)
+            self._failed(source, error)
+            return
+
+        with self._lock:
+            state["failures"] = 0
+            state["refreshes"] += 1
+            state["last_success"] = time()
+            state["last_error"] = None
+            state["next_run"] = monotonic() + self._due_in(source)
+
+    def _failed(self, source: str, error: str):
+        """
+        Record failed refresh and schedule retry with exponential backoff
+        :param source: source name
+        :param error: error message
+        :return: None
+        """
+        state = self._state[source]
+        with self._lock:
+            state["failures"] += 1
+            state["total_failures"] += 1
+            state["last_error"] = error
+            backoff = min(self.max_backoff, 2 ** state["failures"])
+            state["next_run"] = monotonic() + backoff + random.uniform(0, backoff * self.jitter)
+
+    def run_once(self) -> float:
+        """
+        Refresh every source that is due
+        :return: delay in seconds until next source is due
+        """
+        for source, state in self._state.items():
+            if self._stop.is_set():
+                break
+            if monotonic() >= state["next_run"]:
+                self._refresh(source)
+        return max(0.0, min(state["next_run"] for state in self._state.values()) - monotonic())
+
+    def run_forever(self):
+        """
+        Refresh sources until stop() is called
+        :return: None
+        """
+        while not self._stop.is_set():
+            self._stop.wait(max(self.run_once(), 1.0))
+
+    def start(self):
+        """
+        Start refresher in daemon thread
+        :return: None
+        """
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="rates-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop refresher
+        :param timeout: time to wait for refresher thread
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def metrics(self) -> dict:
+        """
+        Get refresher metrics of every source
+        :return: dict of metrics
+        """
+        with self._lock:
+            metrics = {}
+            for source, state in self._state.items():
+                age = self._oldest_age(source)
+                breaker = getattr(self.updater.sources[source][1], "breaker", None)
+                metrics[source] = {
+                    "last_attempt": state["last_attempt"],
+                    "last_success": state["last_success"],
+                    "age": age,
+                    "lag": state["lag"],
+                    "failures": state["failures"],
+                    "total_failures": state["total_failures"],
+                    "refreshes": state["refreshes"],
+                    "last_error": state["last_error"],
+                    "next_run_in": max(0.0, state["next_run"] - monotonic()),
+                    "circuit": breaker.state if breaker is not None else None,
+                }
+            return metrics
+
+
+def format_metrics(metrics: dict) -> str:
+    """
+    Format refresher metrics for output
+    :param metrics: metrics from RatesScheduler.metrics
+    :return: formatted string
+    """
+    def fmt_time(value):
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S") if value else "never"
+
+    def fmt_seconds(value):
+        return f"{value:.1f}s" if value is not None else "-"
+
+    return "\n".join(
+        f"{source}: last_success={fmt_time(m['last_success'])} age={fmt_seconds(m['age'])} "
+        f"lag={fmt_seconds(m['lag'])} failures={m['failures']} total_failures={m['total_failures']} "
+        f"refreshes={m['refreshes']} next_run_in={fmt_seconds(m['next_run_in'])}"
+        + (f" circuit={m['circuit']}" if m.get("circuit") else "")
+        + (f" last_error={m['last_error']}" if m["last_error"] else "")
+        for source, m in metrics.items()
+    )
+
+
+def main():
+    """
+    Entry point of valutrade-updater, refreshes rates until interrupted
+    :return: None
+    """
+    scheduler = RatesScheduler()
+    ttls = ", ".join(f"{source} {scheduler.source_ttl(source)}s" for source in scheduler.updater.sources)
+    print(f"[INFO] Rates refresher started, ttl: {ttls}")
+    try:
+        while True:
+            delay = scheduler.run_once()
+            print(format_metrics(scheduler.metrics()))
+            sleep(max(delay, 1.0))
+    except KeyboardInterrupt:
+        print("[INFO] Rates refresher stopped")
+
+
+if __name__ == "__main__":
+    main()
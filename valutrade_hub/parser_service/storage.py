@@ -1,16 +1,33 @@
 import json
 from datetime import datetime
 
+from ..infra.files import atomic_write_json
+from ..infra.locks import file_lock
+from ..infra.rate_table import RateTable
+from ..metrics import metrics
 from .config import ParserConfig
+from .history import get_history_store
 
 config = ParserConfig()
 
 
-def save_rates(rates: dict, request_s: float):
+def save_rates(rates: dict, timings: dict[str, float]):
     """
     Save rates to file
     :param rates: dict of rates
-    :param request_s: request time
+    :param timings: request time in seconds of every source
+    :return: None
+    """
+    with metrics.timed("phase.rates_persist"), file_lock(config.rates_path):
+        _save_rates(rates, timings)
+
+
+def _save_rates(rates: dict, timings: dict[str, float]):
+    """
+    Merge rates into rates.json, publish them to binary rate table and append them to history
+    Caller holds lock of rates.json, so concurrent updaters do not lose each other's pairs
+    :param rates: dict of rates
+    :param timings: request time in seconds of every source
     :return: None
     """
     try:
@@ -36,16 +53,14 @@ def save_rates(rates: dict, request_s: float):
     rates_json_old["pairs"].update(rates_json["pairs"])
     rates_json_old["last_refresh"] = rates_json["last_refresh"]
 
-    with open(f"{config.rates_path}", "w") as f:
-        json.dump(rates_json_old, f, indent=2)
-
-    try:
-        with open(f"{config.exchange_path}", "r") as f:
-            exchange_rates_json_old = json.load(f)
-    except FileNotFoundError:
-        exchange_rates_json_old = []
-    except json.JSONDecodeError:
-        exchange_rates_json_old = []
+    atomic_write_json(config.rates_path, rates_json_old, indent=2)
+    RateTable.publish(
+        config.rates_table_path,
+        rates_json_old["pairs"],
+        rates_json_old["last_refresh"],
+        config.BASE_CURRENCY,
+        config.rates_path,
+    )
 
     exchange_rates_json = [
         {
@@ -61,12 +76,9 @@ def save_rates(rates: dict, request_s: float):
                     if value["source"] == "exchange_rates"
                     else config.CRYPTO_ID_MAP[key.split("_")[0]]
                 ),
-                "request_ms": request_s * 1000,
+                "request_ms": timings.get(value["source"], 0.0) * 1000,
             },
         }
         for key, value in rates.items()
     ]
-    exchange_rates_json_old += exchange_rates_json
-    with open(f"{config.exchange_path}", "w") as f:
-        json.dump(exchange_rates_json_old, f, sort_keys=False, indent=2)
-        f.write("\n")
+    get_history_store().append(exchange_rates_json)
@@ -0,0 +1,321 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from .config import ParserConfig
+
+config = ParserConfig()
+
+BASE_RATES = {
+    "USD": 1.0,
+    "EUR": 0.92,
+    "RUB": 92.0,
+    "CZK": 23.0,
+    "bitcoin": 60000.0,
+    "ethereum": 3000.0,
+    "monero": 150.0,
+}
+
+
+class LatencyModel:
+    """
+    Random latency of stub responses
+    Spec is one of: fixed:<ms>, uniform:<min_ms>:<max_ms>, exp:<mean_ms>, lognormal:<median_ms>:<sigma>
+    :param spec: latency spec
+    :param rng: random generator
+    """
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self.rng = rng
+        kind, *params = spec.split(":")
+        try:
+            values = [float(param) for param in params]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec {spec}")
+        expected = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec}")
+        self.kind = kind
+        self.values = values
+
+    def sample(self) -> float:
+        """
+        Get one latency
+        :return: latency in seconds
+        """
+        if self.kind == "fixed":
+            ms = self.values[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(*self.values)
+        elif self.kind == "exp":
+            ms = self.rng.expovariate(1 / self.values[0]) if self.values[0] > 0 else 0.0
+        else:
+            median, sigma = self.values
+            ms = median * self.rng.lognormvariate(0, sigma)
+        return max(ms, 0.0) / 1000
+
+
+class StubServer:
+    """
+    Local stand-in for CoinGecko /simple/price and ExchangeRate-API /latest/{base}
+    with latency, error rate, rate limit and payload size injection
+    :param host: host to bind
+    :param port: port to bind, 0 for any free port
+    :param latency: latency spec, see LatencyModel
+    :param error_rate: part of requests answered with HTTP 500
+    :param rate_limit: max requests per second before HTTP 429, 0 disables limit
+    :param payload: number of extra currencies in every response
+    :param seed: random seed
+    :param update_interval: rates change once per interval in seconds and responses carry ETag and Last-Modified,
+        0 gives new rates on every request without validators
+    """
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        payload: int = 0,
+        seed: int = 0,
+        update_interval: float = 0.0,
+    ):
+        self.seed = seed
+        self.update_interval = update_interval
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.latency = LatencyModel(latency, self._rng)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.payload = payload
+        self._tokens = rate_limit
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "not_modified": 0, "errors": 0, "rate_limited": 0, "not_found": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def coingecko_api_url(self) -> str:
+        return f"{self.url}/api/v3/simple/"
+
+    @property
+    def exchangerates_api_url(self) -> str:
+        return f"{self.url}/v6"
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _take_token(self) -> Optional[float]:
+        """
+        Take token from rate limit bucket
+        :return: None if request is allowed, seconds until next token otherwise
+        """
+        if self.rate_limit <= 0:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate_limit
+
+    def _decide(self) -> tuple[float, bool]:
+        with self._rng_lock:
+            return self.latency.sample(), self._rng.random() < self.error_rate
+
+    def _published_at(self) -> Optional[float]:
+        """
+        Get time of last rates update when rates change once per update_interval
+        :return: unix time, None if rates change on every request
+        """
+        if self.update_interval <= 0:
+            return None
+        return time.time() // self.update_interval * self.update_interval
+
+    def _rate(self, code: str, published_at: Optional[float]) -> float:
+        if published_at is not None:
+            rng = random.Random(f"{self.seed}:{published_at}:{code}")
+            return BASE_RATES.get(code, 1.0) * rng.uniform(0.99, 1.01)
+        with self._rng_lock:
+            return BASE_RATES.get(code, 1.0) * self._rng.uniform(0.99, 1.01)
+
+    def _extra_codes(self) -> list[str]:
+        return [f"X{i:05d}" for i in range(self.payload)]
+
+    def coingecko_body(self, query: dict, published_at: Optional[float] = None) -> dict:
+        ids = query.get("ids", [""])[0].split(",")
+        vs_currency = query.get("vs_currencies", ["usd"])[0].lower()
+        return {
+            coin_id: {vs_currency: self._rate(coin_id, published_at)}
+            for coin_id in ids + self._extra_codes()
+            if coin_id
+        }
+
+    def exchangerates_body(self, base: str, published_at: Optional[float] = None) -> dict:
+        codes = list(config.FIAT_CURRENCIES) + self._extra_codes()
+        body = {
+            "result": "success",
+            "base_code": base,
+            "conversion_rates": {code: (1.0 if code == base else self._rate(code, published_at)) for code in codes},
+        }
+        if published_at is not None:
+            body["time_last_update_unix"] = int(published_at)
+            body["time_next_update_unix"] = int(published_at + self.update_interval)
+        return body
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def _send(self, status: int, body: Optional[dict], headers: Optional[dict] = None):
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == "/__stats":
+                    with stub._lock:
+                        self._send(200, dict(stub.stats))
+                    return
+
+                stub._count("requests")
+                retry_after = stub._take_token()
+                if retry_after is not None:
+                    stub._count("rate_limited")
+                    self._send(429, {"error": "rate limited"}, {"Retry-After": str(max(1, round(retry_after)))})
+                    return
+
+                delay, fail = stub._decide()
+                time.sleep(delay)
+                if fail:
+                    stub._count("errors")
+                    self._send(500, {"error": "injected failure"})
+                    return
+
+                published_at = stub._published_at()
+                latest = re.search(r"/latest/([A-Za-z]+)$", parsed.path)
+                if parsed.path.rstrip("/").endswith("/price"):
+                    body = stub.coingecko_body(parse_qs(parsed.query), published_at)
+                elif latest:
+                    body = stub.exchangerates_body(latest.group(1).upper(), published_at)
+                else:
+                    stub._count("not_found")
+                    self._send(404, {"error": "not found"})
+                    return
+                if published_at is None:
+                    stub._count("ok")
+                    self._send(200, body)
+                    return
+
+                validators = {
+                    "ETag": '"' + md5(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest() + '"',
+                    "Last-Modified": formatdate(published_at, usegmt=True),
+                }
+                if self._not_modified(validators, published_at):
+                    stub._count("not_modified")
+                    self._send(304, None, validators)
+                    return
+                stub._count("ok")
+                self._send(200, body, validators)
+
+            def _not_modified(self, validators: dict, published_at: float) -> bool:
+                etag = self.headers.get("If-None-Match")
+                if etag is not None:
+                    return validators["ETag"] in (tag.strip() for tag in etag.split(","))
+                since = self.headers.get("If-Modified-Since")
+                if since is not None:
+                    try:
+                        return parsedate_to_datetime(since).timestamp() >= published_at
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        """
+        Serve in daemon thread
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+
+def main():
+    """
+    Run stub API server
+    Usage: python -m valutrade_hub.parser_service.stub_server --port 8099 --latency lognormal:50:0.5
+    """
+    parser = argparse.ArgumentParser(description="Local stub of CoinGecko and ExchangeRate-API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument(
+        "--latency", default="fixed:0", help="fixed:MS | uniform:MIN:MAX | exp:MEAN | lognormal:MEDIAN:SIGMA"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests per second before HTTP 429")
+    parser.add_argument("--payload", type=int, default=0, help="extra currencies in every response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--update-interval", type=float, default=0.0,
+        help="seconds between rates updates, enables ETag/Last-Modified and 304 responses",
+    )
+    args = parser.parse_args()
+
+    stub = StubServer(
+        args.host, args.port, args.latency, args.error_rate, args.rate_limit, args.payload, args.seed,
+        args.update_interval,
+    )
+    print("Stub server is running, set in data/config.json:")
+    print(f'  "coingecko_api_url": "{stub.coingecko_api_url}",')
+    print(f'  "exchangerates_api_url": "{stub.exchangerates_api_url}"')
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stub server stopped: {stub.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from time import time
+from time import monotonic, perf_counter, time
 from typing import Optional
 
+from ..core.currencies import get_snapshot
 from ..core.exceptions import ApiRequestError
-from .api_clients import CoinGeckoClient, ExchangeratesApiClient
+from .api_clients import BaseApiClient, CoinGeckoClient, ExchangeratesApiClient, deadline
 from .config import ParserConfig
+from .policy import ResilientClient
 from .storage import save_rates
 
 config = ParserConfig()
@@ -13,60 +17,125 @@ config = ParserConfig()
 class RatesUpdater:
     """
     Class for updating rates
+    Every provider is called through ResilientClient (retries, circuit breaker), one update call
+    takes at most update_budget_seconds
     """
     def __init__(self):
         self.coingecko_client = CoinGeckoClient()
         self.exchangerates_client = ExchangeratesApiClient(config.exchangerates_api_key)
+        self.sources = {
+            "coin_gecko": ("CoinGecko", ResilientClient("coin_gecko", self.coingecko_client)),
+            "exchange_rates": ("ExchangeratesAPI", ResilientClient("exchange_rates", self.exchangerates_client)),
+        }
 
-    def run_update(self, source: Optional[str] = None):
+    def stale_codes(self, source: str) -> list[str]:
         """
-        Update rates in cache
+        Get currencies of source whose pairs are missing in cache or older than ttl of source
+        :param source: source name
+        :return: list of currency codes
+        """
+        client = self.sources[source][1]
+        try:
+            pairs = get_snapshot().pairs
+        except ValueError:
+            return list(client.currencies)
+        expires_before = time() - config.source_ttl(source)
+        stale = []
+        for code in client.currencies:
+            pair = pairs.get(f"{code}_{config.BASE_CURRENCY}")
+            if pair is None or (
+                datetime.strptime(pair["updated_at"], "%Y-%m-%d %H:%M:%S").timestamp() <= expires_before
+            ):
+                stale.append(code)
+        return stale
+
+    @staticmethod
+    def _fetch(client: BaseApiClient, codes: Optional[list[str]], expires: float) -> tuple[dict, float]:
+        """
+        Fetch rates from one provider and measure request time
+        Unexpected errors of client are raised as ApiRequestError, so they fail only this provider
+        :param client: api client
+        :param codes: codes of currencies to fetch, all if None
+        :param expires: deadline of update, monotonic time
+        :return: rates and request time in seconds
+        """
+        before = perf_counter()
+        token = deadline.set(expires)
+        try:
+            return client.fetch_rates(codes), perf_counter() - before
+        except ApiRequestError as e:
+            e.request_s = perf_counter() - before
+            raise
+        except Exception as e:
+            error = ApiRequestError(f"{type(e).__name__}: {e}")
+            error.request_s = perf_counter() - before
+            raise error from e
+        finally:
+            deadline.reset(token)
+
+    def run_update(self, source: Optional[str] = None, verbose: bool = True, force: bool = False):
+        """
+        Update rates in cache, providers are requested concurrently
+        Without source only stale pairs are refreshed: fresh sources are skipped and only stale currencies
+        are requested where provider allows it. Given source is always refreshed completely
         :param source: source of rates
+        :param verbose: print progress
+        :param force: refresh all sources regardless of age of their pairs
         :return: None
         """
-        before = time()
+        log = print if verbose else lambda *args: None
+        if source is not None or force:
+            wanted = {name: None for name in self.sources if source is None or source == name}
+        else:
+            wanted = {}
+            for name, (title, _) in self.sources.items():
+                stale = self.stale_codes(name)
+                if stale:
+                    wanted[name] = stale
+                else:
+                    log(f"[INFO] Rates from {title} are fresh, skipping")
+            if not wanted:
+                return
         errors = []
-        if source == "coin_gecko" or source is None:
-            print("[INFO] Fetching rates from CoinGecko...")
-            try:
-                rates_cg = self.coingecko_client.fetch_rates()
-                print("[INFO] Rates fetched from CoinGecko")
-            except ApiRequestError as e:
-                errors.append(e)
-                rates_cg = {}
-                print("[ERROR] Failed to fetch from CoinGecko: Network error")
+        rates = {}
+        timings = {}
+        budget = config.update_budget_seconds
+        expires = monotonic() + budget
 
-            for rate in rates_cg:
-                rates_cg[rate] = {
-                    "rate": rates_cg[rate],
-                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "source": "coin_gecko",
-                }
-        else:
-            rates_cg = {}
+        executor = ThreadPoolExecutor(max_workers=max(len(wanted), 1))
+        try:
+            futures = {}
+            for name, codes in wanted.items():
+                title, client = self.sources[name]
+                log(f"[INFO] Fetching rates from {title}...")
+                futures[name] = executor.submit(self._fetch, client, codes, expires)
 
-        if source == "exchange_rates" or source is None:
-            print("[INFO] Fetching rates from ExchangeratesAPI...")
-            try:
-                rates_ex = self.exchangerates_client.fetch_rates()
-                print("[INFO] Rates fetched from ExchangeratesAPI")
-            except ApiRequestError as e:
-                errors.append(e)
-                rates_ex = {}
-                print("[ERROR] Failed to fetch from ExchangeratesAPI: Network error")
+            for name, future in futures.items():
+                title = self.sources[name][0]
+                try:
+                    rates_source, timings[name] = future.result(timeout=max(0.0, expires - monotonic()) + 1)
+                    log(f"[INFO] Rates fetched from {title} in {timings[name] * 1000:.0f} ms")
+                except FutureTimeoutError:
+                    errors.append(ApiRequestError(f"{title}: latency budget {budget}s exceeded"))
+                    timings[name] = budget
+                    rates_source = {}
+                    log(f"[ERROR] Failed to fetch from {title}: latency budget {budget}s exceeded")
+                except ApiRequestError as e:
+                    errors.append(e)
+                    timings[name] = getattr(e, "request_s", 0.0)
+                    rates_source = {}
+                    log(f"[ERROR] Failed to fetch from {title}: {e}")
 
-            for rate in rates_ex:
-                rates_ex[rate] = {
-                    "rate": rates_ex[rate],
-                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "source": "exchange_rates",
-                }
-        else:
-            rates_ex = {}
-        now = time()
+                for rate in rates_source:
+                    rates[rate] = {
+                        "rate": rates_source[rate],
+                        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "source": name,
+                    }
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        rates = {**rates_cg, **rates_ex}
-        print(f"[INFO] Writing {len(rates)} rates to data/rates.json...")
-        save_rates(rates, now - before)
+        log(f"[INFO] Writing {len(rates)} rates to data/rates.json...")
+        save_rates(rates, timings)
         for error in errors:
             raise error